@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试公共配置
+tools/下的模块按脚本方式互相导入，这里把tools目录加入sys.path；
+crypto_monitor导入时会在当前目录创建日志文件，测试在临时目录中运行，避免弄脏仓库
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools')
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
+
+os.chdir(tempfile.mkdtemp(prefix='crypto_monitor_tests_'))
+
+import crypto_monitor  # noqa: E402
+from fake_exchange import start_server  # noqa: E402
+from history_store import RECORD_FIELDS  # noqa: E402
+
+# 模拟交易所的交易对数量
+FAKE_SYMBOL_COUNT = 30
+
+
+@pytest.fixture
+def exchange(monkeypatch):
+    """启动本地模拟交易所，并把crypto_monitor的请求指向它"""
+    server, base_url = start_server(port=0, symbol_count=FAKE_SYMBOL_COUNT, seed=7)
+    monkeypatch.setattr(crypto_monitor, 'BINANCE_API_BASE', base_url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_record():
+    """按RECORD_FIELDS构造一条完整的历史记录，fields覆盖默认值"""
+    def factory(symbol, timestamp_ms, **fields):
+        unknown = set(fields) - set(RECORD_FIELDS)
+        if unknown:
+            raise KeyError(f"不是历史记录的列: {sorted(unknown)}")
+        record = {
+            'symbol': symbol,
+            'mark_price': 1.0,
+            'index_price': 1.0,
+            'basis': 0.0,
+            'basis_percent': 0.0,
+            'last_funding_rate': 0.0001,
+            'timestamp': datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp_ms': timestamp_ms,
+            'oi': 1000.0,
+            'long_short_ratio': 1.0,
+            'long_account': 0.5,
+            'short_account': 0.5,
+        }
+        record.update(fields)
+        return {field: record[field] for field in RECORD_FIELDS}
+    return factory
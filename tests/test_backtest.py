@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import logging
+import os
+
+import pytest
+
+from backtest import raw_csv_paths
+from history_compactor import ARCHIVE_DIR, archive_path
+from history_store import create_history_store
+
+
+def test_raw_csv_paths_lists_csv_files(tmp_path):
+    for name in ('AUSDT.csv', 'BUSDT.csv'):
+        (tmp_path / name).write_text('')
+    assert [os.path.basename(path) for path in raw_csv_paths(str(tmp_path))] == ['AUSDT.csv', 'BUSDT.csv']
+    assert [os.path.basename(path) for path in raw_csv_paths(str(tmp_path), ['BUSDT'])] == ['BUSDT.csv']
+
+
+@pytest.mark.parametrize('storage', ['parquet', 'sqlite'])
+def test_raw_csv_paths_refuses_other_stores(tmp_path, storage, make_record):
+    data_dir = str(tmp_path / 'data')
+    store = create_history_store(data_dir, storage)
+    store.append(make_record('AUSDT', 1767225600000))
+    store.flush(wait=True)
+    store.close()
+    with pytest.raises(ValueError):
+        raw_csv_paths(data_dir)
+    if storage == 'sqlite':
+        with pytest.raises(ValueError):
+            raw_csv_paths(os.path.join(data_dir, 'history.db'))
+
+
+def test_raw_csv_paths_warns_about_compacted_history(tmp_path, caplog):
+    (tmp_path / 'AUSDT.csv').write_text('')
+    archive_dir = str(tmp_path / ARCHIVE_DIR)
+    os.makedirs(archive_dir)
+    with gzip.open(archive_path(archive_dir, 'AUSDT'), 'wt') as f:
+        f.write('')
+    with caplog.at_level(logging.WARNING, logger='backtest'):
+        paths = raw_csv_paths(str(tmp_path))
+    assert len(paths) == 1
+    assert '压缩' in caplog.text
+
+
+def test_replay_symbol_drops_duplicate_timestamps(tmp_path, make_record):
+    from backtest import replay_symbol, parse_horizons, _init_worker
+    from history_store import CsvHistoryStore
+
+    _init_worker(None)
+    interval_ms = 5 * 60 * 1000
+    start = 1767225600000
+    store = CsvHistoryStore(str(tmp_path))
+    records = [make_record('AUSDT', start + i * interval_ms, last_funding_rate=0.002,
+                           oi=1000.0 if i < 12 else 5000.0, mark_price=1.0 + 0.01 * i)
+               for i in range(30)]
+    for record in records:
+        store.append(record)
+    # 回填与实时采集重叠：同一时间戳再写一遍
+    for record in records[10:20]:
+        store.append(record)
+    store.flush(wait=True)
+    store.close()
+
+    alerts, summary = replay_symbol(str(tmp_path / 'AUSDT.csv'), parse_horizons('1h'), 0, {})
+
+    assert summary['rows'] == 30
+    assert summary['duplicates'] == 10
+    assert len(alerts) > 0
+    assert alerts['timestamp_ms'].is_unique
+    prices = {record['timestamp_ms']: record['mark_price'] for record in records}
+    for _, alert in alerts.iterrows():
+        expected = prices[alert['timestamp_ms'] + 3600 * 1000] / prices[alert['timestamp_ms']] - 1
+        assert alert['ret_1h'] == pytest.approx(expected)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from crypto_monitor import CryptoMonitor
+from conftest import FAKE_SYMBOL_COUNT
+
+
+def test_collect_data_concurrent_covers_universe(exchange, tmp_path):
+    monitor = CryptoMonitor(data_dir=str(tmp_path / 'data'), state_dir=str(tmp_path / 'state'))
+    data = monitor.collect_data_concurrent(max_concurrency=8)
+
+    assert len(data) == FAKE_SYMBOL_COUNT
+    assert {record['symbol'] for record in data} == {f"FAKE{i}USDT" for i in range(FAKE_SYMBOL_COUNT)}
+    assert all(record['oi'] is not None and record['oi'] > 0 for record in data)
+    monitor.store.flush(wait=True)
+    # 每个交易对只保存一条记录
+    assert all(len(monitor.store.read_recent(f"FAKE{i}USDT", 10)) == 1 for i in range(FAKE_SYMBOL_COUNT))
+    monitor.store.close()
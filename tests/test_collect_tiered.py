@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from crypto_monitor import CryptoMonitor
+
+WATCHED = 'FAKE3USDT'
+HOT = 'FAKE0USDT'
+PREFILTER_THRESHOLD = 0.003
+
+
+@pytest.fixture
+def monitor(exchange, tmp_path):
+    # 只有HOT的资金费率超过预筛选阈值，其余随机游走远小于阈值
+    for symbol, state in exchange.market.state.items():
+        state['funding_rate'] = 0.05 if symbol == HOT else 0.0
+    monitor = CryptoMonitor(data_dir=str(tmp_path / 'data'), state_dir=str(tmp_path / 'state'),
+                            watchlist=[WATCHED])
+    yield monitor
+    monitor.store.close()
+
+
+def test_collect_data_tiered_respects_prefilter_and_watchlist(monitor):
+    monitor.collect_data_concurrent(max_concurrency=8)
+
+    ls_requested = []
+    get_long_short_ratio = monitor.get_long_short_ratio
+
+    def record_long_short(symbol):
+        ls_requested.append(symbol)
+        return get_long_short_ratio(symbol)
+
+    monitor.get_long_short_ratio = record_long_short
+    # 所有交易对刚采样过，只有候选交易对和到期的后台交易对会被获取
+    monitor.last_oi_sample_time['FAKE5USDT'] = 0
+    data = monitor.collect_data_tiered(prefilter_threshold=PREFILTER_THRESHOLD, max_concurrency=8)
+
+    assert {record['symbol'] for record in data} == {HOT, WATCHED, 'FAKE5USDT'}
+    # 后台采样只获取持仓量，多空比只为候选交易对获取
+    assert sorted(ls_requested) == sorted([HOT, WATCHED])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import csv
+
+import pandas as pd
+
+from csv_tail import FUNDING_FIELDS, read_header
+from history_store import CsvHistoryStore, RECORD_FIELDS
+
+
+def test_csv_append_upgrades_old_header(tmp_path, make_record):
+    path = tmp_path / 'AUSDT.csv'
+    # 旧版本没有多空比列
+    old_fields = FUNDING_FIELDS + ['oi']
+    old_rows = [make_record('AUSDT', 1767225600000 + i * 300000, oi=1000.0 + i) for i in range(2)]
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=old_fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(old_rows)
+        # 无法识别的行原样保留
+        f.write('garbage\r\n')
+
+    store = CsvHistoryStore(str(tmp_path))
+    store.append(make_record('AUSDT', 1767226200000, oi=2000.0, long_short_ratio=1.8))
+    store.flush(wait=True)
+    store.append(make_record('AUSDT', 1767226500000, oi=2100.0, long_short_ratio=1.9))
+    store.close()
+
+    assert read_header(str(path)) == RECORD_FIELDS
+    df = store.read_recent('AUSDT', 10)
+    assert df['oi'].tolist() == [1000.0, 1001.0, 2000.0, 2100.0]
+    assert df['long_short_ratio'].isna().tolist() == [True, True, False, False]
+    assert df['long_short_ratio'].iloc[-1] == 1.9
+    assert 'garbage' in path.read_text()
+
+    # 外部工具按表头读取时各列对齐
+    frame = pd.read_csv(path)
+    frame = frame[frame['symbol'] == 'AUSDT']
+    assert frame['last_funding_rate'].tolist() == [0.0001] * 4
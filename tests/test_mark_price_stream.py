@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import socket
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from crypto_monitor import CryptoMonitor, DEFAULT_LS_DATA
+from mark_price_stream import MarkPriceStream, serve_replay
+
+SYMBOL = 'SQZUSDT'
+
+
+def write_history(collector, start, values):
+    """模拟REST采集进程写入持仓量记录"""
+    for i, oi in enumerate(values):
+        record = collector._build_funding_record(SYMBOL, {
+            'markPrice': '1.0', 'indexPrice': '1.0', 'lastFundingRate': '0.002',
+        }, start + timedelta(minutes=5 * i))
+        record['oi'] = oi
+        record.update(DEFAULT_LS_DATA)
+        collector.store.append(record)
+    collector.store.flush(wait=True)
+
+
+def push_frame(stream, funding_rate='0.002'):
+    stream.handle_message(json.dumps([{
+        'e': 'markPriceUpdate', 'E': int(time.time() * 1000), 's': SYMBOL,
+        'p': '1.0', 'i': '1.0', 'r': funding_rate,
+    }]))
+
+
+def test_detect_sees_oi_written_after_startup(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    collector = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'collector'))
+    monitor = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'stream'))
+    alerts = []
+    monitor.send_alert = alerts.append
+    stream = MarkPriceStream(monitor)
+
+    start = datetime.now() - timedelta(hours=2)
+    write_history(collector, start, [1000.0] * 10)
+    push_frame(stream)
+    assert stream.detect() == []
+
+    # 启动后REST采集进程写入持仓量激增的记录
+    write_history(collector, start + timedelta(minutes=50), [5000.0] * 3)
+    push_frame(stream)
+    anomalies = stream.detect()
+
+    assert [item['symbol'] for item in anomalies] == [SYMBOL]
+    assert anomalies[0]['oi_ratio'] > 2.0
+    assert [item['symbol'] for item in alerts] == [SYMBOL]
+    collector.store.close()
+    monitor.store.close()
+
+
+@pytest.mark.parametrize('storage', ['csv', 'parquet', 'sqlite'])
+def test_detect_reads_only_new_rows(tmp_path, monkeypatch, storage):
+    data_dir = str(tmp_path / 'data')
+    collector = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'collector'), storage=storage)
+    monitor = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'stream'), storage=storage)
+    monitor.send_alert = lambda message: None
+    stream = MarkPriceStream(monitor)
+
+    start = datetime.now() - timedelta(hours=2)
+    write_history(collector, start, [1000.0] * 10)
+    push_frame(stream)
+    stream.detect()
+
+    reads = []
+    for name in ('read_recent', 'read_since'):
+        original = getattr(monitor.store, name)
+        monkeypatch.setattr(monitor.store, name,
+                            lambda *args, _name=name, _original=original: reads.append((_name, args)) or _original(*args))
+
+    # 没有新数据时不读取历史
+    for _ in range(3):
+        push_frame(stream)
+        stream.detect()
+    assert reads == []
+
+    # 有新数据时只读取窗口最新时间戳之后的记录，追加到窗口而不是重新加载
+    write_history(collector, start + timedelta(minutes=50), [5000.0] * 2)
+    push_frame(stream)
+    stream.detect()
+    assert [name for name, _ in reads] == ['read_since']
+    row = monitor.oi_window.rows[SYMBOL]
+    assert list(monitor.oi_window.values[row][-3:]) == [1000.0, 5000.0, 5000.0]
+    assert monitor.oi_window.counts[row] == 10
+    collector.store.close()
+    monitor.store.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_replay_reconnects_and_detects(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    collector = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'collector'))
+    monitor = CryptoMonitor(data_dir=data_dir, state_dir=str(tmp_path / 'stream'))
+    alerts = []
+    monitor.send_alert = alerts.append
+    start = datetime.now() - timedelta(hours=2)
+    write_history(collector, start, [1000.0] * 10 + [5000.0] * 3)
+
+    frames_path = tmp_path / 'frames.jsonl'
+    now = int(time.time() * 1000)
+    with open(frames_path, 'w') as f:
+        for i in range(5):
+            f.write(json.dumps([
+                {'e': 'markPriceUpdate', 'E': now + i, 's': SYMBOL, 'p': '1.0', 'i': '1.0', 'r': '0.002'},
+                {'e': 'markPriceUpdate', 'E': now + i, 's': 'CALMUSDT', 'p': '2.0', 'i': '2.0', 'r': '0.0001'},
+            ]) + '\n')
+
+    port = free_port()
+    stream = MarkPriceStream(monitor, url=f"ws://127.0.0.1:{port}", detect_interval=0.2)
+    seen = {}
+
+    async def scenario():
+        # 回放服务推送完所有帧后关闭连接，模拟断线
+        server = asyncio.ensure_future(serve_replay(str(frames_path), port=port, interval=0.02))
+        await asyncio.sleep(0.3)
+        client = asyncio.ensure_future(stream.run())
+        deadline = time.time() + 15
+        while stream.frames_received < 5 and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        seen['before'] = (stream.frames_received, stream.updated_at)
+        # 断线后重连、重新订阅，继续收到推送
+        while stream.frames_received < 10 and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        stream.stop()
+        await asyncio.wait_for(client, 5)
+        server.cancel()
+
+    asyncio.run(scenario())
+
+    assert seen['before'][0] == 5
+    assert stream.reconnects >= 1
+    assert stream.frames_received == 10
+    assert stream.updated_at > seen['before'][1]
+    snapshot = {record['symbol']: record for record in stream.snapshot()}
+    assert set(snapshot) == {SYMBOL, 'CALMUSDT'}
+    assert snapshot[SYMBOL]['last_funding_rate'] == 0.002
+    assert snapshot['CALMUSDT']['mark_price'] == 2.0
+    # 检测循环已对推送数据运行过检测（重连前后各一次），只有持仓量激增的交易对触发警报
+    assert alerts and {item['symbol'] for item in alerts} == {SYMBOL}
+    assert [item['symbol'] for item in stream.detect()] == [SYMBOL]
+    collector.store.close()
+    monitor.store.close()
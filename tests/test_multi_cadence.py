@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from multi_cadence import MarketState
+
+
+def test_merged_records_use_oi_sample_time_when_funding_is_stale():
+    state = MarketState()
+    funding_time = time.time() - 600
+    state.funding['AUSDT'] = {'symbol': 'AUSDT', 'last_funding_rate': 0.001, 'mark_price': 1.0,
+                              'timestamp': 'stale', 'timestamp_ms': int(funding_time * 1000)}
+
+    # 资金费率快照不再更新，持仓量仍在按轮采样
+    stamps = []
+    since = 0.0
+    for sample_time in (funding_time + 60, funding_time + 360):
+        state.oi['AUSDT'] = (1000.0, sample_time)
+        records = state.merged_records(['AUSDT'], since=since)
+        since = sample_time
+        assert len(records) == 1
+        stamps.append(records[0]['timestamp_ms'])
+
+    assert stamps == [int((funding_time + 60) * 1000), int((funding_time + 360) * 1000)]
+    # 资金费率快照本身没有被改写
+    assert state.funding['AUSDT']['timestamp'] == 'stale'
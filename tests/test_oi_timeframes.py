@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+import pytest
+
+from history_store import create_history_store
+from oi_timeframes import TimeframeOIWindow, timeframe_series, timeframe_columns, DEFAULT_TIMEFRAMES
+
+SYMBOL = 'WARMUSDT'
+# 覆盖约26小时，超过最长的24小时周期，也超过Parquet tail的100条
+HISTORY_MS = 26 * 3600 * 1000
+
+
+def make_records(make_record, interval_ms):
+    rows = HISTORY_MS // interval_ms
+    end = int(time.time() * 1000) // interval_ms * interval_ms
+    # 最后10%的时间里持仓量逐步上升
+    ramp = rows * 9 // 10
+    return [make_record(SYMBOL, end - (rows - 1 - i) * interval_ms, oi=1000.0 + max(0, i - ramp) * 10.0)
+            for i in range(rows)]
+
+
+@pytest.mark.parametrize('storage', ['csv', 'parquet', 'sqlite'])
+# 5分钟一轮，以及多频率模式下候选交易对每分钟采样一次
+@pytest.mark.parametrize('interval_ms', [300 * 1000, 60 * 1000])
+def test_warm_up_after_restart_covers_longest_timeframe(tmp_path, storage, interval_ms, make_record):
+    data_dir = str(tmp_path / 'data')
+    records = make_records(make_record, interval_ms)
+    store = create_history_store(data_dir, storage)
+    # 分多轮写入
+    for start in range(0, len(records), 200):
+        for record in records[start:start + 200]:
+            store.append(record)
+        store.flush(wait=True)
+    store.close()
+
+    # 重启后只能从存储预热
+    reopened = create_history_store(data_dir, storage)
+    window = TimeframeOIWindow(reopened)
+    result = window.evaluate([SYMBOL])
+
+    expected = timeframe_series([item['timestamp_ms'] for item in records], [item['oi'] for item in records])
+    for short, long in DEFAULT_TIMEFRAMES:
+        ratio_column, history_column = timeframe_columns(short, long)
+        assert result[history_column][0], f"{short}/{long}未预热"
+        assert np.isclose(result[ratio_column][0], expected[ratio_column][-1])
+    assert result['oi_ratio_4h_24h'][0] > 1.0
+    # 资金费率按存储的列名读回
+    assert reopened.read_recent(SYMBOL, 1)['last_funding_rate'].iloc[-1] == pytest.approx(0.0001)
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from history_store import create_history_store
+from param_sweep import load_history
+
+
+def test_load_history_refuses_parquet_store(tmp_path, make_record):
+    data_dir = str(tmp_path / 'data')
+    store = create_history_store(data_dir, 'parquet')
+    store.append(make_record('AUSDT', 1767225600000))
+    store.flush()
+    with pytest.raises(ValueError):
+        load_history(data_dir, workers=1)
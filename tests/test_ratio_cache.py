@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from ratio_cache import PeriodCache, PERIOD_MS
+
+FIVE_MINUTES = PERIOD_MS['5m']
+# 12:05:00（UTC），一个5分钟周期的边界
+BOUNDARY = 1700000000000 // FIVE_MINUTES * FIVE_MINUTES + FIVE_MINUTES
+
+
+def row(timestamp):
+    return {'symbol': 'BTCUSDT', 'longShortRatio': '1.5', 'timestamp': timestamp}
+
+
+def test_row_from_current_bucket_is_cached():
+    cache = PeriodCache()
+    now = BOUNDARY + 60 * 1000
+    assert cache.put('topLongShortAccountRatio', 'BTCUSDT', '5m', row(BOUNDARY), now_ms=now)
+    assert cache.get('topLongShortAccountRatio', 'BTCUSDT', '5m', now_ms=now + 1000) == row(BOUNDARY)
+    # 下一个周期开始后失效
+    assert cache.get('topLongShortAccountRatio', 'BTCUSDT', '5m', now_ms=BOUNDARY + FIVE_MINUTES) is None
+
+
+def test_row_straddling_boundary_is_not_cached():
+    cache = PeriodCache()
+    # 请求在边界前发出，响应在边界后到达，数据仍是上一周期的
+    stale = row(BOUNDARY - FIVE_MINUTES)
+    assert not cache.put('topLongShortAccountRatio', 'BTCUSDT', '5m', stale, now_ms=BOUNDARY + 50)
+    assert cache.get('topLongShortAccountRatio', 'BTCUSDT', '5m', now_ms=BOUNDARY + 100) is None
+
+    # 交易所生成新周期的数据后正常缓存
+    assert cache.put('topLongShortAccountRatio', 'BTCUSDT', '5m', row(BOUNDARY), now_ms=BOUNDARY + 2000)
+    assert cache.get('topLongShortAccountRatio', 'BTCUSDT', '5m', now_ms=BOUNDARY + 3000) == row(BOUNDARY)
+
+
+def test_rows_without_timestamp_are_not_cached():
+    cache = PeriodCache()
+    assert not cache.put('topLongShortAccountRatio', 'BTCUSDT', '5m', {}, now_ms=BOUNDARY)
+    assert cache.get('topLongShortAccountRatio', 'BTCUSDT', '5m', now_ms=BOUNDARY) is None
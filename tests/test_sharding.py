@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import time
+
+from crypto_monitor import CryptoMonitor
+from history_store import SqliteHistoryStore
+from sharding import HashRing, ShardAggregator, shard_names, run_local
+
+KEYS = [f"SYM{i}USDT" for i in range(2000)]
+
+
+def test_hash_ring_assigns_each_key_to_one_shard():
+    ring = HashRing(shard_names(4))
+    parts = ring.partition(KEYS)
+    assigned = [key for keys in parts.values() for key in keys]
+    assert sorted(assigned) == sorted(KEYS)
+    # 虚拟节点让各分片分到的键大致均衡
+    assert min(len(keys) for keys in parts.values()) > len(KEYS) / 4 * 0.5
+
+
+def test_hash_ring_moves_about_one_nth_of_keys():
+    before = HashRing(shard_names(4))
+    after = HashRing(shard_names(5))
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+    # 增加第5个分片：只有约1/5的键移动，而且都移到新分片
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+    assert {after.owner(key) for key in moved} == {'shard-4'}
+
+    # 去掉一个分片：只有该分片原来的键移动
+    removed = HashRing(['shard-0', 'shard-1', 'shard-3'])
+    moved = [key for key in KEYS if before.owner(key) != removed.owner(key)]
+    assert moved and all(before.owner(key) == 'shard-2' for key in moved)
+
+
+def test_aggregator_does_not_double_count(tmp_path, make_record):
+    db_path = str(tmp_path / 'history.db')
+    writer = SqliteHistoryStore(db_path)
+    now = int(time.time() * 1000)
+    # 聚合进程启动前已有的记录
+    for i in range(5):
+        writer.append(make_record('AUSDT', now - (20 - i) * 60000))
+    writer.flush()
+
+    monitor = CryptoMonitor(data_dir=db_path, storage='sqlite', state_dir=str(tmp_path / 'state'))
+    monitor.send_alert = lambda anomaly: None
+    aggregator = ShardAggregator(monitor)
+
+    # 启动后写入：已有交易对的新记录和新交易对的记录
+    for i in range(5, 8):
+        writer.append(make_record('AUSDT', now - (20 - i) * 60000))
+        writer.append(make_record('BUSDT', now - (20 - i) * 60000))
+    writer.flush()
+    aggregator.poll()
+    # 没有新记录时再次读取不重复计入
+    aggregator.poll()
+    writer.append(make_record('BUSDT', now - 10 * 60000))
+    writer.flush()
+    aggregator.poll()
+
+    window = monitor.oi_window
+    assert window.counts[window.rows['AUSDT']] == 8
+    assert window.counts[window.rows['BUSDT']] == 4
+    assert aggregator.cursor == writer.max_rowid()
+    writer.close()
+    monitor.store.close()
+
+
+def test_run_local_covers_universe_once(tmp_path, monkeypatch):
+    # run_local会设置该环境变量，monkeypatch保证测试结束后恢复
+    monkeypatch.setenv('BINANCE_API_BASE', '')
+    db_path = str(tmp_path / 'history.db')
+    run_local(2, db_path, fake_exchange=True, symbol_count=40, interval=3, poll_interval=1, duration=8)
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT symbol, timestamp_ms FROM history ORDER BY symbol, timestamp_ms").fetchall()
+    times = {}
+    for symbol, timestamp_ms in rows:
+        times.setdefault(symbol, []).append(timestamp_ms)
+    assert sorted(times) == sorted(f"FAKE{i}USDT" for i in range(40))
+    # 每轮每个交易对只由一个分片采集一次：同一交易对的相邻记录至少相隔约一个采集间隔
+    for values in times.values():
+        assert all(later - earlier > 1500 for earlier, later in zip(values, values[1:]))
+    assert max(len(values) for values in times.values()) - min(len(values) for values in times.values()) <= 1
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from symbol_cache import SymbolUniverseCache, CACHED_FIELDS
+
+
+def exchange_info(*symbols):
+    return {
+        'rateLimits': [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 2400}],
+        'symbols': [{'symbol': symbol, 'quoteAsset': 'USDT', 'contractType': 'PERPETUAL', 'status': 'TRADING',
+                     'onboardDate': 0, 'deliveryDate': 4133404800000} for symbol in symbols],
+    }
+
+
+def test_update_writes_cache(tmp_path):
+    path = str(tmp_path / 'exchange_info_cache.json')
+    cache = SymbolUniverseCache(path)
+    assert cache.update(exchange_info('BTCUSDT', 'ETHUSDT'))
+    assert set(cache.symbols[0]) == set(CACHED_FIELDS)
+
+    reloaded = SymbolUniverseCache(path)
+    assert reloaded.is_fresh()
+    assert reloaded.usdt_perpetual_symbols() == ['BTCUSDT', 'ETHUSDT']
+
+
+def test_update_keeps_stale_cache_on_bad_payload(tmp_path):
+    path = str(tmp_path / 'exchange_info_cache.json')
+    cache = SymbolUniverseCache(path, ttl=60)
+    cache.update(exchange_info('BTCUSDT'))
+    cache.fetched_at = time.time() - 3600
+
+    for payload in ({'code': -1001, 'msg': 'Service unavailable.'}, {'symbols': []}, {'symbols': None}, []):
+        assert not cache.update(payload)
+        assert cache.usdt_perpetual_symbols() == ['BTCUSDT']
+        assert not cache.is_fresh()
+
+    # 磁盘上的缓存也没有被覆盖
+    assert SymbolUniverseCache(path).usdt_perpetual_symbols() == ['BTCUSDT']
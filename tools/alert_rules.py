@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+警报规则引擎
+触发条件在JSON配置文件（默认tools/alert_rules.json，可用ALERT_RULES_FILE环境变量指定）中声明，
+加载时编译一次：同一字段、同一比较方式的条件合并为一次NumPy广播比较，
+规则是否满足由一次矩阵乘法得出，所有规则在每轮横截面数据上一次性求值。
+"""
+
+import os
+import json
+import logging
+import operator
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json')
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+class RuleSet:
+    """编译后的规则集合
+
+    配置格式:
+        thresholds: {名称: 数值或null}，条件的value可以引用这些名称；为null的阈值使引用它的规则不启用
+        timeframes: [[短周期, 长周期]]，按时间划分的OI比例窗口，如["1h", "4h"]对应oi_ratio_1h_4h和has_history_1h_4h列
+        rules: [{name, description, alert, conditions: [{field, op, value, abs}]}]
+            同一规则的条件之间为“且”，alert为true的规则触发警报
+    """
+
+    def __init__(self, config):
+        self.thresholds = dict(config.get('thresholds', {}))
+        self.rules = list(config.get('rules', []))
+        self.timeframes = [tuple(pair) for pair in config.get('timeframes', [])]
+        self.names = []
+        self.alert_names = []
+        self.descriptions = {}
+        # 按(字段, 是否取绝对值, 比较符)分组的条件：key -> (条件序号列表, value列表)
+        self.groups = {}
+        self._compile()
+
+    def _compile(self):
+        memberships = []
+        condition_count = 0
+        for rule in self.rules:
+            name = rule.get('name')
+            if not name or name in self.names:
+                raise ValueError(f"规则名称为空或重复: {name}")
+            conditions = rule.get('conditions') or []
+            if not conditions:
+                raise ValueError(f"规则{name}没有条件")
+            indices = []
+            for condition in conditions:
+                op = condition.get('op')
+                if op not in OPERATORS:
+                    raise ValueError(f"规则{name}中不支持的比较符: {op}")
+                value = condition.get('value')
+                if isinstance(value, str) and value not in self.thresholds:
+                    raise ValueError(f"规则{name}引用了未定义的阈值: {value}")
+                if not isinstance(value, (str, int, float)):
+                    raise ValueError(f"规则{name}的条件值无效: {value}")
+                if not condition.get('field'):
+                    raise ValueError(f"规则{name}的条件缺少field")
+                key = (condition['field'], bool(condition.get('abs', False)), op)
+                group = self.groups.setdefault(key, ([], []))
+                group[0].append(condition_count)
+                group[1].append(value)
+                indices.append(condition_count)
+                condition_count += 1
+            memberships.append(indices)
+            self.names.append(name)
+            self.descriptions[name] = rule.get('description', '')
+            if rule.get('alert', False):
+                self.alert_names.append(name)
+
+        # 规则×条件的0/1矩阵
+        self.membership = np.zeros((len(self.names), condition_count), dtype=np.int32)
+        for row, indices in enumerate(memberships):
+            self.membership[row, indices] = 1
+        self.condition_count = condition_count
+
+    def threshold(self, name, overrides=None):
+        """返回阈值，overrides中不为None的值优先"""
+        if overrides and overrides.get(name) is not None:
+            return overrides[name]
+        return self.thresholds.get(name)
+
+    def _resolve(self, value, overrides):
+        if isinstance(value, str):
+            value = self.threshold(value, overrides)
+        return np.nan if value is None else float(value)
+
+    def evaluate(self, frame, **overrides):
+        """对横截面DataFrame求值所有规则，返回同索引、每条规则一列的布尔DataFrame
+
+        overrides: 按名称临时覆盖配置中的阈值，值为None时使用配置
+        """
+        satisfied = np.zeros((len(frame), self.condition_count), dtype=bool)
+        for (field, use_abs, op), (indices, values) in self.groups.items():
+            if field not in frame.columns:
+                raise ValueError(f"规则引用了不存在的字段: {field}")
+            column = frame[field].to_numpy(dtype=float)
+            if use_abs:
+                column = np.abs(column)
+            thresholds = np.array([self._resolve(value, overrides) for value in values])
+            with np.errstate(invalid='ignore'):
+                result = OPERATORS[op](column[:, None], thresholds[None, :])
+            # 阈值为null的条件不成立，引用它的规则不启用
+            result &= ~np.isnan(thresholds)[None, :]
+            satisfied[:, indices] = result
+
+        # 规则满足 = 没有不成立的条件
+        failed = (~satisfied).astype(np.int32) @ self.membership.T
+        return pd.DataFrame(failed == 0, index=frame.index, columns=self.names)
+
+
+def load_rules(path=None):
+    """加载并编译规则文件，path为空时使用ALERT_RULES_FILE环境变量或默认文件"""
+    path = path or os.getenv('ALERT_RULES_FILE') or DEFAULT_RULES_FILE
+    with open(path, encoding='utf-8') as f:
+        rules = RuleSet(json.load(f))
+    logger.info(f"从 {path} 加载了 {len(rules.names)} 条规则")
+    return rules
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+横截面异常检测引擎
+把整个交易对集合当作一个矩阵（交易对 × 最近样本），一次向量化计算所有交易对的
+OI比例、资金费率筛选、基差和排名，代替逐个交易对的Python循环
+"""
+
+import numpy as np
+import pandas as pd
+
+from oi_window import oi_ratios
+from online_stats import METRICS
+from alert_rules import load_rules
+
+# 在线统计z-score列，顺序与online_stats.METRICS一致
+ZSCORE_COLUMNS = [f"{metric}_zscore" for metric in METRICS]
+
+
+def build_frame(index, data, values, counts, recent, past, zscores):
+    """由OI窗口矩阵、记录和z-score矩阵生成检测用的DataFrame，每行对应data中的一条记录
+
+    values/counts: 每条记录对应的OI窗口（最新数据在最后一列）和窗口中的数据点数
+    """
+    recent_avg, past_avg, ratio = oi_ratios(values, recent)
+    frame = pd.DataFrame({
+        'oi_current': [item.get('oi', np.nan) for item in data],
+        'oi_recent_avg': recent_avg,
+        'oi_past_avg': past_avg,
+        'oi_ratio': ratio,
+        'has_history': counts >= past,
+        'funding_rate': [item['last_funding_rate'] for item in data],
+        'mark_price': [item['mark_price'] for item in data],
+        'basis_percent': [item.get('basis_percent', np.nan) for item in data],
+        'long_short_ratio': [item.get('long_short_ratio', 1.0) for item in data],
+    }, index=index)
+    for i, column in enumerate(ZSCORE_COLUMNS):
+        frame[column] = zscores[:, i]
+    return frame
+
+
+def apply_rules(frame, rules, **overrides):
+    """一次求值所有规则，加入每条规则的列和triggered（是否满足任一alert规则）"""
+    # NaN与阈值比较为False，样本不足的交易对不会满足相应条件
+    results = rules.evaluate(frame, **overrides)
+    frame = frame.join(results)
+    frame['triggered'] = results[rules.alert_names].any(axis=1)
+    return frame
+
+
+class CrossSectionalEngine:
+    """基于RollingOIWindow矩阵的向量化检测"""
+
+    def __init__(self, oi_window, online_stats=None, rules=None, timeframe_window=None):
+        self.oi_window = oi_window
+        self.online_stats = online_stats
+        self.rules = rules if rules is not None else load_rules()
+        self.timeframe_window = timeframe_window
+
+    def evaluate(self, data, funding_threshold=None, oi_ratio_threshold=None, zscore_threshold=None):
+        """对一轮数据做横截面计算，返回以交易对为索引的DataFrame
+
+        列包括oi_recent_avg、oi_past_avg、oi_ratio、has_history（数据点是否足够）、
+        funding_rate、mark_price、basis_percent、long_short_ratio、
+        oi_zscore/funding_zscore/basis_zscore/ls_zscore（在线统计的z-score，样本不足时为NaN）、
+        按时间划分的多周期比例oi_ratio_<短>_<长>和has_history_<短>_<长>、
+        oi_rank/funding_rank（降序排名，1为最大）、每条规则一列的布尔结果，
+        以及triggered（是否满足任一alert规则）。
+        阈值参数不为None时覆盖规则配置中的同名阈值。
+        """
+        symbols = [item['symbol'] for item in data]
+        values, counts = self.oi_window.matrix(symbols)
+        if self.online_stats is not None:
+            zscores = self.online_stats.zscores(data)
+        else:
+            zscores = np.full((len(data), len(ZSCORE_COLUMNS)), np.nan)
+        frame = build_frame(pd.Index(symbols, name='symbol'), data, values, counts,
+                            self.oi_window.recent, self.oi_window.past, zscores)
+        if self.timeframe_window is not None:
+            for column, series in self.timeframe_window.evaluate(symbols).items():
+                frame[column] = series
+
+        # 只在历史数据足够的交易对之间排名
+        ranked = frame['has_history']
+        frame['oi_rank'] = frame['oi_ratio'].where(ranked).rank(ascending=False, method='min')
+        frame['funding_rank'] = frame['funding_rate'].abs().rank(ascending=False, method='min')
+
+        return apply_rules(frame, self.rules, funding_threshold=funding_threshold,
+                           oi_ratio_threshold=oi_ratio_threshold, zscore_threshold=zscore_threshold)
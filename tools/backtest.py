@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+历史回放与回测
+按时间顺序把每个交易对保存的历史数据送入与实时检测相同的计算（OI窗口比例、在线统计z-score、
+规则引擎），记录每次本应发出的警报以及之后若干时间的标记价格收益率。
+各交易对相互独立，用进程池并行回放。
+
+说明：回测按交易对单独回放，没有同一时刻的全市场截面，oi_rank/funding_rank为NaN，
+引用排名的规则在回测中不会触发。
+只回放CSV存储（每个交易对一个CSV文件）中的原始采样：Parquet和SQLite存储不支持；
+已被history_compactor压缩到archive目录的按小时聚合数据不参与回放，压缩过的时段不在回测范围内。
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 确保crypto_monitor可以被导入
+try:
+    from alert_rules import load_rules
+    from anomaly_engine import build_frame, apply_rules
+    from history_compactor import read_complete_rows, archive_path, ARCHIVE_DIR
+    from history_store import resolve_storage, SQLITE_DEFAULT_NAME
+    from oi_window import DEFAULT_RECENT_WINDOW, DEFAULT_PAST_WINDOW
+    from oi_timeframes import timeframe_series
+    from online_stats import METRICS, ewm_zscores
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from alert_rules import load_rules
+    from anomaly_engine import build_frame, apply_rules
+    from history_compactor import read_complete_rows, archive_path, ARCHIVE_DIR
+    from history_store import resolve_storage, SQLITE_DEFAULT_NAME
+    from oi_window import DEFAULT_RECENT_WINDOW, DEFAULT_PAST_WINDOW
+    from oi_timeframes import timeframe_series
+    from online_stats import METRICS, ewm_zscores
+
+logger = logging.getLogger(__name__)
+
+# 默认统计1小时、4小时、24小时后的收益率
+DEFAULT_HORIZONS = '1h,4h,24h'
+# 同一交易对30分钟内的重复触发只计一次警报。与实时流（mark_price_stream.py）的默认冷却时间相同；
+# crypto_monitor.py、run_monitor.py和分片聚合进程默认不设冷却（alert_cooldown=0），每轮满足条件都会发送
+DEFAULT_COOLDOWN = 1800
+UNIT_MS = {'m': 60 * 1000, 'h': 3600 * 1000, 'd': 24 * 3600 * 1000}
+
+# 每个工作进程加载一次规则
+_worker_rules = None
+
+
+def parse_horizons(text):
+    """把'1h,4h,24h'解析为 {名称: 毫秒}"""
+    horizons = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item[-1] not in UNIT_MS:
+            raise ValueError(f"无法识别的时间长度: {item}（支持m/h/d）")
+        horizons[item] = int(float(item[:-1]) * UNIT_MS[item[-1]])
+    return horizons
+
+
+def raw_csv_paths(data_dir, symbols=None):
+    """返回数据目录中要回放的原始CSV文件
+
+    数据目录是Parquet或SQLite存储时抛出ValueError；部分历史已被压缩到archive目录时给出警告
+    """
+    _, storage, _ = resolve_storage(data_dir)
+    if (storage == 'sqlite' or os.path.exists(os.path.join(data_dir, SQLITE_DEFAULT_NAME))
+            or os.path.exists(os.path.join(data_dir, 'tail.parquet'))
+            or glob.glob(os.path.join(data_dir, 'date=*'))):
+        raise ValueError(f"{data_dir} 不是CSV历史存储，回放只支持每个交易对一个CSV文件的原始数据")
+
+    paths = sorted(glob.glob(os.path.join(data_dir, '*.csv')))
+    if symbols:
+        wanted = set(symbols)
+        paths = [path for path in paths if os.path.basename(path)[:-len('.csv')] in wanted]
+
+    archive_dir = os.path.join(data_dir, ARCHIVE_DIR)
+    archived = [path for path in paths
+                if os.path.exists(archive_path(archive_dir, os.path.basename(path)[:-len('.csv')]))]
+    if archived:
+        logger.warning(f"{len(archived)} 个交易对的较早历史已压缩到 {archive_dir}（按小时聚合），"
+                       f"只回放未压缩的原始数据")
+    return paths
+
+
+def _init_worker(rules_path):
+    global _worker_rules
+    logging.getLogger('alert_rules').setLevel(logging.WARNING)
+    _worker_rules = load_rules(rules_path)
+
+
+def oi_windows(oi, past=DEFAULT_PAST_WINDOW):
+    """逐条记录的OI窗口矩阵和数据点数，与RollingOIWindow从零开始逐条追加的结果相同"""
+    padded = np.concatenate([np.full(past - 1, np.nan), oi])
+    values = np.lib.stride_tricks.sliding_window_view(padded, past)
+    counts = np.minimum(np.arange(1, len(oi) + 1), past)
+    return values, counts
+
+
+def forward_returns(timestamps, prices, horizons):
+    """每条记录之后各时间长度的标记价格收益率，取第一个不早于目标时间的有效价格"""
+    valid = ~np.isnan(prices)
+    valid_ts = timestamps[valid]
+    valid_prices = prices[valid]
+    result = {}
+    for name, horizon_ms in horizons.items():
+        position = np.searchsorted(valid_ts, timestamps + horizon_ms, side='left')
+        found = position < len(valid_ts)
+        future = np.full(len(timestamps), np.nan)
+        future[found] = valid_prices[position[found]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[f"ret_{name}"] = future / prices - 1
+    return result
+
+
+def apply_cooldown(timestamps, cooldown_ms):
+    """同一交易对冷却期内的重复警报只保留第一条，返回保留的位置"""
+    kept = []
+    last = None
+    for i, timestamp in enumerate(timestamps):
+        if last is None or timestamp - last >= cooldown_ms:
+            kept.append(i)
+            last = timestamp
+    return kept
+
+
+def replay_symbol(path, horizons, cooldown_ms, overrides):
+    """回放单个交易对的历史，返回 (警报DataFrame, 统计信息)"""
+    symbol = os.path.basename(path)[:-len('.csv')]
+    rows, _, rejected, _ = read_complete_rows(path)
+    rows.sort(key=lambda row: row['timestamp_ms'])
+    # 同一时间戳的多条记录（回填与实时采集重叠、重复保存等）只保留最后一条，
+    # 否则以时间戳为索引合并规则结果时会错位
+    count = len(rows)
+    rows = list({row['timestamp_ms']: row for row in rows}.values())
+    summary = {'symbol': symbol, 'rows': len(rows), 'duplicates': count - len(rows), 'rejected': len(rejected),
+               'hits': {}}
+    if not rows:
+        return None, summary
+
+    # 在线统计的z-score，一次计算整段序列，与逐条save_record的结果相同
+    metrics = np.array([[row.get(field, np.nan) for field in METRICS.values()] for row in rows], dtype=float)
+    zscores = ewm_zscores(metrics)
+
+    oi = np.array([row.get('oi', np.nan) for row in rows], dtype=float)
+    values, counts = oi_windows(oi)
+    timestamps = np.array([row['timestamp_ms'] for row in rows], dtype=np.int64)
+    frame = build_frame(pd.Index(timestamps, name='timestamp_ms'), rows, values, counts,
+                        DEFAULT_RECENT_WINDOW, DEFAULT_PAST_WINDOW, zscores)
+    for column, series in timeframe_series(timestamps, oi, _worker_rules.timeframes).items():
+        frame[column] = series
+    frame['oi_rank'] = np.nan
+    frame['funding_rank'] = np.nan
+    frame = apply_rules(frame, _worker_rules, **overrides)
+    summary['hits'] = {name: int(frame[name].sum()) for name in _worker_rules.names}
+
+    triggered = np.flatnonzero(frame['triggered'].to_numpy())
+    if not len(triggered):
+        return None, summary
+    triggered = triggered[apply_cooldown(timestamps[triggered], cooldown_ms)]
+
+    returns = forward_returns(timestamps, frame['mark_price'].to_numpy(dtype=float), horizons)
+    alerts = frame.iloc[triggered][['funding_rate', 'oi_ratio', 'mark_price', 'basis_percent',
+                                    'long_short_ratio', 'oi_zscore', 'funding_zscore']].reset_index()
+    alerts.insert(0, 'symbol', symbol)
+    alerts.insert(2, 'time', pd.to_datetime(alerts['timestamp_ms'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S'))
+    alert_rules = frame.iloc[triggered][_worker_rules.alert_names]
+    alerts['rules'] = [','.join(name for name in _worker_rules.alert_names if row[name])
+                       for _, row in alert_rules.iterrows()]
+    for column, values in returns.items():
+        alerts[column] = values[triggered]
+    return alerts, summary
+
+
+def summarize(alerts, horizons):
+    """按时间长度汇总警报之后的收益率"""
+    lines = []
+    for name in horizons:
+        column = f"ret_{name}"
+        values = alerts[column].dropna() if column in alerts else pd.Series(dtype=float)
+        if values.empty:
+            lines.append(f"  {name}: 无足够的后续数据")
+            continue
+        lines.append(f"  {name}: 样本 {len(values)}，平均 {values.mean():.2%}，中位数 {values.median():.2%}，"
+                     f"上涨占比 {(values > 0).mean():.1%}")
+    return lines
+
+
+def run_backtest(data_dir, symbols=None, rules_path=None, horizons=DEFAULT_HORIZONS,
+                 cooldown=DEFAULT_COOLDOWN, workers=None, **overrides):
+    """并行回放数据目录中的原始CSV历史，返回 (警报DataFrame, 各交易对统计列表)
+
+    overrides: 覆盖规则配置中的阈值，例如funding_threshold=0.002
+    """
+    if isinstance(horizons, str):
+        horizons = parse_horizons(horizons)
+    paths = raw_csv_paths(data_dir, symbols)
+    logger.info(f"开始回放 {len(paths)} 个交易对的历史数据")
+
+    started = time.time()
+    frames, summaries = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules_path,)) as executor:
+        futures = {executor.submit(replay_symbol, path, horizons, int(cooldown * 1000), overrides): path
+                   for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                alerts, summary = future.result()
+            except Exception as e:
+                logger.error(f"回放{os.path.basename(futures[future])}失败: {str(e)}")
+                continue
+            summaries.append(summary)
+            if alerts is not None:
+                frames.append(alerts)
+            if done % 50 == 0:
+                logger.info(f"已回放 {done}/{len(paths)} 个交易对")
+
+    if frames:
+        alerts = pd.concat(frames, ignore_index=True).sort_values(['timestamp_ms', 'symbol'], kind='stable')
+        alerts = alerts.reset_index(drop=True)
+    else:
+        alerts = pd.DataFrame()
+    rows = sum(summary['rows'] for summary in summaries)
+    logger.info(f"回放完成: {len(summaries)} 个交易对，{rows} 条记录，{len(alerts)} 次警报，"
+                f"耗时 {time.time() - started:.1f} 秒")
+    return alerts, summaries
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='按历史数据回放警报规则并统计之后的收益率')
+    parser.add_argument('--data-dir', default='data_new', help='历史数据目录')
+    parser.add_argument('--symbols', help='逗号分隔的交易对，默认全部')
+    parser.add_argument('--rules', help='规则配置文件，默认tools/alert_rules.json')
+    parser.add_argument('--funding-threshold', type=float, help='覆盖规则配置中的资金费率阈值')
+    parser.add_argument('--oi-ratio-threshold', type=float, help='覆盖规则配置中的OI增长比例阈值')
+    parser.add_argument('--zscore-threshold', type=float, help='启用z-score规则并设置阈值')
+    parser.add_argument('--timeframe-ratio-threshold', type=float, help='启用按时间划分的多周期OI规则并设置阈值')
+    parser.add_argument('--horizons', default=DEFAULT_HORIZONS, help='统计收益率的时间长度，如1h,4h,24h')
+    parser.add_argument('--cooldown', type=float, default=DEFAULT_COOLDOWN, help='同一交易对警报冷却时间（秒）')
+    parser.add_argument('--workers', type=int, help='进程数，默认CPU核数')
+    parser.add_argument('--output', default='backtest_alerts.csv', help='警报明细输出文件')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    symbols = [symbol.strip().upper() for symbol in args.symbols.split(',')] if args.symbols else None
+    horizons = parse_horizons(args.horizons)
+    try:
+        alerts, summaries = run_backtest(args.data_dir, symbols, args.rules, horizons, args.cooldown, args.workers,
+                                         funding_threshold=args.funding_threshold,
+                                         oi_ratio_threshold=args.oi_ratio_threshold,
+                                         zscore_threshold=args.zscore_threshold,
+                                         timeframe_ratio_threshold=args.timeframe_ratio_threshold)
+    except ValueError as e:
+        logger.error(f"回测失败: {str(e)}")
+        sys.exit(1)
+
+    hits = {}
+    for summary in summaries:
+        for name, count in summary['hits'].items():
+            hits[name] = hits.get(name, 0) + count
+    logger.info("各规则满足次数（未去重）:")
+    for name, count in hits.items():
+        logger.info(f"  {name}: {count}")
+    logger.info(f"去除冷却期内重复后共 {len(alerts)} 次警报，之后的标记价格收益率:")
+    for line in summarize(alerts, horizons):
+        logger.info(line)
+
+    if not alerts.empty:
+        alerts.to_csv(args.output, index=False)
+        logger.info(f"警报明细已保存到 {args.output}（生成于 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}）")
+
+
+if __name__ == "__main__":
+    main()
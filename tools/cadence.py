@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按固定节拍运行任务的调度器
+下一次运行时间从计划时间而不是完成时间推算，长时间运行也不会漂移；
+任务在同一线程中依次执行，一轮没有结束之前不会开始下一轮。
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CadenceTask:
+    """按固定间隔运行的任务，align=True时对齐到间隔的整数倍加offset"""
+
+    def __init__(self, name, interval, func, offset=0.0, align=True):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.offset = offset
+        self.align = align
+        self.next_run = None
+        self.last_duration = 0.0
+        # 运行次数、耗时超过间隔的次数、因落后而跳过的轮数
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+
+    def schedule_first(self, now):
+        if self.align:
+            self.next_run = (now - self.offset) // self.interval * self.interval + self.interval + self.offset
+        else:
+            self.next_run = now
+
+    def schedule_next(self, now):
+        # 从计划时间而不是实际完成时间推算，避免累积漂移；错过的轮次直接跳过
+        self.next_run += self.interval
+        if self.next_run <= now:
+            missed = int((now - self.next_run) // self.interval) + 1
+            self.next_run += missed * self.interval
+            self.skipped += missed
+            logger.warning(f"任务 {self.name} 落后，跳过 {missed} 轮")
+
+
+class CadenceScheduler:
+    """单线程调度器：任务依次执行，不会并发运行"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def add(self, name, interval, func, offset=0.0, align=True):
+        task = CadenceTask(name, interval, func, offset, align)
+        self.tasks.append(task)
+        return task
+
+    def run_pending(self, now=None):
+        """运行所有到期的任务，返回下一个任务的等待时间"""
+        now = time.time() if now is None else now
+        for task in self.tasks:
+            if task.next_run is None:
+                task.schedule_first(now)
+
+        for task in sorted(self.tasks, key=lambda item: item.next_run):
+            if task.next_run > time.time():
+                continue
+            started = time.time()
+            try:
+                task.func()
+            except Exception as e:
+                logger.error(f"任务 {task.name} 执行失败: {str(e)}")
+            task.last_duration = time.time() - started
+            task.runs += 1
+            if task.last_duration > task.interval:
+                task.overruns += 1
+                logger.warning(f"任务 {task.name} 耗时 {task.last_duration:.1f} 秒，超过间隔 {task.interval} 秒")
+            task.schedule_next(time.time())
+
+        return max(0.0, min(task.next_run for task in self.tasks) - time.time())
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            wait = self.run_pending()
+            stop_event.wait(wait)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按接口的熔断器
+统计每个接口最近一段时间的请求失败率，超过阈值时熔断：之后的请求不再发出而是立即失败，
+等待一段带随机抖动的退避时间后只放行一个探测请求，成功则恢复，失败则加倍退避时间再次熔断。
+交易所故障时一轮采集不会因为每个交易对都重试多次而拖延几十分钟。
+"""
+
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 最近window秒内至少min_requests个请求、失败率达到failure_threshold时熔断
+DEFAULT_FAILURE_THRESHOLD = 0.5
+DEFAULT_MIN_REQUESTS = 10
+DEFAULT_WINDOW = 60
+# 第一次熔断后等待base_delay秒，之后每次探测失败加倍，最多max_delay秒
+DEFAULT_BASE_DELAY = 5
+DEFAULT_MAX_DELAY = 300
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """接口处于熔断状态，请求没有发出"""
+
+
+class CircuitBreaker:
+    """单个接口的熔断器，线程安全"""
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD, min_requests=DEFAULT_MIN_REQUESTS,
+                 window=DEFAULT_WINDOW, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = CLOSED
+        # 最近的请求结果 (时间, 是否成功)
+        self.results = deque()
+        self.retry_at = 0.0
+        self.probing = False
+        # 连续熔断次数，决定下一次退避时间
+        self.consecutive_trips = 0
+        self.trips = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def _prune(self, now):
+        while self.results and self.results[0][0] < now - self.window:
+            self.results.popleft()
+
+    def _failure_rate(self):
+        if not self.results:
+            return 0.0
+        return sum(1 for _, ok in self.results if not ok) / len(self.results)
+
+    def _trip(self, now):
+        # 等抖动退避：一半固定，一半随机，避免多个进程在同一时刻一起探测
+        delay = min(self.max_delay, self.base_delay * 2 ** self.consecutive_trips)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.state = OPEN
+        self.retry_at = now + delay
+        self.probing = False
+        self.consecutive_trips += 1
+        self.trips += 1
+        logger.warning(f"接口 {self.name} 熔断（最近失败率 {self._failure_rate():.0%}），{delay:.1f} 秒后探测恢复")
+
+    def allow(self):
+        """是否放行一个请求；熔断期间返回False，退避结束后只放行一个探测请求"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now >= self.retry_at:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success):
+        """记录一个已发出请求的结果"""
+        with self.lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self.results.clear()
+                    self.consecutive_trips = 0
+                    self.probing = False
+                    logger.info(f"接口 {self.name} 已恢复")
+                else:
+                    self._trip(now)
+                return
+            if self.state == OPEN:
+                # 熔断前已经发出的请求
+                return
+            self.results.append((now, success))
+            self._prune(now)
+            if (not success and len(self.results) >= self.min_requests
+                    and self._failure_rate() >= self.failure_threshold):
+                self._trip(now)
+
+    def snapshot(self):
+        """当前状态，用于日志和报告"""
+        with self.lock:
+            now = time.monotonic()
+            self._prune(now)
+            return {
+                'state': self.state,
+                'failure_rate': self._failure_rate(),
+                'requests': len(self.results),
+                'retry_in': max(0.0, self.retry_at - now) if self.state == OPEN else 0.0,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class CircuitBreakerRegistry:
+    """按接口路径创建熔断器，所有熔断器使用相同的参数"""
+
+    def __init__(self, **options):
+        self.options = options
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """返回该URL对应接口的熔断器"""
+        path = urlparse(url).path
+        with self.lock:
+            breaker = self.breakers.get(path)
+            if breaker is None:
+                breaker = self.breakers[path] = CircuitBreaker(path, **self.options)
+            return breaker
+
+    def snapshot(self):
+        """{接口路径: 状态}"""
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+    def degraded(self):
+        """不处于正常状态的接口 {接口路径: 状态}"""
+        return {name: state for name, state in self.snapshot().items() if state['state'] != CLOSED}
@@ -8,20 +8,32 @@
 
 import os
 import time
-import pandas as pd
+import signal
+import asyncio
+import argparse
+import threading
 import numpy as np
 import requests
 import logging
-import json
 from datetime import datetime
-import csv
 import os.path
 from pathlib import Path
 from dotenv import load_dotenv
 import sys
-import random
+from concurrent.futures import ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from rate_limiter import RateLimitedSession
+from circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, DEFAULT_FAILURE_THRESHOLD
+from symbol_cache import SymbolUniverseCache, DEFAULT_SYMBOL_CACHE_TTL
+from ratio_cache import PeriodCache
+from history_store import create_history_store, resolve_storage
+from oi_window import RollingOIWindow
+from oi_timeframes import TimeframeOIWindow
+from anomaly_engine import CrossSectionalEngine
+from online_stats import OnlineStats
+from alert_rules import load_rules
+from cadence import CadenceScheduler
 
 # 配置日志
 logging.basicConfig(
@@ -34,6 +46,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 汇总报告依赖的规则名称（见tools/alert_rules.json）
+REPORT_RULES = ('extreme_funding', 'oi_surge', 'oi_near_threshold')
+
 # 添加实时监控记录文件
 def setup_monitor_log():
     """\u8bbe\u7f6e\u5b9e\u65f6\u76d1\u63a7\u8bb0\u5f55"""
@@ -68,139 +83,281 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
-# Binance API基础URL
-BINANCE_API_BASE = "https://fapi.binance.com"
+# 观察列表：这些交易对每轮都获取完整数据，逗号分隔
+WATCHLIST = [symbol.strip().upper() for symbol in os.getenv('WATCHLIST', '').split(',') if symbol.strip()]
+
+# Binance API基础URL，可以用BINANCE_API_BASE环境变量指向代理或本地模拟交易所
+BINANCE_API_BASE = os.getenv('BINANCE_API_BASE', "https://fapi.binance.com").rstrip('/')
+
+# 常驻模式默认的监控间隔（秒）
+DEFAULT_DAEMON_INTERVAL = 300
+
+# 并发采集时默认的最大并发请求数
+DEFAULT_MAX_CONCURRENCY = 20
+
+# 分层采集：资金费率绝对值超过该值的交易对才获取持仓量和多空比
+DEFAULT_PREFILTER_THRESHOLD = 0.0005
+# 分层采集：非候选交易对的持仓量后台采样间隔（秒）
+DEFAULT_BACKGROUND_OI_INTERVAL = 15 * 60
+
+# OI分析至少需要的历史数据点数
+MIN_HISTORY_ROWS = 10
+
+# 没有多空比数据时使用的默认值，表示多空持平
+DEFAULT_LS_DATA = {
+    'long_short_ratio': 1.0,
+    'long_account': 50,
+    'short_account': 50
+}
 
 # 创建带有重试机制的会话
-def create_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504)):
-    """创建一个带有重试机制的requests会话"""
-    session = requests.Session()
+def create_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504), pool_maxsize=10,
+                         breakers=None):
+    """创建一个带有重试机制和权重限流的requests会话，breakers为按接口的熔断器"""
+    session = RateLimitedSession(breakers=breakers)
     retry = Retry(
         total=retries,
         read=retries,
         connect=retries,
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
+        # 429/418由RateLimitedSession统一按Retry-After全局暂停，适配器不再自行重试
+        respect_retry_after_header=False,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # 连接池大小需不小于并发数，否则并发采集时连接会被反复丢弃重建
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
 class CryptoMonitor:
-    def __init__(self, data_dir="data"):
-        """初始化监控器"""
+    def __init__(self, data_dir="data", alert_cooldown=0, symbol_cache_ttl=DEFAULT_SYMBOL_CACHE_TTL, watchlist=None,
+                 storage='csv', rules_path=None, state_dir=None, breaker_options=None):
+        """初始化监控器
+        
+        breaker_options: 按接口熔断器的参数（见circuit_breaker.CircuitBreaker），
+            例如{'failure_threshold': 0.5, 'min_requests': 10}
+        state_dir: 保存在线统计、交易对缓存和统计接口缓存的目录，默认为数据目录；
+            多个进程共用同一个历史存储时各自使用不同的目录
+        rules_path: 警报规则配置文件，默认使用ALERT_RULES_FILE环境变量或tools/alert_rules.json
+        storage: 历史数据存储方式，'csv'（每个交易对一个CSV文件）、'parquet'（按日期分区的列式存储）
+            或'sqlite'（WAL模式的SQLite数据库）；data_dir以.db/.sqlite结尾时自动使用SQLite，
+            缓存等文件保存在数据库所在目录
+        alert_cooldown: 同一交易对两次警报之间的最短间隔（秒），0表示不限制
+        symbol_cache_ttl: 交易对列表缓存的有效期（秒）
+        watchlist: 分层采集时每轮都获取完整数据的交易对，默认读取WATCHLIST环境变量
+        """
+        history_path = data_dir
+        data_dir, storage, _ = resolve_storage(data_dir, storage)
         self.data_dir = data_dir
+        self.alert_cooldown = alert_cooldown
+        # 记录每个交易对最近一次发送警报的时间
+        self.last_alert_time = {}
+        self.watchlist = set(watchlist if watchlist is not None else WATCHLIST)
+        # 分层采集状态：每个交易对最近一次采样持仓量的时间和最近一次的多空比数据
+        self.last_oi_sample_time = {}
+        self.last_ls_data = {}
+        state_dir = state_dir or data_dir
         # 创建数据目录
         Path(data_dir).mkdir(parents=True, exist_ok=True)
+        Path(state_dir).mkdir(parents=True, exist_ok=True)
+        # 历史数据存储
+        self.store = create_history_store(history_path, storage)
+        # 内存中的滚动持仓量窗口，供OI分析和异常检测共用
+        self.oi_window = RollingOIWindow(self.store)
+        # 持久化的逐交易对在线统计（EWMA、方差、z-score）
+        self.online_stats = OnlineStats(os.path.join(state_dir, 'online_stats.npz'))
+        # 警报规则，报告中用到的规则必须存在
+        self.rules = load_rules(rules_path)
+        missing = [name for name in REPORT_RULES if name not in self.rules.names]
+        if missing:
+            raise ValueError(f"规则配置缺少报告需要的规则: {', '.join(missing)}")
+        # 按时间划分的多周期持仓量窗口，周期在规则配置中设置
+        self.timeframe_window = TimeframeOIWindow(self.store, self.rules.timeframes)
+        # 横截面向量化检测引擎
+        self.engine = CrossSectionalEngine(self.oi_window, self.online_stats, self.rules, self.timeframe_window)
+        # refresh_windows上次看到的存储变化标记
+        self.window_markers = {}
+        # 按接口的熔断器：持续故障由熔断器快速失败，单个请求只做少量重试
+        self.breakers = CircuitBreakerRegistry(**(breaker_options or {}))
         # 创建带有重试机制的会话
-        self.session = create_retry_session(retries=5, backoff_factor=0.5)
+        self.session = create_retry_session(retries=2, backoff_factor=0.5, pool_maxsize=DEFAULT_MAX_CONCURRENCY * 2,
+                                            breakers=self.breakers)
+        # 交易对列表缓存，保存在数据目录中
+        self.symbol_cache = SymbolUniverseCache(os.path.join(state_dir, 'exchange_info_cache.json'), ttl=symbol_cache_ttl)
+        # /futures/data/*统计接口的周期缓存
+        self.ratio_cache = PeriodCache(os.path.join(state_dir, 'ratio_cache.json'))
         logger.info(f"初始化加密货币监控器，数据将保存在 {data_dir} 目录")
     
-    def get_usdt_perpetual_symbols(self):
-        """获取所有USDT永续合约交易对"""
+    def get_usdt_perpetual_symbols(self, force_refresh=False):
+        """获取所有USDT永续合约交易对
+        
+        优先使用磁盘缓存，缓存过期或force_refresh=True时重新下载exchangeInfo
+        """
         try:
-            url = f"{BINANCE_API_BASE}/fapi/v1/exchangeInfo"
-            # 使用会话发送请求
-            response = self.session.get(url, timeout=10)
-            data = response.json()
-            
-            # 筛选USDT永续合约
-            symbols = [symbol['symbol'] for symbol in data['symbols'] 
-                      if symbol['quoteAsset'] == 'USDT' and symbol['contractType'] == 'PERPETUAL']
-            
-            logger.info(f"获取到 {len(symbols)} 个USDT永续合约交易对")
-            return symbols
+            if force_refresh or not self.symbol_cache.is_fresh():
+                url = f"{BINANCE_API_BASE}/fapi/v1/exchangeInfo"
+                # 使用会话发送请求
+                response = self.session.get(url, timeout=10)
+                data = response.json()
+                if self.symbol_cache.update(data):
+                    logger.info("已更新交易对缓存")
         except Exception as e:
-            logger.error(f"获取交易对失败: {str(e)}")
-            return []
+            # 下载失败时退回使用过期的缓存
+            if not self.symbol_cache.symbols:
+                logger.error(f"获取交易对失败: {str(e)}")
+                return []
+            logger.warning(f"获取交易对失败，使用缓存的交易对列表: {str(e)}")
+        
+        # 按交易所公布的限额校准限流器
+        self.session.limiter.configure(self.symbol_cache.rate_limits)
+        
+        # 筛选USDT永续合约
+        symbols = self.symbol_cache.usdt_perpetual_symbols()
+        
+        logger.info(f"获取到 {len(symbols)} 个USDT永续合约交易对")
+        return symbols
+    
+    def _build_funding_record(self, symbol, data, current_time=None):
+        """将premiumIndex返回的单个交易对数据转换为标准记录"""
+        # 提取资金费率
+        funding_rate = float(data.get('lastFundingRate', 0) or 0)
+        mark_price = float(data.get('markPrice', 0) or 0)
+        index_price = float(data.get('indexPrice', 0) or 0)
+        
+        # 计算基差和基差百分比
+        basis = mark_price - index_price
+        basis_percent = (basis / index_price) * 100 if index_price else 0
+        
+        # 获取当前时间戳，以ISO格式存储，便于CSV处理和排序
+        if current_time is None:
+            current_time = datetime.now()
+        timestamp_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
+        timestamp_ms = int(current_time.timestamp() * 1000)  # 毫秒级时间戳
+        
+        return {
+            'symbol': symbol,
+            'mark_price': mark_price,
+            'index_price': index_price,
+            'basis': basis,
+            'basis_percent': basis_percent,
+            'last_funding_rate': funding_rate,
+            'timestamp': timestamp_str,
+            'timestamp_ms': timestamp_ms
+        }
     
     def get_funding_rate(self, symbol):
         """获取资金费率"""
         try:
-            # 添加随机延迟，避免API限流
-            time.sleep(0.01)  # 10毫秒延迟
-            
             url = f"{BINANCE_API_BASE}/fapi/v1/premiumIndex"
             params = {'symbol': symbol}
             # 使用会话发送请求
             response = self.session.get(url, params=params, timeout=10)
             data = response.json()
             
-            # 提取资金费率
-            funding_rate = float(data.get('lastFundingRate', 0))
-            mark_price = float(data.get('markPrice', 0))
-            index_price = float(data.get('indexPrice', 0))
+            return self._build_funding_record(symbol, data)
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"获取{symbol}资金费率失败: {str(e)}")
+            return None
+    
+    def get_all_funding_rates(self, symbols=None):
+        """一次请求获取全市场资金费率快照
+        
+        不带symbol参数调用premiumIndex会返回所有交易对的数据，
+        返回 {symbol: 记录} 字典，记录格式与get_funding_rate相同。
+        如果传入symbols，则只保留其中的交易对。
+        """
+        try:
+            url = f"{BINANCE_API_BASE}/fapi/v1/premiumIndex"
+            # 使用会话发送请求
+            response = self.session.get(url, timeout=10)
+            data = response.json()
             
-            # 计算基差和基差百分比
-            basis = mark_price - index_price
-            basis_percent = (basis / index_price) * 100 if index_price else 0
+            if not isinstance(data, list):
+                logger.error(f"批量获取资金费率返回格式异常: {str(data)[:200]}")
+                return {}
             
-            # 获取当前时间戳，以ISO格式存储，便于CSV处理和排序
+            wanted = set(symbols) if symbols is not None else None
+            # 同一批快照使用统一的时间戳
             current_time = datetime.now()
-            timestamp_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
-            timestamp_ms = int(current_time.timestamp() * 1000)  # 毫秒级时间戳
+            snapshot = {}
+            for item in data:
+                symbol = item.get('symbol')
+                if not symbol or (wanted is not None and symbol not in wanted):
+                    continue
+                try:
+                    snapshot[symbol] = self._build_funding_record(symbol, item, current_time)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"解析{symbol}资金费率失败: {str(e)}")
             
-            return {
-                'symbol': symbol,
-                'mark_price': mark_price,
-                'index_price': index_price,
-                'basis': basis,
-                'basis_percent': basis_percent,
-                'last_funding_rate': funding_rate,
-                'timestamp': timestamp_str,
-                'timestamp_ms': timestamp_ms
-            }
+            logger.info(f"批量获取到 {len(snapshot)} 个交易对的资金费率")
+            return snapshot
+        except CircuitOpenError as e:
+            logger.warning(f"批量获取资金费率跳过: {str(e)}")
+            return {}
         except Exception as e:
-            logger.error(f"获取{symbol}资金费率失败: {str(e)}")
-            return None
+            logger.error(f"批量获取资金费率失败: {str(e)}")
+            return {}
     
     def get_open_interest(self, symbol):
-        """获取持仓量数据"""
+        """获取持仓量数据
+        
+        任何失败（请求错误、接口熔断、非200响应、缺少openInterest字段）都返回None，
+        历史记录和OI窗口把它当作缺失数据，而不是持仓量为0。
+        """
         try:
-            # 添加随机延迟，避免API限流
-            time.sleep(0.01)  # 10毫秒延迟
-            
             url = f"{BINANCE_API_BASE}/fapi/v1/openInterest"
             params = {'symbol': symbol}
             # 使用会话发送请求
             response = self.session.get(url, params=params, timeout=10)
+            response.raise_for_status()
             data = response.json()
             
             # 提取持仓量
-            oi = float(data.get('openInterest', 0))
-            
-            return oi
+            return float(data['openInterest'])
         except Exception as e:
             logger.error(f"获取{symbol}持仓量失败: {str(e)}")
-            return 0
+            return None
+    
+    def get_futures_data_ratio(self, endpoint, symbol, period='5m'):
+        """获取/futures/data/下统计接口的最新一条数据
+        
+        同一周期内的结果会被缓存，只有新周期开始后才重新请求；返回的数据还是上一周期的
+        （刚过周期边界、交易所尚未生成新数据）时不缓存。获取失败时返回None。
+        """
+        cached = self.ratio_cache.get(endpoint, symbol, period)
+        if cached is not None:
+            return cached
+        
+        url = f"{BINANCE_API_BASE}/futures/data/{endpoint}"
+        params = {
+            'symbol': symbol,
+            'period': period,
+            'limit': 1  # 只获取最新的一条数据
+        }
+        # 使用会话发送请求
+        response = self.session.get(url, params=params, timeout=10)
+        data = response.json()
+        if not isinstance(data, list):
+            raise ValueError(f"返回格式异常: {str(data)[:200]}")
+        
+        # 空列表没有时间戳，不缓存
+        latest = data[-1] if data else {}
+        self.ratio_cache.put(endpoint, symbol, period, latest)
+        return latest
     
     def get_long_short_ratio(self, symbol):
-        """获取多空比数据"""
+        """获取多空比数据，接口熔断时沿用上一次的数据"""
         try:
-            # 添加随机延迟，避免API限流
-            time.sleep(0.01)  # 10毫秒延迟
-            
-            # 获取账户多空比
-            url = f"https://fapi.binance.com/futures/data/topLongShortAccountRatio"
-            params = {
-                'symbol': symbol,
-                'period': '5m',  # 5分钟周期
-                'limit': 1  # 只获取最新的一条数据
-            }
-            # 使用会话发送请求
-            response = self.session.get(url, params=params, timeout=10)
-            account_data = response.json()
+            # 获取大户账户多空比，5分钟周期
+            latest = self.get_futures_data_ratio('topLongShortAccountRatio', symbol)
             
-            if not account_data or len(account_data) == 0:
-                return {
-                    'long_short_ratio': 1.0,  # 默认值，表示多空持平
-                    'long_account': 50,
-                    'short_account': 50
-                }
+            if not latest:
+                return dict(DEFAULT_LS_DATA)
             
             # 提取数据
-            latest = account_data[0]
             long_short_ratio = float(latest.get('longShortRatio', 1.0))
             long_account = float(latest.get('longAccount', 50))
             short_account = float(latest.get('shortAccount', 50))
@@ -210,24 +367,28 @@ class CryptoMonitor:
                 'long_account': long_account,
                 'short_account': short_account
             }
+        except CircuitOpenError:
+            return dict(self.last_ls_data.get(symbol, DEFAULT_LS_DATA))
         except Exception as e:
             logger.error(f"获取{symbol}多空比数据失败: {str(e)}")
-            return {
-                'long_short_account_ratio': 1.0,
-                'top_trader_account_ls_ratio': 1.0,
-                'top_trader_position_ls_ratio': 1.0,
-                'taker_buy_sell_ratio': 1.0
-            }
+            # 返回与正常情况相同的字段，保证CSV列一致
+            return dict(DEFAULT_LS_DATA)
     
-    def collect_data(self):
-        """收集所有交易对的数据"""
+    def collect_data(self, bulk=True):
+        """收集所有交易对的数据
+        
+        bulk=True时先用一次premiumIndex请求获取全市场资金费率快照，
+        快照中缺失的交易对再逐个请求。
+        """
         symbols = self.get_usdt_perpetual_symbols()
         all_data = []
         
+        funding_snapshot = self.get_all_funding_rates(symbols) if bulk else {}
+        
         for symbol in symbols:
             try:
-                # 获取资金费率数据
-                funding_data = self.get_funding_rate(symbol)
+                # 获取资金费率数据，优先使用批量快照
+                funding_data = funding_snapshot.get(symbol) or self.get_funding_rate(symbol)
                 if not funding_data:
                     continue
                 
@@ -242,94 +403,282 @@ class CryptoMonitor:
                 all_data.append(funding_data)
                 
                 # 将数据保存到CSV文件
-                self.save_data_to_csv(funding_data)
-                
-                # 避免API请求过于频繁
-                time.sleep(0.1)
+                self.save_record(funding_data)
             except Exception as e:
                 logger.error(f"处理{symbol}数据时出错: {str(e)}")
         
+        self.store.flush()
+        self.ratio_cache.flush()
+        self.online_stats.flush()
         return all_data
     
-    def save_data_to_csv(self, data):
-        """将数据保存到CSV文件"""
-        symbol = data['symbol']
-        file_path = os.path.join(self.data_dir, f"{symbol}.csv")
-        file_exists = os.path.isfile(file_path)
+    def collect_data_concurrent(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, bulk=True, symbols=None):
+        """并发收集所有交易对的数据
         
-        try:
-            with open(file_path, 'a', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=data.keys())
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(data)
-        except Exception as e:
-            logger.error(f"保存{symbol}数据到CSV失败: {str(e)}")
+        collect_data的替代实现：持仓量和多空比请求通过asyncio并发发出，
+        同时最多max_concurrency个请求在途，返回结果与collect_data相同。
+        symbols不为None时只收集这些交易对。
+        """
+        if symbols is None:
+            symbols = self.get_usdt_perpetual_symbols()
+        funding_snapshot = self.get_all_funding_rates(symbols) if bulk else {}
+        return asyncio.run(self._fetch_details_async(symbols, funding_snapshot, max_concurrency))
     
-    def analyze_oi_changes(self, data):
-        """分析持仓量变化"""
-        oi_analysis_results = []
-        significant_oi_changes = []
+    def collect_data_tiered(self, prefilter_threshold=DEFAULT_PREFILTER_THRESHOLD,
+                            background_interval=DEFAULT_BACKGROUND_OI_INTERVAL,
+                            max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """分层收集数据
+        
+        1. 一次批量请求获取全市场资金费率
+        2. 资金费率绝对值超过prefilter_threshold或在观察列表中的交易对（候选）获取持仓量和多空比
+        3. 其余交易对每隔background_interval秒采样一次持仓量，保证历史窗口完整
+        
+        只返回本轮获取了持仓量的交易对记录，格式与collect_data相同。
+        """
+        symbols = self.get_usdt_perpetual_symbols()
+        funding_snapshot = self.get_all_funding_rates(symbols)
+        if not funding_snapshot:
+            logger.warning("批量资金费率快照为空，退回全量并发采集")
+            return asyncio.run(self._fetch_details_async(symbols, {}, max_concurrency))
+        
+        candidates, background = self.select_tiered_symbols(symbols, funding_snapshot,
+                                                            prefilter_threshold, background_interval)
+        candidate_set = set(candidates)
+        
+        logger.info(f"分层采集: 候选 {len(candidates)} 个，后台持仓量采样 {len(background)} 个，"
+                    f"跳过 {len(symbols) - len(candidates) - len(background)} 个")
+        
+        return asyncio.run(self._fetch_details_async(
+            candidates + background, funding_snapshot, max_concurrency, ls_symbols=candidate_set))
+    
+    def select_tiered_symbols(self, symbols, funding_snapshot, prefilter_threshold=DEFAULT_PREFILTER_THRESHOLD,
+                              background_interval=DEFAULT_BACKGROUND_OI_INTERVAL):
+        """按资金费率预筛选交易对
+        
+        返回 (候选交易对, 需要后台采样持仓量的交易对)
+        """
+        now = time.time()
+        candidates = [symbol for symbol in symbols
+                      if symbol in self.watchlist
+                      or (symbol in funding_snapshot
+                          and abs(funding_snapshot[symbol]['last_funding_rate']) > prefilter_threshold)]
+        candidate_set = set(candidates)
+        background = [symbol for symbol in symbols
+                      if symbol not in candidate_set and symbol in funding_snapshot
+                      and now - self.last_oi_sample_time.get(symbol, 0) >= background_interval]
+        return candidates, background
+    
+    def collect_data_pipelined(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, tiered=False,
+                               prefilter_threshold=DEFAULT_PREFILTER_THRESHOLD,
+                               background_interval=DEFAULT_BACKGROUND_OI_INTERVAL,
+                               funding_threshold=None, oi_ratio_threshold=None, zscore_threshold=None):
+        """流水线式收集和检测
+        
+        获取、检测和发送警报三个阶段同时进行：每个交易对的数据获取完成后立即放入队列，
+        检测阶段取出队列中已到达的全部记录一起向量化检测，满足警报规则的交易对立即交给发送线程，
+        不必等待其余交易对的网络请求。tiered=True时按collect_data_tiered的方式只获取候选和
+        到期的后台交易对，候选交易对排在前面。
+        
+        返回 (本轮记录, 异常信号列表)，记录与collect_data_concurrent/collect_data_tiered相同。
+        检测按到达的批次进行，引用oi_rank/funding_rank的规则只在同一批次内排名。
+        """
+        symbols = self.get_usdt_perpetual_symbols()
+        funding_snapshot = self.get_all_funding_rates(symbols)
+        ls_symbols = None
+        if tiered and funding_snapshot:
+            candidates, background = self.select_tiered_symbols(symbols, funding_snapshot,
+                                                                prefilter_threshold, background_interval)
+            logger.info(f"分层采集: 候选 {len(candidates)} 个，后台持仓量采样 {len(background)} 个，"
+                        f"跳过 {len(symbols) - len(candidates) - len(background)} 个")
+            symbols = candidates + background
+            ls_symbols = set(candidates)
+        elif tiered:
+            logger.warning("批量资金费率快照为空，退回全量并发采集")
+        thresholds = (funding_threshold, oi_ratio_threshold, zscore_threshold)
+        return asyncio.run(self._pipeline_async(symbols, funding_snapshot, max_concurrency, ls_symbols, thresholds))
+    
+    async def _pipeline_async(self, symbols, funding_snapshot, max_concurrency, ls_symbols, thresholds):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        
+        async def produce():
+            try:
+                return await self._fetch_details_async(symbols, funding_snapshot, max_concurrency,
+                                                       ls_symbols=ls_symbols, queue=queue)
+            finally:
+                # 结束标记，获取阶段出错时也要让检测阶段退出
+                queue.put_nowait(None)
+        
+        # 检测放在单独的线程中，不阻塞事件循环调度网络请求；警报按顺序在另一个线程中发送
+        anomalies = []
+        alerts = []
+        with ThreadPoolExecutor(max_workers=1) as analysis_executor, \
+                ThreadPoolExecutor(max_workers=1) as alert_executor:
+            producer = asyncio.ensure_future(produce())
+            finished = False
+            while not finished:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                finished = batch[-1] is None
+                batch = [item for item in batch if item is not None]
+                if not batch:
+                    continue
+                found = await loop.run_in_executor(analysis_executor, self.find_anomalies, batch, *thresholds)
+                for anomaly in found:
+                    alerts.append(loop.run_in_executor(alert_executor, self.send_alert, anomaly))
+                anomalies.extend(found)
+            data = await producer
+            await asyncio.gather(*alerts)
+        return data, anomalies
+    
+    def fetch_concurrent(self, func, symbols, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """对每个交易对并发调用func(symbol)，返回 {symbol: 结果}"""
+        if not symbols:
+            return {}
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return dict(zip(symbols, executor.map(func, symbols)))
+    
+    async def _fetch_details_async(self, symbols, funding_snapshot, max_concurrency, ls_symbols=None, queue=None):
+        """并发获取持仓量和多空比并保存
+        
+        ls_symbols为None时所有交易对都获取多空比，否则只有其中的交易对获取，
+        其余交易对沿用上一次的多空比数据，保证CSV列一致。
+        queue不为None时，每个交易对保存后立即把记录放入该asyncio.Queue。
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        for symbol_data in data:
-            symbol = symbol_data['symbol']
+        # requests是阻塞的，放到线程池中执行，线程数即为在途请求上限
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            async def fetch_symbol(symbol):
+                async with semaphore:
+                    try:
+                        # 获取资金费率数据，优先使用批量快照
+                        funding_data = funding_snapshot.get(symbol)
+                        if not funding_data:
+                            funding_data = await loop.run_in_executor(executor, self.get_funding_rate, symbol)
+                        if not funding_data:
+                            return None
+                        
+                        if ls_symbols is None or symbol in ls_symbols:
+                            # 持仓量和多空比互不依赖，同时请求
+                            oi, ls_data = await asyncio.gather(
+                                loop.run_in_executor(executor, self.get_open_interest, symbol),
+                                loop.run_in_executor(executor, self.get_long_short_ratio, symbol)
+                            )
+                            self.last_ls_data[symbol] = ls_data
+                        else:
+                            oi = await loop.run_in_executor(executor, self.get_open_interest, symbol)
+                            ls_data = self.last_ls_data.get(symbol, DEFAULT_LS_DATA)
+                        funding_data['oi'] = oi
+                        funding_data.update(ls_data)
+                        # 持仓量接口熔断时不算作已采样，恢复后后台交易对会尽快补采
+                        if oi is not None:
+                            self.last_oi_sample_time[symbol] = time.time()
+                        
+                        # 将数据保存到CSV文件
+                        self.save_record(funding_data)
+                        if queue is not None:
+                            queue.put_nowait(funding_data)
+                        return funding_data
+                    except Exception as e:
+                        logger.error(f"处理{symbol}数据时出错: {str(e)}")
+                        return None
             
-            # 检查是否有足够的历史数据进行分析
-            csv_path = os.path.join(self.data_dir, f"{symbol}.csv")
-            if not os.path.exists(csv_path):
+            results = await asyncio.gather(*(fetch_symbol(symbol) for symbol in symbols))
+        
+        self.store.flush()
+        self.ratio_cache.flush()
+        self.online_stats.flush()
+        return [item for item in results if item]
+    
+    def save_record(self, data):
+        """将一条记录保存到历史存储
+        
+        Parquet存储会先缓存，在store.flush()时一次写入
+        """
+        symbol = data['symbol']
+        # 先加载窗口再写入，避免新记录被重复计入
+        self.oi_window.ensure_loaded(symbol)
+        self.timeframe_window.ensure_loaded(symbol)
+        self.store.append(data)
+        self.ingest_record(data)
+    
+    def ingest_record(self, data):
+        """用一条新记录更新内存中的OI窗口和在线统计，不写入历史存储
+        
+        记录已经由其他进程写入共用的存储时（分片采集的聚合进程）直接调用
+        """
+        symbol = data['symbol']
+        self.oi_window.append(symbol, data.get('oi'))
+        self.timeframe_window.append(symbol, data.get('timestamp_ms'), data.get('oi'))
+        self.online_stats.update(data)
+    
+    def refresh_windows(self, symbols):
+        """把其他进程新写入历史存储的记录追加到内存OI窗口
+        
+        历史记录由其他进程写入时使用（例如实时流依赖REST采集进程写入的持仓量）。
+        先用存储的变化标记（文件修改时间或最后时间戳）跳过没有新数据的交易对，
+        有新数据时只读取窗口最新时间戳之后的记录；无法定位时丢弃窗口，下次检测时重新加载
+        """
+        markers = self.store.change_markers(symbols)
+        for symbol in symbols:
+            marker = markers.get(symbol)
+            if symbol in self.window_markers and self.window_markers[symbol] == marker:
+                continue
+            self.window_markers[symbol] = marker
+            latest = self.timeframe_window.latest_timestamp(symbol)
+            if latest is None:
+                self.oi_window.invalidate(symbol)
+                self.timeframe_window.invalidate(symbol)
                 continue
-            
             try:
-                # 读取历史数据，使用更健壮的方式处理CSV格式变化
-                # 使用on_bad_lines='skip'跳过格式不匹配的行
-                df = pd.read_csv(csv_path, on_bad_lines='skip')
-                
-                # 确保'oi'列存在
-                if 'oi' not in df.columns:
-                    logger.warning(f"{symbol}数据中缺少'oi'列，跳过分析")
-                    continue
-                    
-                if len(df) < 10:  # 确保有足够的数据点
-                    continue
-                
-                # 计算OI变化
-                recent_oi_avg = df['oi'].tail(3).mean()
-                past_oi_avg = df['oi'].tail(10).mean()
-                oi_ratio = recent_oi_avg / past_oi_avg if past_oi_avg > 0 else 1.0
-                
-                # 记录OI分析结果
-                analysis_result = {
-                    'symbol': symbol,
-                    'oi_current': symbol_data['oi'],
-                    'oi_recent_avg': recent_oi_avg,
-                    'oi_past_avg': past_oi_avg,
-                    'oi_ratio': oi_ratio,
-                    'funding_rate': symbol_data['last_funding_rate'],
-                    'mark_price': symbol_data['mark_price']
-                }
-                oi_analysis_results.append(analysis_result)
-                
-                # 记录显著的OI变化
-                if oi_ratio > 2.0:  # 如果OI增长超过100%（短期激增）
-                    significant_oi_changes.append(analysis_result)
-                    
+                df = self.store.read_since(symbol, latest + 1)
             except Exception as e:
-                logger.error(f"分析{symbol}数据时出错: {str(e)}")
+                logger.error(f"读取{symbol}新增历史记录失败: {str(e)}")
+                self.oi_window.invalidate(symbol)
+                self.timeframe_window.invalidate(symbol)
+                continue
+            if df is None:
+                continue
+            for timestamp_ms, oi in zip(df['timestamp_ms'], df['oi']):
+                self.oi_window.append(symbol, oi)
+                self.timeframe_window.append(symbol, timestamp_ms, oi)
+    
+    def load_recent_history(self, symbol, n=MIN_HISTORY_ROWS):
+        """读取交易对最近n条历史记录，没有数据时返回None"""
+        return self.store.read_recent(symbol, n)
+    
+    def analyze_oi_changes(self, data):
+        """分析持仓量变化"""
+        if not data:
+            return [], []
+        
+        # 一次向量化计算所有交易对的OI变化，历史数据不足的交易对跳过
+        frame = self.engine.evaluate(data)
+        analyzed = frame[frame['has_history']].reset_index()
+        
+        # 记录OI分析结果
+        columns = ['symbol', 'oi_current', 'oi_recent_avg', 'oi_past_avg', 'oi_ratio', 'funding_rate', 'mark_price']
+        oi_analysis_results = analyzed[columns].to_dict('records')
         
-        # 按OI增长比例降序排序
-        significant_oi_changes.sort(key=lambda x: x['oi_ratio'], reverse=True)
+        # 记录显著的OI变化（满足oi_surge规则，默认OI增长超过100%），按OI增长比例降序排序
+        significant = analyzed[analyzed['oi_surge']].sort_values('oi_ratio', ascending=False, kind='stable')
+        significant_oi_changes = significant[columns].to_dict('records')
         
         return oi_analysis_results, significant_oi_changes
     
-    def detect_anomalies(self, data, funding_threshold=0.001, oi_ratio_threshold=2.0):
+    def detect_anomalies(self, data, funding_threshold=None, oi_ratio_threshold=None, zscore_threshold=None):
         """检测异常信号
         
-        触发条件：
+        触发条件由规则配置中alert为true的规则决定，默认为：
         - 当资金费率绝对值 > 0.1%（即last_funding_rate < -0.001 或 > 0.001），且
         - 最近3次的OI均值 / 最近10次的 OI均值 > 2（OI短期激增）
+        设置zscore_threshold时，另一个可选触发条件为：
+        - OI的z-score > zscore_threshold，且资金费率z-score的绝对值 > zscore_threshold
+        阈值参数为None时使用规则配置中的值
         """
-        anomalies = []
-        
         # 先进行OI分析
         _, significant_oi_changes = self.analyze_oi_changes(data)
         
@@ -339,62 +688,44 @@ class CryptoMonitor:
             for item in significant_oi_changes[:10]:  # 只显示前10个
                 monitor_logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
         
-        for symbol_data in data:
-            symbol = symbol_data['symbol']
-            funding_rate = symbol_data['last_funding_rate']
-            
-            # 检查是否有足够的历史数据进行分析
-            csv_path = os.path.join(self.data_dir, f"{symbol}.csv")
-            if not os.path.exists(csv_path):
-                continue
-            
-            try:
-                # 读取历史数据，使用更健壮的方式
-                df = pd.read_csv(csv_path, on_bad_lines='skip')
-                
-                # 确保'oi'列存在
-                if 'oi' not in df.columns:
-                    logger.warning(f"{symbol}数据中缺少'oi'列，跳过分析")
-                    continue
-                    
-                if len(df) < 10:  # 确保有足够的数据点
-                    continue
-                
-                # 计算OI变化
-                recent_oi_avg = df['oi'].tail(3).mean()  # 最近3次的OI均值
-                past_oi_avg = df['oi'].tail(10).mean()   # 最近10次的OI均值
-                oi_ratio = recent_oi_avg / past_oi_avg if past_oi_avg > 0 else 1.0
-                
-                # 检测异常 - 根据触发条件进行判断
-                # 1. 资金费率绝对值 > 0.1%
-                # 2. OI短期激增（最近3次均值/最近10次均值 > 2）
-                if (abs(funding_rate) > funding_threshold) and (oi_ratio > oi_ratio_threshold):
-                    # 创建异常信号记录
-                    anomaly = {
-                        'symbol': symbol,
-                        'funding_rate': funding_rate,
-                        'oi_ratio': oi_ratio,
-                        'mark_price': symbol_data['mark_price'],
-                        'basis_percent': symbol_data['basis_percent'],
-                        'long_short_ratio': symbol_data.get('long_short_ratio', 1.0)  # 使用新的字段名
-                    }
-                    anomalies.append(anomaly)
-                    
-                    # 发送警报
-                    self.send_alert(anomaly)
-            except Exception as e:
-                logger.error(f"分析{symbol}数据时出错: {str(e)}")
+        anomalies = self.find_anomalies(data, funding_threshold, oi_ratio_threshold, zscore_threshold)
+        
+        # 发送警报
+        for anomaly in anomalies:
+            self.send_alert(anomaly)
         
         return anomalies
     
+    def find_anomalies(self, data, funding_threshold=None, oi_ratio_threshold=None, zscore_threshold=None):
+        """对一组记录求值全部规则，返回满足警报规则的异常信号，不发送警报"""
+        if not data:
+            return []
+        try:
+            # 检测异常 - 对所有交易对一次性求值全部规则
+            frame = self.engine.evaluate(data, funding_threshold, oi_ratio_threshold, zscore_threshold)
+            triggered = frame[frame['triggered']].reset_index()
+            columns = ['symbol', 'funding_rate', 'oi_ratio', 'mark_price', 'basis_percent', 'long_short_ratio',
+                       'oi_zscore', 'funding_zscore']
+            return triggered[columns].to_dict('records')
+        except Exception as e:
+            logger.error(f"检测异常信号时出错: {str(e)}")
+            return []
+    
     def send_alert(self, anomaly):
         """通过Telegram发送警报"""
         if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
             logger.warning("未配置Telegram Bot，跳过发送警报")
             return
         
+        # 冷却期内不重复发送同一交易对的警报
+        symbol = anomaly['symbol']
+        now = time.time()
+        if self.alert_cooldown and now - self.last_alert_time.get(symbol, 0) < self.alert_cooldown:
+            logger.info(f"{symbol}仍在警报冷却期内，跳过发送")
+            return
+        self.last_alert_time[symbol] = now
+        
         try:
-            symbol = anomaly['symbol']
             funding_rate = anomaly['funding_rate']
             oi_ratio = anomaly['oi_ratio']
             mark_price = anomaly['mark_price']
@@ -408,7 +739,11 @@ class CryptoMonitor:
             message += f"OI增长比例: {oi_ratio:.2f}x\n"
             message += f"标记价格: {mark_price:.4f}\n"
             message += f"基差百分比: {basis_percent:.2f}%\n"
-            message += f"多空比: {ls_ratio:.2f}\n\n"
+            message += f"多空比: {ls_ratio:.2f}\n"
+            oi_zscore = anomaly.get('oi_zscore')
+            if oi_zscore is not None and not np.isnan(oi_zscore):
+                message += f"OI z-score: {oi_zscore:.2f}\n"
+            message += "\n"
             message += f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
             
             # 发送消息
@@ -449,23 +784,33 @@ class CryptoMonitor:
                 logger.error(f"验证Bot Token时出错: {str(verify_error)}")
 
 
-def main():
-    """主函数"""
-    monitor = CryptoMonitor()
-    
+def log_degraded_endpoints(monitor):
+    """记录处于熔断状态的接口，返回 {接口路径: 状态}"""
+    degraded = monitor.breakers.degraded()
+    for path, state in degraded.items():
+        monitor_logger.info(f"⚠️ 接口 {path} 熔断中（{state['state']}），累计跳过 {state['rejected']} 次请求，"
+                            f"{state['retry_in']:.0f} 秒后探测恢复，本轮相关数据沿用旧值或留空")
+    return degraded
+
+def run_cycle(monitor):
+    """运行一轮监控：收集数据、分析OI变化、检测异常并发送汇总报告"""
     # 记录监控开始
     monitor_logger.info(f"========== 监控会话开始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========")
-    monitor_logger.info(f"监控参数: 资金费率阈值 = 0.001 (0.1%), OI增长比例阈值 = 2.0")
+    funding_threshold = monitor.rules.threshold('funding_threshold')
+    monitor_logger.info(f"监控参数: 资金费率阈值 = {funding_threshold} ({funding_threshold:.1%}), "
+                        f"OI增长比例阈值 = {monitor.rules.threshold('oi_ratio_threshold')}")
     
-    logger.info("开始收集数据...")
-    data = monitor.collect_data()
+    # 收集数据的同时检测异常并发送警报
+    logger.info("开始收集数据并检测异常信号...")
+    data, anomalies = monitor.collect_data_pipelined()
+    log_degraded_endpoints(monitor)
     
     # 记录收集到的交易对数量
     if data:
         monitor_logger.info(f"成功收集了 {len(data)} 个交易对的数据")
         
         # 记录极端资金费率的交易对
-        extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
+        extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
         if extreme_funding:
             monitor_logger.info(f"发现 {len(extreme_funding)} 个极端资金费率的交易对:")
             for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:  # 只显示前10个
@@ -473,13 +818,14 @@ def main():
     else:
         monitor_logger.info("没有收集到数据，请检查网络连接和API状态")
     
-    logger.info("检测异常信号...")
-    
     # 分析OI变化
     _, significant_oi_changes = monitor.analyze_oi_changes(data)
     
-    # 检测异常信号
-    anomalies = monitor.detect_anomalies(data)
+    # 记录显著的OI变化
+    if significant_oi_changes:
+        monitor_logger.info(f"\n发现 {len(significant_oi_changes)} 个显著的OI变化:")
+        for item in significant_oi_changes[:10]:  # 只显示前10个
+            monitor_logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
     
     if anomalies:
         monitor_logger.info(f"❗ 检测到 {len(anomalies)} 个潜在轧空信号 ❗")
@@ -492,7 +838,7 @@ def main():
     
     # 发送汇总信息到Telegram
     # 检查是否有异常费率的交易对
-    extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
+    extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
     
     # 当有异常费率、OI显著变化或异常信号时发送通知
     if extreme_funding or significant_oi_changes or anomalies:
@@ -502,7 +848,7 @@ def main():
 
             
             # 添加异常费率信息
-            extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
+            extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
             if extreme_funding:
                 message += f"🔴 异常费率交易对 ({len(extreme_funding)})个:\n"
                 for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:
@@ -539,5 +885,53 @@ def main():
         # 记录监控结束
     monitor_logger.info(f"========== 监控会话结束: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========\n")
 
+def run_daemon(monitor, interval=DEFAULT_DAEMON_INTERVAL, offset=0.0, stop_event=None):
+    """常驻运行：每interval秒运行一轮监控，直到stop_event被设置
+    
+    HTTP会话、交易对缓存、OI窗口、在线统计和警报冷却状态都保留在内存中，不必每轮重新启动进程。
+    运行时间对齐到interval的整数倍加offset（与cron相同）且不会漂移；某轮耗时超过间隔时跳过错过的轮次，
+    两轮不会同时运行。
+    """
+    stop_event = stop_event or threading.Event()
+    scheduler = CadenceScheduler()
+    task = scheduler.add('monitor', interval, lambda: run_cycle(monitor), offset=offset)
+    
+    # 收到SIGTERM/SIGINT时在当前一轮结束后退出
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号 {signum}，当前一轮结束后退出")
+        stop_event.set()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+    
+    logger.info(f"常驻模式启动，每 {interval} 秒运行一次监控")
+    try:
+        scheduler.run_forever(stop_event)
+    finally:
+        monitor.store.close()
+        monitor.ratio_cache.flush()
+        monitor.online_stats.flush()
+        logger.info(f"常驻模式退出: 共运行 {task.runs} 轮，超时 {task.overruns} 轮，跳过 {task.skipped} 轮")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='加密货币轧空监控')
+    parser.add_argument('--daemon', action='store_true', help='常驻运行，按固定间隔重复监控，代替cron/schtasks定时启动')
+    parser.add_argument('--interval', type=float, default=DEFAULT_DAEMON_INTERVAL, help='常驻模式的监控间隔（秒）')
+    parser.add_argument('--offset', type=float, default=0.0, help='常驻模式相对间隔整数倍的偏移（秒）')
+    parser.add_argument('--data-dir', default='data', help='历史数据目录')
+    parser.add_argument('--storage', default='csv', choices=['csv', 'parquet', 'sqlite'], help='历史数据存储方式')
+    parser.add_argument('--alert-cooldown', type=float, default=0, help='同一交易对两次警报之间的最短间隔（秒）')
+    parser.add_argument('--breaker-threshold', type=float, default=DEFAULT_FAILURE_THRESHOLD,
+                        help='接口最近一分钟失败率达到该值时熔断')
+    args = parser.parse_args()
+    
+    monitor = CryptoMonitor(data_dir=args.data_dir, alert_cooldown=args.alert_cooldown, storage=args.storage,
+                            breaker_options={'failure_threshold': args.breaker_threshold})
+    if args.daemon:
+        run_daemon(monitor, args.interval, args.offset)
+    else:
+        run_cycle(monitor)
+
 if __name__ == "__main__":
     main()
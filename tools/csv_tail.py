@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+CSV尾部读取工具
+从文件末尾向前按块读取，只解析最后N条格式正确的记录，读取耗时与文件大小无关。
+列数与表头不一致的行（旧版本写入的记录）按已知的历史列格式映射，而不是直接丢弃。
+"""
+
+import os
+import csv
+import math
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 每次向前读取的字节数
+BLOCK_SIZE = 8192
+
+FUNDING_FIELDS = [
+    'symbol', 'mark_price', 'index_price', 'basis', 'basis_percent', 'last_funding_rate',
+    'timestamp', 'timestamp_ms'
+]
+
+# 历史上写入过的列格式，按优先级排列
+KNOWN_SCHEMAS = [
+    FUNDING_FIELDS + ['oi', 'long_short_ratio', 'long_account', 'short_account'],
+    # 旧版本获取多空比失败时写入的列
+    FUNDING_FIELDS + ['oi', 'long_short_account_ratio', 'top_trader_account_ls_ratio',
+                      'top_trader_position_ls_ratio', 'taker_buy_sell_ratio'],
+    # 旧版本没有多空比
+    FUNDING_FIELDS + ['oi'],
+    # 最早的版本没有持仓量
+    FUNDING_FIELDS,
+]
+
+TEXT_FIELDS = ('symbol', 'timestamp')
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return math.nan
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_row(fields, header):
+    """按表头或已知的历史列格式解析一行，格式不正确时返回None"""
+    if len(fields) == len(header):
+        names = header
+    else:
+        names = next((schema for schema in KNOWN_SCHEMAS if len(schema) == len(fields)), None)
+        if names is None:
+            return None
+
+    row = {}
+    for name, value in zip(names, fields):
+        if name in TEXT_FIELDS:
+            row[name] = value
+            continue
+        number = _to_number(value)
+        if number is None:
+            return None
+        row[name] = number
+
+    # 没有时间戳的行无法排序，视为损坏
+    if math.isnan(row.get('timestamp_ms', math.nan)):
+        return None
+    return row
+
+
+def read_header(path):
+    with open(path, newline='') as f:
+        line = f.readline()
+    return next(csv.reader([line]), [])
+
+
+def iter_lines_reversed(path, block_size=BLOCK_SIZE):
+    """从文件末尾向前逐行返回（不含表头），末尾没有换行符的半行会被忽略"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b''
+        first_block = True
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            if first_block:
+                first_block = False
+                # 最后一行没有换行符，说明写到一半，丢弃
+                if not buffer.endswith(b'\n'):
+                    cut = buffer.rfind(b'\n')
+                    buffer = buffer[:cut + 1] if cut >= 0 else b''
+            lines = buffer.split(b'\n')
+            # 第一段可能不完整，留到下一轮拼接
+            buffer = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        # 剩下的是文件第一行，即表头，不返回
+
+
+def read_csv_tail(path, n=None, since_ms=None):
+    """读取CSV最后n条格式正确的记录，返回按文件顺序排列的DataFrame；文件不存在时返回None
+
+    since_ms不为None时从末尾读到第一条早于since_ms的记录为止，只返回不早于since_ms的记录
+    """
+    if not os.path.exists(path):
+        return None
+    header = read_header(path)
+    if not header:
+        return None
+
+    rows = []
+    skipped = 0
+    for line in iter_lines_reversed(path):
+        fields = next(csv.reader([line.decode('utf-8', errors='replace').rstrip('\r')]), [])
+        row = parse_row(fields, header)
+        if row is None:
+            skipped += 1
+            continue
+        if since_ms is not None and row['timestamp_ms'] < since_ms:
+            break
+        rows.append(row)
+        if n is not None and len(rows) >= n:
+            break
+
+    if skipped:
+        logger.debug(f"{os.path.basename(path)}尾部有 {skipped} 行格式无法识别，已跳过")
+    rows.reverse()
+    return pd.DataFrame(rows, columns=list(dict.fromkeys(header + [key for row in rows for key in row])))
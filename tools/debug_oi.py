@@ -6,9 +6,9 @@
 """
 
 import os
-import pandas as pd
 import logging
-from crypto_monitor import CryptoMonitor
+from crypto_monitor import CryptoMonitor, MIN_HISTORY_ROWS
+from csv_tail import read_csv_tail
 
 # 设置日志
 logging.basicConfig(
@@ -22,6 +22,8 @@ def debug_oi_analysis():
     # 使用新的数据目录
     data_dir = "data_new"
     monitor = CryptoMonitor(data_dir=data_dir)
+    oi_ratio_threshold = monitor.rules.threshold('oi_ratio_threshold')
+    oi_near_threshold = monitor.rules.threshold('oi_near_threshold')
     
     # 1. 检查数据目录中的CSV文件
     logger.info(f"检查数据目录: {data_dir}")
@@ -43,7 +45,8 @@ def debug_oi_analysis():
     for csv_file in sample_files:
         file_path = os.path.join(data_dir, csv_file)
         try:
-            df = pd.read_csv(file_path, on_bad_lines='skip')
+            # 只读取文件末尾的最近记录
+            df = read_csv_tail(file_path, MIN_HISTORY_ROWS)
             
             # 检查'oi'列是否存在
             if 'oi' not in df.columns:
@@ -52,10 +55,10 @@ def debug_oi_analysis():
             
             # 检查数据点数量
             row_count = len(df)
-            logger.info(f"{csv_file} 包含 {row_count} 行数据")
+            logger.info(f"{csv_file} 最近读取到 {row_count} 行有效数据")
             
-            if row_count < 10:
-                logger.warning(f"{csv_file} 数据点不足10个，无法进行OI分析")
+            if row_count < MIN_HISTORY_ROWS:
+                logger.warning(f"{csv_file} 数据点不足{MIN_HISTORY_ROWS}个，无法进行OI分析")
                 continue
             
             # 计算OI变化
@@ -69,10 +72,10 @@ def debug_oi_analysis():
             logger.info(f"  OI增长比例: {oi_ratio:.2f}x")
             
             # 检查是否达到显著变化阈值
-            if oi_ratio > 2.0:
-                logger.info(f"  ✅ {csv_file} 的OI增长比例 {oi_ratio:.2f}x 超过阈值2.0")
+            if oi_ratio > oi_ratio_threshold:
+                logger.info(f"  ✅ {csv_file} 的OI增长比例 {oi_ratio:.2f}x 超过阈值{oi_ratio_threshold}")
             else:
-                logger.info(f"  ❌ {csv_file} 的OI增长比例 {oi_ratio:.2f}x 未超过阈值2.0")
+                logger.info(f"  ❌ {csv_file} 的OI增长比例 {oi_ratio:.2f}x 未超过阈值{oi_ratio_threshold}")
                 
         except Exception as e:
             logger.error(f"分析 {csv_file} 时出错: {str(e)}")
@@ -102,11 +105,11 @@ def debug_oi_analysis():
         logger.info("\n没有发现显著的OI变化")
         
         # 6. 检查OI比例接近阈值的交易对
-        close_to_threshold = sorted([item for item in oi_analysis_results if item['oi_ratio'] > 1.7], 
+        close_to_threshold = sorted([item for item in oi_analysis_results if item['oi_ratio'] > oi_near_threshold], 
                                    key=lambda x: x['oi_ratio'], reverse=True)
         
         if close_to_threshold:
-            logger.info("\nOI增长比例接近阈值(>1.3)的交易对:")
+            logger.info(f"\nOI增长比例接近阈值(>{oi_near_threshold})的交易对:")
             for i, item in enumerate(close_to_threshold[:10]):
                 logger.info(f"{i+1}. {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}")
         else:
@@ -114,7 +117,8 @@ def debug_oi_analysis():
     
     # 7. 建议
     logger.info("\n建议:")
-    logger.info("1. 如果没有发现显著的OI变化，可以考虑降低阈值，当前阈值是2.0(100%增长)")
+    logger.info(f"1. 如果没有发现显著的OI变化，可以运行 python tools/param_sweep.py 在历史数据上评估不同阈值的"
+                f"警报数和命中率，再调整规则配置，当前阈值是{oi_ratio_threshold}({oi_ratio_threshold - 1:.0%}增长)")
     logger.info("2. 确保数据收集正常，特别是OI数据")
     logger.info("3. 确保有足够的历史数据进行分析(至少10个数据点)")
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟交易所
+用标准库HTTP服务器模拟监控用到的Binance USDT-M接口（exchangeInfo、premiumIndex、openInterest、
+/futures/data/*多空比、openInterestHist），持仓量、标记价格和资金费率按随机游走变化，
+偶尔出现持仓量激增，用于在本地运行分片采集或压测，不消耗真实交易所的请求额度。
+market.failing中的接口路径返回503，用于模拟交易所部分接口故障。
+按客户端地址统计每分钟权重并通过X-MBX-USED-WEIGHT-1M响应头返回。
+
+用法: BINANCE_API_BASE=http://127.0.0.1:8900 python tools/crypto_monitor.py
+"""
+
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8900
+DEFAULT_SYMBOL_COUNT = 200
+# 每次读取持仓量时发生激增的概率和倍数
+SURGE_PROBABILITY = 0.002
+SURGE_FACTOR = 3.0
+# 模拟的网络延迟（秒）
+DEFAULT_LATENCY = 0.0
+
+
+class FakeMarket:
+    """随机游走的模拟行情，所有交易对的状态保存在内存中"""
+
+    def __init__(self, symbol_count=DEFAULT_SYMBOL_COUNT, seed=None):
+        self.random = random.Random(seed)
+        self.symbols = [f"FAKE{i}USDT" for i in range(symbol_count)]
+        self.state = {
+            symbol: {
+                'oi': self.random.uniform(1e5, 1e7),
+                'index_price': self.random.uniform(0.01, 100),
+                'funding_rate': self.random.gauss(0, 0.0005),
+            }
+            for symbol in self.symbols
+        }
+        # 返回503的接口路径
+        self.failing = set()
+        self.lock = threading.Lock()
+        # {(客户端地址, 分钟): 已用权重}
+        self.weights = {}
+
+    def use_weight(self, client, weight):
+        minute = int(time.time() // 60)
+        with self.lock:
+            key = (client, minute)
+            self.weights[key] = self.weights.get(key, 0) + weight
+            # 只保留当前分钟
+            for stale in [item for item in self.weights if item[1] != minute]:
+                del self.weights[stale]
+            return self.weights[key]
+
+    def _step(self, symbol):
+        state = self.state[symbol]
+        state['index_price'] *= 1 + self.random.gauss(0, 0.002)
+        state['funding_rate'] = 0.9 * state['funding_rate'] + self.random.gauss(0, 0.0002)
+        state['oi'] *= 1 + self.random.gauss(0, 0.01)
+        if self.random.random() < SURGE_PROBABILITY:
+            state['oi'] *= SURGE_FACTOR
+        return state
+
+    def exchange_info(self):
+        return {
+            'rateLimits': [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 2400},
+            ],
+            'symbols': [
+                {'symbol': symbol, 'quoteAsset': 'USDT', 'contractType': 'PERPETUAL', 'status': 'TRADING',
+                 'onboardDate': 0, 'deliveryDate': 4133404800000}
+                for symbol in self.symbols
+            ],
+        }
+
+    def premium_index(self, symbol):
+        with self.lock:
+            state = self._step(symbol)
+            mark_price = state['index_price'] * (1 + state['funding_rate'] * 10)
+            return {
+                'symbol': symbol,
+                'markPrice': f"{mark_price:.8f}",
+                'indexPrice': f"{state['index_price']:.8f}",
+                'lastFundingRate': f"{state['funding_rate']:.8f}",
+                'time': int(time.time() * 1000),
+            }
+
+    def open_interest(self, symbol):
+        with self.lock:
+            state = self._step(symbol)
+            return {'symbol': symbol, 'openInterest': f"{state['oi']:.3f}", 'time': int(time.time() * 1000)}
+
+    def long_short_ratio(self, symbol, limit=1):
+        with self.lock:
+            long_account = min(0.9, max(0.1, self.random.gauss(0.5, 0.08)))
+        timestamp = int(time.time() // 300 * 300 * 1000)
+        return [{
+            'symbol': symbol,
+            'longShortRatio': f"{long_account / (1 - long_account):.4f}",
+            'longAccount': f"{long_account:.4f}",
+            'shortAccount': f"{1 - long_account:.4f}",
+            'timestamp': timestamp - 300 * 1000 * i,
+        } for i in reversed(range(limit))]
+
+    def open_interest_hist(self, symbol, limit=30):
+        with self.lock:
+            oi = self.state[symbol]['oi']
+        timestamp = int(time.time() // 300 * 300 * 1000)
+        return [{'symbol': symbol, 'sumOpenInterest': f"{oi:.3f}", 'timestamp': timestamp - 300 * 1000 * i}
+                for i in reversed(range(limit))]
+
+
+def make_handler(market, latency=DEFAULT_LATENCY):
+    """创建绑定到market的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, status, payload, weight):
+            body = json.dumps(payload).encode()
+            used = market.use_weight(self.client_address[0], weight)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            symbol = params.get('symbol')
+            if symbol is not None and symbol not in market.state:
+                self._send(400, {'code': -1121, 'msg': 'Invalid symbol.'}, 1)
+                return
+            limit = int(params.get('limit', 30))
+            if url.path in market.failing:
+                self._send(503, {'code': -1001, 'msg': 'Service unavailable.'}, 1)
+                return
+            if url.path == '/fapi/v1/exchangeInfo':
+                self._send(200, market.exchange_info(), 1)
+            elif url.path == '/fapi/v1/premiumIndex':
+                if symbol:
+                    self._send(200, market.premium_index(symbol), 1)
+                else:
+                    self._send(200, [market.premium_index(item) for item in market.symbols], 10)
+            elif url.path == '/fapi/v1/openInterest' and symbol:
+                self._send(200, market.open_interest(symbol), 1)
+            elif url.path == '/futures/data/openInterestHist' and symbol:
+                self._send(200, market.open_interest_hist(symbol, limit), 0)
+            elif url.path.startswith('/futures/data/') and symbol:
+                self._send(200, market.long_short_ratio(symbol, limit), 0)
+            else:
+                self._send(404, {'code': -1, 'msg': f"Unknown path {url.path}"}, 1)
+
+    return Handler
+
+
+def start_server(host='127.0.0.1', port=DEFAULT_PORT, symbol_count=DEFAULT_SYMBOL_COUNT,
+                 latency=DEFAULT_LATENCY, seed=None, failing=None):
+    """在后台线程中启动模拟交易所，返回 (服务器, 基础URL)，server.market为模拟行情"""
+    market = FakeMarket(symbol_count, seed)
+    market.failing.update(failing or [])
+    server = ThreadingHTTPServer((host, port), make_handler(market, latency))
+    server.market = market
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='fake-exchange', daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"模拟交易所已启动: {base_url}，{symbol_count} 个交易对")
+    return server, base_url
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='本地模拟Binance USDT-M接口')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--symbols', type=int, default=DEFAULT_SYMBOL_COUNT, help='模拟的交易对数量')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='每个请求模拟的延迟（秒）')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+    parser.add_argument('--fail', help='逗号分隔的接口路径，这些接口返回503，例如/fapi/v1/openInterest')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    failing = [item.strip() for item in args.fail.split(',') if item.strip()] if args.fail else None
+    server, _ = start_server(args.host, args.port, args.symbols, args.latency, args.seed, failing)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+历史数据压缩工具
+把CSV中早于保留期的原始采样改写为按小时聚合的OHLC（持仓量、资金费率、标记价格、基差），
+以gzip压缩的CSV保存在archive目录，原始CSV只保留检测所需的最近数据。
+旧版本列格式的行按历史列格式修复为当前格式，无法识别的行另存到rejected文件而不是直接丢弃。
+
+监控进程内（run_monitor.py）通过compact_store运行，与后台写入共用写锁。
+命令行单独运行时拿不到监控进程的写锁，只能在监控停止时离线运行，否则可能与写入同时改写文件丢失数据。
+"""
+
+import os
+import sys
+import csv
+import glob
+import time
+import logging
+import argparse
+from contextlib import nullcontext
+
+import pandas as pd
+
+# 确保crypto_monitor可以被导入
+try:
+    from csv_tail import parse_row, read_header
+    from history_store import CsvHistoryStore, records_to_frame, RECORD_FIELDS
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from csv_tail import parse_row, read_header
+    from history_store import CsvHistoryStore, records_to_frame, RECORD_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# 原始数据默认保留24小时，远多于OI分析需要的最近10次采样
+DEFAULT_KEEP_HOURS = 24
+ARCHIVE_DIR = 'archive'
+HOUR_MS = 3600 * 1000
+
+# 聚合的字段：输出列名前缀 -> 原始列
+AGGREGATE_FIELDS = {
+    'oi': 'oi',
+    'funding_rate': 'last_funding_rate',
+    'mark_price': 'mark_price',
+    'basis_percent': 'basis_percent',
+}
+OHLC = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}
+
+
+def read_complete_rows(path):
+    """读取CSV中所有完整的行
+
+    返回 (记录列表, 修复的行数, 无法识别的原始行, 已读取的字节数)。
+    末尾没有换行符的行可能正在写入，不计入已读取的字节。
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    end = content.rfind(b'\n') + 1
+    lines = content[:end].decode('utf-8', errors='replace').splitlines()
+    header = read_header(path)
+
+    rows, rejected, repaired = [], [], 0
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        fields = next(csv.reader([line]), [])
+        row = parse_row(fields, header)
+        if row is None:
+            rejected.append(line)
+            continue
+        if len(fields) != len(RECORD_FIELDS) or header != RECORD_FIELDS:
+            repaired += 1
+        rows.append(row)
+    return rows, repaired, rejected, end
+
+
+def hourly_aggregates(df):
+    """按UTC整点把原始记录聚合为OHLC，返回以hour_ms为一列的DataFrame"""
+    df = df.sort_values('timestamp_ms', kind='stable')
+    hours = (df['timestamp_ms'].astype('int64') // HOUR_MS * HOUR_MS).rename('hour_ms')
+    grouped = df.groupby(hours)
+    result = pd.DataFrame({'samples': grouped.size()})
+    for name, field in AGGREGATE_FIELDS.items():
+        for suffix, func in OHLC.items():
+            result[f"{name}_{suffix}"] = grouped[field].agg(func)
+    return result.reset_index()
+
+
+def merge_aggregates(existing, new):
+    """合并已归档和新生成的聚合数据，同一小时的数据重新合并"""
+    if existing is None or existing.empty:
+        return new
+    df = pd.concat([existing, new], ignore_index=True).sort_values('hour_ms', kind='stable')
+    grouped = df.groupby('hour_ms')
+    result = pd.DataFrame({'samples': grouped['samples'].sum()})
+    for name in AGGREGATE_FIELDS:
+        for suffix, func in OHLC.items():
+            column = f"{name}_{suffix}"
+            result[column] = grouped[column].agg(func)
+    return result.reset_index()
+
+
+def archive_path(archive_dir, symbol):
+    return os.path.join(archive_dir, f"{symbol}_1h.csv.gz")
+
+
+def compact_file(path, archive_dir, cutoff_ms):
+    """压缩单个CSV文件，返回统计信息"""
+    symbol = os.path.basename(path)[:-len('.csv')]
+    rows, repaired, rejected, read_bytes = read_complete_rows(path)
+    stats = {'aggregated': 0, 'kept': 0, 'repaired': repaired, 'rejected': len(rejected)}
+
+    df = records_to_frame(rows)
+    old = df[df['timestamp_ms'] < cutoff_ms]
+    recent = df[df['timestamp_ms'] >= cutoff_ms]
+    stats['aggregated'] = len(old)
+    stats['kept'] = len(recent)
+    if old.empty and not repaired and not rejected:
+        return stats
+
+    os.makedirs(archive_dir, exist_ok=True)
+    if not old.empty:
+        target = archive_path(archive_dir, symbol)
+        existing = pd.read_csv(target) if os.path.exists(target) else None
+        merged = merge_aggregates(existing, hourly_aggregates(old))
+        tmp_path = f"{target}.tmp"
+        merged.to_csv(tmp_path, index=False, compression='gzip')
+        os.replace(tmp_path, target)
+
+    if rejected:
+        # 无法识别的行原样保存，便于人工检查
+        with open(os.path.join(archive_dir, f"{symbol}.rejected.csv"), 'a', newline='') as f:
+            f.write('\n'.join(rejected) + '\n')
+        logger.warning(f"{symbol}有 {len(rejected)} 行无法识别，已移到rejected文件")
+
+    # 保留的原始记录统一按当前列格式重写
+    tmp_path = f"{path}.compact"
+    recent.sort_values('timestamp_ms', kind='stable').to_csv(tmp_path, index=False, columns=RECORD_FIELDS)
+    with open(path, 'rb') as src, open(tmp_path, 'ab') as dst:
+        # 读取之后追加的数据原样接到末尾
+        src.seek(read_bytes)
+        dst.write(src.read())
+    os.replace(tmp_path, path)
+    return stats
+
+
+def compact_history(data_dir, keep_hours=DEFAULT_KEEP_HOURS, write_lock=None):
+    """压缩数据目录中所有交易对的CSV，返回汇总统计
+
+    write_lock: 与写入方共用的锁，在监控进程内运行时传入，避免与后台写入同时改写文件
+    """
+    cutoff_ms = int((time.time() - keep_hours * 3600) * 1000) // HOUR_MS * HOUR_MS
+    archive_dir = os.path.join(data_dir, ARCHIVE_DIR)
+    totals = {'files': 0, 'aggregated': 0, 'kept': 0, 'repaired': 0, 'rejected': 0}
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        try:
+            with write_lock or nullcontext():
+                stats = compact_file(path, archive_dir, cutoff_ms)
+        except Exception as e:
+            logger.error(f"压缩{os.path.basename(path)}失败: {str(e)}")
+            continue
+        totals['files'] += 1
+        for key, value in stats.items():
+            totals[key] += value
+
+    logger.info(f"历史数据压缩完成: {totals['files']} 个文件，{totals['aggregated']} 行聚合为小时数据，"
+                f"保留 {totals['kept']} 行原始数据，修复 {totals['repaired']} 行旧格式，"
+                f"{totals['rejected']} 行无法识别")
+    return totals
+
+
+def compact_store(monitor, keep_hours=DEFAULT_KEEP_HOURS):
+    """在监控进程内压缩历史存储（目前只处理CSV存储）"""
+    store = monitor.store
+    if not isinstance(store, CsvHistoryStore):
+        logger.info(f"{type(store).__name__}不需要压缩，跳过")
+        return None
+    # 先写完缓存中的记录
+    store.flush(wait=True)
+    return compact_history(store.data_dir, keep_hours, write_lock=store.write_lock)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='压缩历史CSV数据为小时聚合（只能在监控进程停止时运行）')
+    parser.add_argument('--data-dir', default='data_new', help='历史数据目录')
+    parser.add_argument('--keep-hours', type=float, default=DEFAULT_KEEP_HOURS, help='保留原始数据的小时数')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    compact_history(args.data_dir, args.keep_hours)
+
+
+if __name__ == "__main__":
+    main()
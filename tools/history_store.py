@@ -0,0 +1,707 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+历史数据存储
+CsvHistoryStore: 每个交易对一个CSV文件（原有格式），后台线程批量写入
+ParquetHistoryStore: 按日期分区的列式存储，每轮写一个小分段文件，定期合并；
+另外维护一个只保存每个交易对最近若干条记录的tail文件，读取最近数据不受历史长度影响
+SqliteHistoryStore: 单个WAL模式的SQLite数据库，(symbol, timestamp_ms)复合索引，
+适合按时间范围或按时间点跨交易对查询，采集写入时其他进程可以同时读取
+"""
+
+import io
+import os
+import math
+import csv
+import glob
+import time
+import queue
+import atexit
+import itertools
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from csv_tail import read_csv_tail, read_header, parse_row, KNOWN_SCHEMAS
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# CSV记录的标准列顺序（当前版本的列格式）
+RECORD_FIELDS = KNOWN_SCHEMAS[0]
+NUMERIC_FIELDS = [field for field in RECORD_FIELDS if field not in ('symbol', 'timestamp')]
+
+# CSV批量写入：缓存达到该条数或距上次写入超过该秒数时触发写入
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_FLUSH_INTERVAL = 30
+
+# tail文件中每个交易对保留的记录数，读取更多记录时从分区读取
+DEFAULT_TAIL_SIZE = 100
+
+# data_dir以这些后缀结尾时使用SQLite存储
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+# 数据目录中的默认数据库文件名
+SQLITE_DEFAULT_NAME = 'history.db'
+# 数据库被其他连接锁定时的最长等待时间（秒）
+SQLITE_BUSY_TIMEOUT = 30
+
+
+def records_to_frame(records):
+    """把记录列表转换为列固定、类型统一的DataFrame"""
+    df = pd.DataFrame(list(records)).reindex(columns=RECORD_FIELDS)
+    for field in NUMERIC_FIELDS:
+        df[field] = pd.to_numeric(df[field], errors='coerce')
+    df['timestamp_ms'] = df['timestamp_ms'].astype('Int64')
+    df['symbol'] = df['symbol'].astype(str)
+    df['timestamp'] = df['timestamp'].fillna('').astype(str)
+    return df
+
+
+def _truncate_partial_line(path):
+    """文件末尾如果是写到一半的行（没有换行符），将其截掉"""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # 向前找到最后一个换行符
+        position = size
+        while position > 0:
+            read_size = min(8192, position)
+            position -= read_size
+            f.seek(position)
+            cut = f.read(read_size).rfind(b'\n')
+            if cut >= 0:
+                f.truncate(position + cut + 1)
+                logger.warning(f"{os.path.basename(path)}末尾有写到一半的行，已截掉")
+                return
+        f.truncate(0)
+
+
+class CsvHistoryStore:
+    """每个交易对一个CSV文件
+
+    记录先缓存在内存中，每轮结束（或缓存达到batch_size条、距上次写入超过flush_interval秒）时
+    整批交给后台线程写入，每个文件只打开一次。崩溃时最多丢失尚未写入的一批，
+    写到一半的行会在下次写入前被截掉。
+    """
+
+    def __init__(self, data_dir, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_BATCH_FLUSH_INTERVAL):
+        self.data_dir = data_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        Path(data_dir).mkdir(parents=True, exist_ok=True)
+        self.pending = []
+        self.last_flush = time.time()
+        # 已确认表头为当前列格式的文件
+        self.current_schema = set()
+        self.lock = threading.Lock()
+        # 后台写入和回填都会改写文件，需要串行
+        self.write_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name='csv-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def path(self, symbol):
+        return os.path.join(self.data_dir, f"{symbol}.csv")
+
+    def append(self, data):
+        """缓存一条记录，达到数量或时间阈值时触发写入"""
+        with self.lock:
+            self.pending.append(data)
+            due = (len(self.pending) >= self.batch_size
+                   or time.time() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self, wait=False):
+        """把缓存的记录交给后台线程写入，wait=True时等待写完"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+            self.last_flush = time.time()
+        if batch:
+            self.queue.put(batch)
+        if wait:
+            self.queue.join()
+
+    def close(self):
+        """写入剩余记录并停止后台线程"""
+        if not self.writer.is_alive():
+            return
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+    def _writer_loop(self):
+        while True:
+            try:
+                batch = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # 长时间没有新批次时，把零散的缓存记录写出去
+                self.flush()
+                continue
+            try:
+                if batch is None:
+                    return
+                with self.write_lock:
+                    self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"批量写入CSV失败: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def _write_batch(self, batch):
+        by_symbol = {}
+        for record in batch:
+            by_symbol.setdefault(record['symbol'], []).append(record)
+
+        for symbol, records in by_symbol.items():
+            file_path = self.path(symbol)
+            try:
+                if os.path.isfile(file_path):
+                    _truncate_partial_line(file_path)
+                write_header = not os.path.isfile(file_path) or os.path.getsize(file_path) == 0
+                if not write_header and file_path not in self.current_schema:
+                    header = read_header(file_path)
+                    if header != RECORD_FIELDS:
+                        self._upgrade_schema(file_path, header)
+                self.current_schema.add(file_path)
+                # 先在内存中生成完整的行，再一次写入
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=RECORD_FIELDS, extrasaction='ignore')
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(records)
+                with open(file_path, 'a', newline='') as f:
+                    f.write(buffer.getvalue())
+            except Exception as e:
+                logger.error(f"保存{symbol}数据到CSV失败: {str(e)}")
+
+    def _upgrade_schema(self, file_path, header):
+        """旧版本表头的文件按当前列格式重写一次，新记录才能按当前列追加
+
+        旧格式的行按表头或历史列格式解析后转换，缺少的列留空；无法识别的行原样保留，
+        由压缩工具移到rejected文件
+        """
+        with open(file_path, newline='') as f:
+            f.readline()
+            lines = f.read().splitlines()
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=RECORD_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for line in lines:
+            if not line.strip():
+                continue
+            row = parse_row(next(csv.reader([line]), []), header)
+            if row is None:
+                buffer.write(line + '\r\n')
+                continue
+            row = {key: '' if isinstance(value, float) and math.isnan(value) else value for key, value in row.items()}
+            row['timestamp_ms'] = int(row['timestamp_ms'])
+            writer.writerow(row)
+
+        tmp_path = f"{file_path}.upgrade"
+        with open(tmp_path, 'w', newline='') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, file_path)
+        logger.info(f"{os.path.basename(file_path)}的表头是旧版本列格式，已按当前列格式重写")
+
+    def read_recent(self, symbol, n):
+        """读取最近n条记录，没有数据时返回None"""
+        # 只从文件末尾读取需要的行，旧格式的行按历史列格式解析
+        return read_csv_tail(self.path(symbol), n)
+
+    def read_since(self, symbol, start_ms):
+        """读取时间戳不早于start_ms的记录，没有数据时返回None"""
+        df = read_csv_tail(self.path(symbol), since_ms=start_ms)
+        if df is None or df.empty:
+            return None
+        return df
+
+    def change_markers(self, symbols):
+        """返回 {交易对: 文件的(修改时间, 大小)}，值不变说明没有新写入，只stat不读文件"""
+        markers = {}
+        for symbol in symbols:
+            try:
+                stat = os.stat(self.path(symbol))
+                markers[symbol] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                markers[symbol] = None
+        return markers
+
+    def first_timestamp_ms(self, symbol):
+        """第一条记录的时间戳，没有数据时返回None"""
+        csv_path = self.path(symbol)
+        if not os.path.exists(csv_path):
+            return None
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    return int(float(row['timestamp_ms']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return None
+
+    def backfill(self, symbol, records):
+        """把更早的记录插入到CSV开头，已有的行原样保留
+
+        先写临时文件再替换，中途崩溃不会损坏原文件。
+        """
+        if not records:
+            return 0
+        # 先写完缓存中的记录，再独占文件改写
+        self.flush(wait=True)
+        with self.write_lock:
+            return self._backfill_locked(symbol, records)
+
+    def _backfill_locked(self, symbol, records):
+        csv_path = self.path(symbol)
+        header = None
+        rest = ''
+        if os.path.exists(csv_path):
+            with open(csv_path, newline='') as f:
+                header = f.readline()
+                rest = f.read()
+        fieldnames = next(csv.reader([header])) if header and header.strip() else RECORD_FIELDS
+
+        tmp_path = f"{csv_path}.backfill"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(records)
+            f.write(rest)
+        os.replace(tmp_path, csv_path)
+        return len(records)
+
+
+class ParquetHistoryStore:
+    """按日期分区的Parquet存储
+
+    目录结构:
+        date=YYYY-MM-DD/segment-<毫秒时间戳>-*.parquet 每轮追加的小分段
+        date=YYYY-MM-DD/part.parquet                   合并后的分区文件
+        tail.parquet                                   每个交易对最近tail_size条记录
+    """
+
+    def __init__(self, root, tail_size=DEFAULT_TAIL_SIZE):
+        if pyarrow is None:
+            raise ImportError("Parquet存储需要pyarrow模块，请运行: pip install pyarrow")
+        self.root = root
+        self.tail_size = tail_size
+        self.tail_path = os.path.join(root, 'tail.parquet')
+        Path(root).mkdir(parents=True, exist_ok=True)
+        self.pending = []
+        self.lock = threading.Lock()
+        # 写分段和更新tail需要串行
+        self.write_lock = threading.Lock()
+        self.segment_seq = itertools.count()
+        self.tail_mtime = self._tail_mtime()
+        self.tail = self._load_tail()
+        self.current_date = None
+
+    def _tail_mtime(self):
+        try:
+            return os.stat(self.tail_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_tail(self):
+        if os.path.exists(self.tail_path):
+            try:
+                return pd.read_parquet(self.tail_path)
+            except Exception as e:
+                logger.warning(f"读取tail文件失败，将从分区重建: {str(e)}")
+        return self._rebuild_tail()
+
+    def _rebuild_tail(self):
+        """从最近的分区重建tail，只读取到每个交易对都够tail_size条为止"""
+        frames = []
+        for partition in reversed(self._partitions()):
+            frames.append(self._read_partition(partition))
+            counts = pd.concat(frames)['symbol'].value_counts()
+            if len(counts) and counts.min() >= self.tail_size:
+                break
+        if not frames:
+            return records_to_frame([])
+        return self._trim(pd.concat(frames, ignore_index=True))
+
+    def _trim(self, df):
+        df = df.sort_values(['symbol', 'timestamp_ms'], kind='stable')
+        return df.groupby('symbol', sort=False).tail(self.tail_size).reset_index(drop=True)
+
+    def _partitions(self):
+        return sorted(glob.glob(os.path.join(self.root, 'date=*')))
+
+    def _read_partition(self, partition, symbol=None):
+        files = sorted(glob.glob(os.path.join(partition, '*.parquet')))
+        if not files:
+            return records_to_frame([])
+        filters = [('symbol', '==', symbol)] if symbol is not None else None
+        return pd.concat([pd.read_parquet(path, filters=filters) for path in files], ignore_index=True)
+
+    def _write(self, df, path):
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def append(self, data):
+        """缓存一条记录，flush时写入"""
+        with self.lock:
+            self.pending.append(data)
+
+    def flush(self, wait=False):
+        """把本轮缓存的记录写成一个分段文件，并更新tail（同步写入，wait参数仅为与CSV存储接口一致）"""
+        with self.lock:
+            records, self.pending = self.pending, []
+        if not records:
+            return
+        self._write_segment(records_to_frame(records))
+
+    def close(self):
+        self.flush()
+
+    def _write_segment(self, df):
+        with self.write_lock:
+            self._write_segment_locked(df)
+
+    def _write_segment_locked(self, df):
+        # 按记录日期（UTC）写入对应分区
+        dates = pd.to_datetime(df['timestamp_ms'].astype('int64'), unit='ms').dt.strftime('%Y-%m-%d')
+        for date, part in df.groupby(dates):
+            partition = os.path.join(self.root, f"date={date}")
+            Path(partition).mkdir(parents=True, exist_ok=True)
+            self._write(part.reset_index(drop=True),
+                        os.path.join(partition, f"segment-{int(time.time() * 1000)}-{os.getpid()}-{next(self.segment_seq)}.parquet"))
+
+        self.tail = self._trim(pd.concat([self.tail, df], ignore_index=True))
+        self._write(self.tail, self.tail_path)
+        self.tail_mtime = self._tail_mtime()
+
+        # 进入新的一天时合并之前的分区
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        if self.current_date != today:
+            self.current_date = today
+            self.compact(before_date=today)
+
+    def compact(self, before_date=None):
+        """把每个分区的分段文件合并成一个文件，默认只合并今天之前的分区"""
+        before_date = before_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        for partition in self._partitions():
+            date = os.path.basename(partition)[len('date='):]
+            if date >= before_date:
+                continue
+            segments = glob.glob(os.path.join(partition, 'segment-*.parquet'))
+            if not segments:
+                continue
+            df = self._read_partition(partition).sort_values(['symbol', 'timestamp_ms'], kind='stable')
+            self._write(df.reset_index(drop=True), os.path.join(partition, 'part.parquet'))
+            for path in segments:
+                os.remove(path)
+            logger.info(f"已合并分区 {date} 的 {len(segments)} 个分段文件")
+
+    def read_recent(self, symbol, n):
+        """读取最近n条记录，没有数据时返回None
+
+        n不超过tail中的记录数时只读tail；超过时（例如多周期窗口按最长周期预热）
+        从最新的分区往前读取，直到凑够n条
+        """
+        df = self.tail[self.tail['symbol'] == symbol]
+        if df.empty:
+            return None
+        # tail未满说明该交易对的全部记录都在tail中
+        if n <= len(df) or len(df) < self.tail_size:
+            return df.tail(n)
+        return self._read_partitions_recent(symbol, n)
+
+    def _read_partitions_recent(self, symbol, n):
+        frames = []
+        count = 0
+        # 合并分区时会删除分段文件，读取期间不能写入
+        with self.write_lock:
+            for partition in reversed(self._partitions()):
+                df = self._read_partition(partition, symbol)
+                frames.append(df)
+                count += len(df)
+                if count >= n:
+                    break
+        df = pd.concat(frames, ignore_index=True).sort_values('timestamp_ms', kind='stable')
+        return df.tail(n).reset_index(drop=True)
+
+    def read_since(self, symbol, start_ms):
+        """读取时间戳不早于start_ms的记录，没有数据时返回None
+
+        tail已经覆盖start_ms时只读tail，否则读取start_ms所在日期及之后的分区
+        """
+        df = self.tail[self.tail['symbol'] == symbol]
+        if df.empty:
+            return None
+        if len(df) < self.tail_size or df['timestamp_ms'].min() <= start_ms:
+            df = df[df['timestamp_ms'] >= start_ms]
+        else:
+            start_date = datetime.fromtimestamp(start_ms / 1000, timezone.utc).strftime('%Y-%m-%d')
+            with self.write_lock:
+                frames = [self._read_partition(partition, symbol) for partition in self._partitions()
+                          if os.path.basename(partition)[len('date='):] >= start_date]
+            df = pd.concat(frames, ignore_index=True).sort_values('timestamp_ms', kind='stable')
+            df = df[df['timestamp_ms'] >= start_ms]
+        if df.empty:
+            return None
+        return df.reset_index(drop=True)
+
+    def change_markers(self, symbols):
+        """返回 {交易对: 最后一条记录的时间戳}
+
+        tail文件被其他进程更新过时先重新加载，没有更新时不读文件
+        """
+        mtime = self._tail_mtime()
+        if mtime != self.tail_mtime:
+            with self.write_lock:
+                self.tail_mtime = mtime
+                self.tail = self._load_tail()
+        latest = self.tail.groupby('symbol')['timestamp_ms'].max()
+        return {symbol: (int(latest[symbol]) if symbol in latest.index else None) for symbol in symbols}
+
+    def first_timestamp_ms(self, symbol):
+        """第一条记录的时间戳，从最早的分区开始查找"""
+        for partition in self._partitions():
+            df = self._read_partition(partition)
+            values = df.loc[df['symbol'] == symbol, 'timestamp_ms']
+            if len(values):
+                return int(values.min())
+        return None
+
+    def backfill(self, symbol, records):
+        """写入更早的记录"""
+        if not records:
+            return 0
+        self._write_segment(records_to_frame(records))
+        return len(records)
+
+
+class SqliteHistoryStore:
+    """WAL模式的SQLite存储
+
+    所有交易对保存在一张history表中，(symbol, timestamp_ms)上有复合索引。
+    记录先缓存在内存中，flush时用一次executemany在一个事务内写入；
+    WAL模式下写入不阻塞读取，每个线程使用自己的连接。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        Path(os.path.dirname(os.path.abspath(db_path))).mkdir(parents=True, exist_ok=True)
+        # 不为None时read_recent只返回rowid不超过该值的记录，
+        # 分片采集的聚合进程按批次读取新记录时用来避免窗口加载和逐条追加重复计入
+        self.visible_rowid = None
+        # change_markers的缓存，max_rowid变化后失效
+        self.markers_rowid = None
+        self.markers = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+        self._init_schema()
+
+    def _connect(self):
+        """返回当前线程的连接，不存在时创建"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL模式下NORMAL同步已能保证崩溃后数据库一致
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _init_schema(self):
+        columns = ', '.join(
+            f"{field} {'TEXT' if field in ('symbol', 'timestamp') else 'INTEGER' if field == 'timestamp_ms' else 'REAL'}"
+            for field in RECORD_FIELDS
+        )
+        conn = self._connect()
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS history ({columns})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_symbol_ts ON history (symbol, timestamp_ms)")
+
+    @staticmethod
+    def _row(record):
+        row = []
+        for field in RECORD_FIELDS:
+            value = record.get(field)
+            if field in ('symbol', 'timestamp'):
+                row.append(None if value is None else str(value))
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = None
+            if field == 'timestamp_ms' and value is not None:
+                value = int(value)
+            row.append(value)
+        return row
+
+    def _insert(self, records):
+        placeholders = ', '.join('?' for _ in RECORD_FIELDS)
+        rows = [self._row(record) for record in records]
+        conn = self._connect()
+        with self.write_lock, conn:
+            conn.executemany(f"INSERT INTO history ({', '.join(RECORD_FIELDS)}) VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def append(self, data):
+        """缓存一条记录，flush时写入"""
+        with self.lock:
+            self.pending.append(data)
+
+    def flush(self, wait=False):
+        """在一个事务内写入本轮缓存的所有记录（同步写入，wait参数仅为与CSV存储接口一致）"""
+        with self.lock:
+            records, self.pending = self.pending, []
+        if not records:
+            return
+        try:
+            self._insert(records)
+        except Exception as e:
+            logger.error(f"批量写入SQLite失败: {str(e)}")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+    def _query(self, sql, params=()):
+        df = pd.read_sql_query(sql, self._connect(), params=params)
+        df['timestamp_ms'] = df['timestamp_ms'].astype('Int64')
+        return df
+
+    def read_recent(self, symbol, n):
+        """读取最近n条记录，没有数据时返回None"""
+        if self.visible_rowid is None:
+            df = self._query("SELECT * FROM history WHERE symbol = ? ORDER BY timestamp_ms DESC LIMIT ?",
+                             (symbol, int(n)))
+        else:
+            df = self._query("SELECT * FROM history WHERE symbol = ? AND rowid <= ? ORDER BY timestamp_ms DESC LIMIT ?",
+                             (symbol, int(self.visible_rowid), int(n)))
+        if df.empty:
+            return None
+        return df.iloc[::-1].reset_index(drop=True)
+
+    def read_since(self, symbol, start_ms):
+        """读取时间戳不早于start_ms的记录，按时间升序，没有数据时返回None"""
+        sql = "SELECT * FROM history WHERE symbol = ? AND timestamp_ms >= ?"
+        params = [symbol, int(start_ms)]
+        if self.visible_rowid is not None:
+            sql += " AND rowid <= ?"
+            params.append(int(self.visible_rowid))
+        df = self._query(sql + " ORDER BY timestamp_ms", params)
+        if df.empty:
+            return None
+        return df
+
+    def read_range(self, symbol, start_ms=None, end_ms=None):
+        """读取一个交易对在[start_ms, end_ms)区间内的记录，按时间升序"""
+        sql = "SELECT * FROM history WHERE symbol = ?"
+        params = [symbol]
+        if start_ms is not None:
+            sql += " AND timestamp_ms >= ?"
+            params.append(int(start_ms))
+        if end_ms is not None:
+            sql += " AND timestamp_ms < ?"
+            params.append(int(end_ms))
+        return self._query(sql + " ORDER BY timestamp_ms", params)
+
+    def snapshot_at(self, timestamp_ms):
+        """每个交易对在timestamp_ms时刻（含）之前的最后一条记录"""
+        return self._query(
+            "SELECT h.* FROM history h JOIN ("
+            " SELECT symbol, MAX(timestamp_ms) AS ts FROM history WHERE timestamp_ms <= ? GROUP BY symbol"
+            ") latest ON h.symbol = latest.symbol AND h.timestamp_ms = latest.ts "
+            "ORDER BY h.symbol",
+            (int(timestamp_ms),)
+        )
+
+    def max_rowid(self):
+        """当前最后写入的记录的rowid，没有数据时返回0"""
+        row = self._connect().execute("SELECT MAX(rowid) FROM history").fetchone()
+        return row[0] or 0
+
+    def read_new(self, after_rowid, limit=None):
+        """按写入顺序读取rowid大于after_rowid的记录，结果包含rowid列"""
+        sql = "SELECT rowid, * FROM history WHERE rowid > ? ORDER BY rowid"
+        params = [int(after_rowid)]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._query(sql, params)
+
+    def change_markers(self, symbols):
+        """返回 {交易对: 最后一条记录的时间戳}
+
+        全表max_rowid没有变化时直接返回上次的结果，不逐个查询
+        """
+        rowid = self.max_rowid() if self.visible_rowid is None else self.visible_rowid
+        if rowid != self.markers_rowid:
+            self.markers_rowid = rowid
+            self.markers = {}
+        missing = [symbol for symbol in symbols if symbol not in self.markers]
+        if missing:
+            conn = self._connect()
+            for symbol in missing:
+                row = conn.execute("SELECT MAX(timestamp_ms) FROM history WHERE symbol = ? AND rowid <= ?",
+                                   (symbol, int(rowid))).fetchone()
+                self.markers[symbol] = None if row[0] is None else int(row[0])
+        return {symbol: self.markers[symbol] for symbol in symbols}
+
+    def first_timestamp_ms(self, symbol):
+        """第一条记录的时间戳，没有数据时返回None"""
+        row = self._connect().execute("SELECT MIN(timestamp_ms) FROM history WHERE symbol = ?", (symbol,)).fetchone()
+        return None if row[0] is None else int(row[0])
+
+    def backfill(self, symbol, records):
+        """写入更早的记录，查询按timestamp_ms排序，无需调整位置"""
+        if not records:
+            return 0
+        return self._insert(records)
+
+
+def resolve_storage(data_dir, storage='csv'):
+    """返回 (数据目录, 存储方式, 存储路径)
+
+    data_dir以.db/.sqlite/.sqlite3结尾时使用SQLite存储，该文件所在目录作为数据目录
+    （保存缓存和回填进度等文件）；storage='sqlite'但data_dir是目录时使用目录下的history.db。
+    """
+    if data_dir.lower().endswith(SQLITE_SUFFIXES):
+        return os.path.dirname(data_dir) or '.', 'sqlite', data_dir
+    if storage == 'sqlite':
+        return data_dir, storage, os.path.join(data_dir, SQLITE_DEFAULT_NAME)
+    return data_dir, storage, data_dir
+
+
+def create_history_store(data_dir, storage='csv'):
+    """根据storage创建历史存储"""
+    _, storage, path = resolve_storage(data_dir, storage)
+    if storage == 'csv':
+        return CsvHistoryStore(path)
+    if storage == 'parquet':
+        return ParquetHistoryStore(path)
+    if storage == 'sqlite':
+        return SqliteHistoryStore(path)
+    raise ValueError(f"不支持的存储类型: {storage}")
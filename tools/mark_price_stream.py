@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+标记价格与资金费率实时流
+订阅Binance的!markPrice@arr推送，在内存中维护每个交易对的最新数据，
+并持续调用CryptoMonitor的检测逻辑，断线后自动重连并重新订阅。
+也可以用录制的推送帧启动本地回放服务，代替真实的Binance WebSocket用于测试。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# 确保crypto_monitor可以被导入
+try:
+    from crypto_monitor import CryptoMonitor
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from crypto_monitor import CryptoMonitor
+
+logger = logging.getLogger(__name__)
+
+# Binance U本位合约WebSocket地址
+BINANCE_WS_URL = "wss://fstream.binance.com/ws"
+MARK_PRICE_STREAM = "!markPrice@arr"
+
+
+def _require_websockets():
+    if websockets is None:
+        raise ImportError("实时流模式需要websockets模块，请运行: pip install websockets")
+
+
+class MarkPriceStream:
+    """订阅全市场标记价格推送并持续检测异常信号"""
+
+    def __init__(self, monitor, url=BINANCE_WS_URL, detect_interval=5.0,
+                 max_reconnect_delay=60.0, record_path=None):
+        self.monitor = monitor
+        self.url = url
+        self.detect_interval = detect_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        self.record_path = record_path
+        # 每个交易对的最新记录，格式与CryptoMonitor.get_funding_rate相同
+        self.latest = {}
+        self.updated_at = 0.0
+        self.frames_received = 0
+        self.reconnects = 0
+        self._stop = asyncio.Event()
+
+    def handle_message(self, message):
+        """处理一条推送消息，返回更新的交易对数量"""
+        payload = json.loads(message)
+        # 订阅确认等控制消息不是列表
+        if isinstance(payload, dict):
+            payload = payload.get('data', payload)
+        if not isinstance(payload, list):
+            return 0
+
+        updated = 0
+        for item in payload:
+            if item.get('e') != 'markPriceUpdate' or not item.get('s'):
+                continue
+            symbol = item['s']
+            # 使用推送中的事件时间，保证回放时时间戳与录制时一致
+            event_time = datetime.fromtimestamp(item.get('E', time.time() * 1000) / 1000)
+            record = self.monitor._build_funding_record(symbol, {
+                'markPrice': item.get('p'),
+                'indexPrice': item.get('i'),
+                'lastFundingRate': item.get('r'),
+            }, event_time)
+            # 保留最近一次采集到的持仓量、多空比等字段
+            previous = self.latest.get(symbol)
+            if previous:
+                previous.update(record)
+            else:
+                self.latest[symbol] = record
+            updated += 1
+
+        if updated:
+            self.frames_received += 1
+            self.updated_at = time.time()
+        return updated
+
+    def snapshot(self, symbols=None):
+        """返回当前最新数据的列表，可直接传给detect_anomalies"""
+        if symbols is None:
+            return [dict(record) for record in self.latest.values()]
+        return [dict(self.latest[symbol]) for symbol in symbols if symbol in self.latest]
+
+    def detect(self):
+        """对最新数据运行一次异常检测
+        
+        实时流只推送价格和资金费率，持仓量由REST采集进程写入历史存储，
+        因此每次检测前先从存储重新加载OI窗口，否则OI比例会停留在启动时的值
+        """
+        records = self.snapshot()
+        self.monitor.refresh_windows([record['symbol'] for record in records])
+        return self.monitor.detect_anomalies(records)
+
+    def stop(self):
+        self._stop.set()
+
+    async def run(self):
+        """运行接收和检测两个任务，直到stop()被调用"""
+        _require_websockets()
+        self._stop.clear()
+        await asyncio.gather(self._receive_loop(), self._detect_loop())
+
+    async def _receive_loop(self):
+        """接收推送，断线后按指数退避重连并重新订阅"""
+        delay = 1.0
+        record_file = open(self.record_path, 'a') if self.record_path else None
+        try:
+            while not self._stop.is_set():
+                try:
+                    async with websockets.connect(self.url, ping_interval=20, max_size=None) as ws:
+                        await ws.send(json.dumps({
+                            'method': 'SUBSCRIBE',
+                            'params': [MARK_PRICE_STREAM],
+                            'id': 1
+                        }))
+                        logger.info(f"已连接 {self.url} 并订阅 {MARK_PRICE_STREAM}")
+                        delay = 1.0
+                        async for message in ws:
+                            if record_file:
+                                record_file.write(message.strip() + '\n')
+                            self.handle_message(message)
+                            if self._stop.is_set():
+                                break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"标记价格推送连接中断: {str(e)}")
+
+                if self._stop.is_set():
+                    break
+                self.reconnects += 1
+                # 加随机抖动，避免多个实例同时重连
+                wait = delay + random.uniform(0, delay / 2)
+                logger.info(f"{wait:.1f} 秒后重连（第 {self.reconnects} 次）")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            if record_file:
+                record_file.close()
+
+    async def _detect_loop(self):
+        """每隔detect_interval秒对最新数据运行一次异常检测（收到新推送时）"""
+        loop = asyncio.get_running_loop()
+        last_checked = 0.0
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.detect_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set() or self.updated_at <= last_checked:
+                continue
+            last_checked = self.updated_at
+            try:
+                # 检测中可能加载历史和发送警报，放到线程池中执行，避免阻塞接收
+                anomalies = await loop.run_in_executor(None, self.detect)
+                if anomalies:
+                    logger.info(f"实时流检测到 {len(anomalies)} 个潜在轧空信号: "
+                                f"{', '.join(item['symbol'] for item in anomalies)}")
+            except Exception as e:
+                logger.error(f"实时流异常检测出错: {str(e)}")
+
+
+async def serve_replay(frames_path, host='127.0.0.1', port=8765, interval=0.1, loop_frames=False):
+    """本地回放服务：客户端订阅后依次推送录制的帧，用于代替Binance WebSocket"""
+    _require_websockets()
+    with open(frames_path) as f:
+        frames = [line.strip() for line in f if line.strip()]
+    logger.info(f"从 {frames_path} 加载了 {len(frames)} 帧")
+
+    async def handler(ws, *args):
+        # 等待订阅请求，模拟Binance的订阅确认
+        request = json.loads(await ws.recv())
+        await ws.send(json.dumps({'result': None, 'id': request.get('id')}))
+        while True:
+            for frame in frames:
+                await ws.send(frame)
+                await asyncio.sleep(interval)
+            if not loop_frames:
+                break
+        await ws.close()
+
+    async with websockets.serve(handler, host, port, max_size=None):
+        logger.info(f"回放服务已启动: ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='标记价格实时流监控')
+    parser.add_argument('--url', default=BINANCE_WS_URL, help='WebSocket地址，可指向本地回放服务')
+    parser.add_argument('--data-dir', default='data_new', help='历史数据目录')
+    parser.add_argument('--detect-interval', type=float, default=5.0, help='异常检测间隔（秒）')
+    parser.add_argument('--alert-cooldown', type=float, default=1800, help='同一交易对警报冷却时间（秒）')
+    parser.add_argument('--record', help='将收到的推送帧追加保存到该文件')
+    parser.add_argument('--serve-replay', metavar='FRAMES', help='启动本地回放服务，推送该文件中录制的帧')
+    parser.add_argument('--port', type=int, default=8765, help='回放服务端口')
+    parser.add_argument('--interval', type=float, default=0.1, help='回放时每帧间隔（秒）')
+    args = parser.parse_args()
+
+    if args.serve_replay:
+        asyncio.run(serve_replay(args.serve_replay, port=args.port, interval=args.interval, loop_frames=True))
+        return
+
+    monitor = CryptoMonitor(data_dir=args.data_dir, alert_cooldown=args.alert_cooldown)
+    stream = MarkPriceStream(monitor, url=args.url, detect_interval=args.detect_interval,
+                             record_path=args.record)
+    try:
+        asyncio.run(stream.run())
+    except KeyboardInterrupt:
+        logger.info("实时流监控被用户中断")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多频率调度
+不同数据源按各自的自然周期轮询：资金费率/标记价格高频批量获取，持仓量每分钟更新，
+多空比只在5分钟周期边界之后获取一次。每轮检测时合并各数据源的最新状态，
+不会重复下载尚未更新的数据。
+"""
+
+import os
+import sys
+import time
+import logging
+from datetime import datetime
+
+# 确保crypto_monitor可以被导入
+try:
+    from crypto_monitor import DEFAULT_PREFILTER_THRESHOLD, DEFAULT_BACKGROUND_OI_INTERVAL, DEFAULT_LS_DATA
+    from cadence import CadenceScheduler
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from crypto_monitor import DEFAULT_PREFILTER_THRESHOLD, DEFAULT_BACKGROUND_OI_INTERVAL, DEFAULT_LS_DATA
+    from cadence import CadenceScheduler
+
+logger = logging.getLogger(__name__)
+
+# 各数据源的默认轮询间隔（秒）
+DEFAULT_FUNDING_INTERVAL = 15
+DEFAULT_OI_INTERVAL = 60
+# topLongShortAccountRatio按5分钟周期生成
+LS_PERIOD = 300
+# 周期结束后稍等片刻，等交易所生成该周期的数据
+LS_OFFSET = 15
+# 记录历史和检测的周期，放在多空比更新之后
+DEFAULT_CYCLE_INTERVAL = 300
+CYCLE_OFFSET = 30
+
+
+class MarketState:
+    """各数据源的最新数据"""
+
+    def __init__(self):
+        # {symbol: 资金费率记录}
+        self.funding = {}
+        # {symbol: (持仓量, 采样时间)}
+        self.oi = {}
+        # {symbol: (多空比数据, 所属周期)}
+        self.ls = {}
+
+    def merged_records(self, symbols, since=0.0):
+        """合并最新状态，只返回在since之后采样过持仓量的交易对，格式与collect_data相同
+
+        记录时间取持仓量的采样时间：资金费率批量请求失败或熔断时快照不再更新，
+        用快照时间会让之后各轮的记录时间戳重复
+        """
+        records = []
+        for symbol in symbols:
+            funding = self.funding.get(symbol)
+            oi = self.oi.get(symbol)
+            if not funding or not oi or oi[1] <= since:
+                continue
+            record = dict(funding)
+            record['oi'] = oi[0]
+            record['timestamp'] = datetime.fromtimestamp(oi[1]).strftime('%Y-%m-%d %H:%M:%S')
+            record['timestamp_ms'] = int(oi[1] * 1000)
+            record.update(self.ls.get(symbol, (DEFAULT_LS_DATA, None))[0])
+            records.append(record)
+        return records
+
+
+class MultiCadenceMonitor:
+    """按数据源各自的周期轮询，并定期合并状态进行检测
+
+    不使用collect_data_pipelined的流水线检测：run_cycle只合并内存中的最新状态，没有网络请求可以与检测重叠；
+    poll_open_interest也不按批次检测，记录和OI窗口按周期写入，逐批检测用到的是上一周期的窗口
+    """
+
+    def __init__(self, monitor, on_cycle=None,
+                 funding_interval=DEFAULT_FUNDING_INTERVAL,
+                 oi_interval=DEFAULT_OI_INTERVAL,
+                 cycle_interval=DEFAULT_CYCLE_INTERVAL,
+                 prefilter_threshold=DEFAULT_PREFILTER_THRESHOLD,
+                 background_interval=DEFAULT_BACKGROUND_OI_INTERVAL):
+        self.monitor = monitor
+        # on_cycle(records)：每轮合并后的分析和报告，默认只做异常检测
+        self.on_cycle = on_cycle or monitor.detect_anomalies
+        self.prefilter_threshold = prefilter_threshold
+        self.background_interval = background_interval
+        self.state = MarketState()
+        self.symbols = []
+        self.last_cycle_time = 0.0
+
+        self.scheduler = CadenceScheduler()
+        self.scheduler.add('funding', funding_interval, self.poll_funding, align=False)
+        self.scheduler.add('open_interest', oi_interval, self.poll_open_interest)
+        self.scheduler.add('long_short', LS_PERIOD, self.poll_long_short, offset=LS_OFFSET)
+        self.scheduler.add('cycle', cycle_interval, self.run_cycle, offset=CYCLE_OFFSET)
+
+    def candidates(self):
+        """当前需要获取持仓量和多空比的交易对"""
+        return self.monitor.select_tiered_symbols(self.symbols, self.state.funding,
+                                                  self.prefilter_threshold, self.background_interval)
+
+    def poll_funding(self):
+        """批量更新资金费率和标记价格"""
+        self.symbols = self.monitor.get_usdt_perpetual_symbols()
+        self.state.funding.update(self.monitor.get_all_funding_rates(self.symbols))
+
+    def poll_open_interest(self):
+        """更新候选交易对和到期的后台交易对的持仓量"""
+        if not self.state.funding:
+            self.poll_funding()
+        candidates, background = self.candidates()
+        results = self.monitor.fetch_concurrent(self.monitor.get_open_interest, candidates + background)
+        now = time.time()
+        for symbol, oi in results.items():
+            # 获取失败时get_open_interest返回None，保留上一次的有效值
+            if oi is not None:
+                self.state.oi[symbol] = (oi, now)
+                self.monitor.last_oi_sample_time[symbol] = now
+        logger.info(f"更新了 {len(results)} 个交易对的持仓量")
+
+    def poll_long_short(self):
+        """每个5分钟周期为候选交易对获取一次多空比"""
+        if not self.state.funding:
+            self.poll_funding()
+        bucket = int(time.time() // LS_PERIOD)
+        candidates, _ = self.candidates()
+        # 本周期已经获取过的不再重复下载
+        pending = [symbol for symbol in candidates if self.state.ls.get(symbol, (None, None))[1] != bucket]
+        results = self.monitor.fetch_concurrent(self.monitor.get_long_short_ratio, pending)
+        for symbol, ls_data in results.items():
+            self.state.ls[symbol] = (ls_data, bucket)
+            self.monitor.last_ls_data[symbol] = ls_data
+        self.monitor.ratio_cache.flush()
+        logger.info(f"更新了 {len(results)} 个交易对的多空比")
+
+    def run_cycle(self):
+        """合并最新状态，保存本周期采样的记录并运行检测"""
+        started = time.time()
+        records = self.state.merged_records(self.symbols, since=self.last_cycle_time)
+        self.last_cycle_time = started
+        for record in records:
+            self.monitor.save_record(record)
+        self.monitor.store.flush()
+        self.monitor.online_stats.flush()
+        self.on_cycle(records)
+
+    def run_forever(self, stop_event=None):
+        self.scheduler.run_forever(stop_event)
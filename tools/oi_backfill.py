@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+持仓量历史回填工具
+通过/futures/data/openInterestHist分批拉取历史持仓量，写入历史存储，
+让新安装或新上线的交易对无需等待即可进行OI分析。进度保存在状态文件中，中断后可继续。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# 确保crypto_monitor可以被导入
+try:
+    from crypto_monitor import CryptoMonitor, BINANCE_API_BASE, DEFAULT_MAX_CONCURRENCY, MIN_HISTORY_ROWS
+    from history_store import RECORD_FIELDS
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from crypto_monitor import CryptoMonitor, BINANCE_API_BASE, DEFAULT_MAX_CONCURRENCY, MIN_HISTORY_ROWS
+    from history_store import RECORD_FIELDS
+
+logger = logging.getLogger(__name__)
+
+OI_HIST_URL = f"{BINANCE_API_BASE}/futures/data/openInterestHist"
+# 接口单次最多返回500条，且只提供最近30天的数据
+OI_HIST_MAX_LIMIT = 500
+OI_HIST_MAX_DAYS = 30
+PERIOD_MS = {
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+}
+
+# 回填进度文件，记录每个交易对已回填到的最早时间
+BACKFILL_STATE_FILE = 'backfill_state.json'
+
+
+def fetch_oi_history(session, symbol, start_ms, end_ms, period='5m'):
+    """分批获取[start_ms, end_ms)区间内的历史持仓量，按时间升序返回"""
+    step = PERIOD_MS[period] * OI_HIST_MAX_LIMIT
+    rows = []
+    cursor = start_ms
+    while cursor < end_ms:
+        batch_end = min(end_ms - 1, cursor + step - 1)
+        response = session.get(OI_HIST_URL, params={
+            'symbol': symbol,
+            'period': period,
+            'limit': OI_HIST_MAX_LIMIT,
+            'startTime': cursor,
+            'endTime': batch_end
+        }, timeout=10)
+        data = response.json()
+        if not isinstance(data, list):
+            raise ValueError(f"返回格式异常: {str(data)[:200]}")
+        rows.extend(data)
+        cursor = batch_end + 1
+
+    # 去重并排序
+    by_time = {int(item['timestamp']): item for item in rows}
+    return [by_time[ts] for ts in sorted(by_time)]
+
+
+def to_record(symbol, item):
+    """将openInterestHist的一条数据转换为CSV记录，没有的字段留空"""
+    timestamp_ms = int(item['timestamp'])
+    record = {field: '' for field in RECORD_FIELDS}
+    record.update({
+        'symbol': symbol,
+        'timestamp': datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+        'timestamp_ms': timestamp_ms,
+        'oi': float(item['sumOpenInterest'])
+    })
+    return record
+
+
+class OIBackfiller:
+    """并发回填多个交易对的持仓量历史"""
+
+    def __init__(self, monitor, days=1, period='5m', max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.monitor = monitor
+        self.days = min(days, OI_HIST_MAX_DAYS)
+        self.period = period
+        self.max_concurrency = max_concurrency
+        self.state_path = os.path.join(monitor.data_dir, BACKFILL_STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取回填进度失败，将重新回填: {str(e)}")
+            return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def backfill_symbol(self, symbol, start_ms, end_ms):
+        """回填单个交易对，返回写入的行数"""
+        # 只回填早于已有数据的部分，避免与采集到的数据重复
+        existing_first = self.monitor.store.first_timestamp_ms(symbol)
+        if existing_first is not None:
+            end_ms = min(end_ms, existing_first)
+        if end_ms <= start_ms:
+            return 0
+
+        history = fetch_oi_history(self.monitor.session, symbol, start_ms, end_ms, self.period)
+        records = [to_record(symbol, item) for item in history if int(item['timestamp']) < end_ms]
+        written = self.monitor.store.backfill(symbol, records)
+        # 回填的记录早于窗口中的数据，让窗口重新加载
+        self.monitor.oi_window.invalidate(symbol)
+        self.monitor.timeframe_window.invalidate(symbol)
+        return written
+
+    async def run(self, symbols):
+        """并发回填，已完成的交易对会被跳过，返回 {symbol: 写入行数}"""
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - int(self.days * 24 * 3600 * 1000)
+        pending = [symbol for symbol in symbols if self.state.get(symbol, end_ms) > start_ms]
+        if not pending:
+            return {}
+        logger.info(f"开始回填 {len(pending)} 个交易对最近 {self.days} 天的持仓量历史")
+
+        loop = asyncio.get_running_loop()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            async def backfill(symbol):
+                try:
+                    written = await loop.run_in_executor(executor, self.backfill_symbol, symbol, start_ms, end_ms)
+                    results[symbol] = written
+                    # 每完成一个交易对就保存进度，中断后可以继续
+                    self.state[symbol] = start_ms
+                    self._save_state()
+                except Exception as e:
+                    logger.error(f"回填{symbol}持仓量历史失败: {str(e)}")
+
+            await asyncio.gather(*(backfill(symbol) for symbol in pending))
+
+        logger.info(f"回填完成: {len(results)} 个交易对，共写入 {sum(results.values())} 行")
+        return results
+
+
+def warm_up(monitor, symbols=None, days=1, min_rows=MIN_HISTORY_ROWS):
+    """为历史数据不足的交易对自动回填
+
+    已回填或历史数据充足的交易对会记入进度文件，之后调用不再检查。
+    """
+    if symbols is None:
+        symbols = monitor.get_usdt_perpetual_symbols()
+    backfiller = OIBackfiller(monitor, days=days)
+
+    needed = []
+    for symbol in symbols:
+        if symbol in backfiller.state:
+            continue
+        recent = monitor.load_recent_history(symbol, min_rows)
+        if recent is not None and len(recent) >= min_rows:
+            # 历史数据充足，标记为无需回填
+            backfiller.state[symbol] = 0
+        else:
+            needed.append(symbol)
+    backfiller._save_state()
+
+    if not needed:
+        return {}
+    return asyncio.run(backfiller.run(needed))
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='回填持仓量历史数据')
+    parser.add_argument('--data-dir', default='data_new', help='历史数据目录')
+    parser.add_argument('--days', type=float, default=1, help=f'回填天数（最多{OI_HIST_MAX_DAYS}天）')
+    parser.add_argument('--period', default='5m', choices=sorted(PERIOD_MS), help='数据周期')
+    parser.add_argument('--symbols', help='逗号分隔的交易对，默认全部USDT永续合约')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY, help='最大并发数')
+    parser.add_argument('--storage', default='csv', choices=['csv', 'parquet', 'sqlite'], help='历史数据存储方式')
+    args = parser.parse_args()
+
+    monitor = CryptoMonitor(data_dir=args.data_dir, storage=args.storage)
+    if args.symbols:
+        symbols = [symbol.strip().upper() for symbol in args.symbols.split(',') if symbol.strip()]
+    else:
+        symbols = monitor.get_usdt_perpetual_symbols()
+
+    backfiller = OIBackfiller(monitor, days=args.days, period=args.period, max_concurrency=args.concurrency)
+    asyncio.run(backfiller.run(symbols))
+
+
+if __name__ == "__main__":
+    main()
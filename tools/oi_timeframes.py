@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按时间划分的多周期持仓量窗口
+与按样本数划分的RollingOIWindow不同，这里比较的是固定时间长度内的OI均值（例如15分钟对1小时、
+1小时对4小时、4小时对24小时），采集间隔变化、漏采或某轮变慢都不会改变比例的含义。
+每个交易对在内存中保存覆盖最长周期的(时间戳, 持仓量)序列，只在首次访问时从历史存储读取一次，
+所有周期共用这一份数据，一次向量化计算。
+"""
+
+import time
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认比较的周期（短周期, 长周期）
+DEFAULT_TIMEFRAMES = [('15m', '1h'), ('1h', '4h'), ('4h', '24h')]
+# 数据覆盖长周期的比例达到该值才视为历史足够
+MIN_COVERAGE = 0.9
+INITIAL_CAPACITY = 512
+INITIAL_COLUMNS = 64
+
+UNIT_MS = {'m': 60 * 1000, 'h': 3600 * 1000, 'd': 24 * 3600 * 1000}
+
+
+def parse_duration(text):
+    """把'15m'、'4h'、'1d'解析为毫秒"""
+    text = str(text).strip()
+    if not text or text[-1] not in UNIT_MS:
+        raise ValueError(f"无法识别的时间长度: {text}（支持m/h/d）")
+    return int(float(text[:-1]) * UNIT_MS[text[-1]])
+
+
+def timeframe_columns(short, long):
+    """周期对应的 (比例列名, 历史是否足够列名)"""
+    return f"oi_ratio_{short}_{long}", f"has_history_{short}_{long}"
+
+
+def _ratio(short_avg, long_avg):
+    # 与oi_ratios一致，长周期均值不大于0时比例为1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(long_avg > 0, short_avg / long_avg, 1.0)
+
+
+def timeframe_series(timestamps, oi, timeframes=DEFAULT_TIMEFRAMES):
+    """对一个交易对按时间排列的整段序列计算每条记录的各周期比例，结果与逐条追加到TimeframeOIWindow相同
+
+    返回 {列名: 数组}，用于回放历史
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    oi = np.asarray(oi, dtype=float)
+    valid = ~np.isnan(oi)
+    # 前缀和：第i个位置之前（不含）的有效值之和与个数
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, oi, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    end = np.arange(1, len(oi) + 1)
+
+    means = {}
+    for duration in {parse_duration(item) for pair in timeframes for item in pair}:
+        # 窗口为 (t - duration, t]
+        start = np.searchsorted(timestamps, timestamps - duration, side='right')
+        count = counts[end] - counts[start]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means[duration] = np.where(count > 0, (sums[end] - sums[start]) / count, np.nan)
+
+    coverage = timestamps - timestamps[0] if len(timestamps) else timestamps
+    result = {}
+    for short, long in timeframes:
+        ratio_column, history_column = timeframe_columns(short, long)
+        long_ms = parse_duration(long)
+        result[ratio_column] = _ratio(means[parse_duration(short)], means[long_ms])
+        result[history_column] = coverage >= long_ms * MIN_COVERAGE
+    return result
+
+
+class TimeframeOIWindow:
+    """所有交易对共用的(时间戳, 持仓量)矩阵，每行一个交易对，最新数据在最后一列
+
+    列数不够覆盖最长周期时自动加倍，多出的旧数据在追加时自然移出。
+    """
+
+    def __init__(self, store, timeframes=DEFAULT_TIMEFRAMES):
+        self.store = store
+        self.timeframes = [(str(short), str(long)) for short, long in timeframes]
+        self.durations = sorted({parse_duration(item) for pair in self.timeframes for item in pair})
+        self.max_duration = self.durations[-1] if self.durations else 0
+        self.times = np.full((INITIAL_CAPACITY, INITIAL_COLUMNS), np.nan)
+        self.values = np.full((INITIAL_CAPACITY, INITIAL_COLUMNS), np.nan)
+        self.rows = {}
+        self.loaded = set()
+        self.lock = threading.Lock()
+
+    def _row(self, symbol):
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.times):
+                self.times = np.vstack([self.times, np.full_like(self.times, np.nan)])
+                self.values = np.vstack([self.values, np.full_like(self.values, np.nan)])
+            self.rows[symbol] = row
+        return row
+
+    def _grow_columns(self):
+        """在左侧（旧数据一侧）加倍列数"""
+        self.times = np.hstack([np.full_like(self.times, np.nan), self.times])
+        self.values = np.hstack([np.full_like(self.values, np.nan), self.values])
+
+    def _push(self, row, timestamp_ms, oi):
+        oldest = self.times[row, 0]
+        # 最旧的一列仍在最长周期内，说明列数不够，先扩容
+        if not np.isnan(oldest) and timestamp_ms - oldest < self.max_duration:
+            self._grow_columns()
+        self.times[row, :-1] = self.times[row, 1:]
+        self.values[row, :-1] = self.values[row, 1:]
+        self.times[row, -1] = timestamp_ms
+        self.values[row, -1] = oi
+
+    def _load(self, symbol, row):
+        """从历史存储加载最近一个最长周期内的记录，与采集频率无关"""
+        self.times[row] = np.nan
+        self.values[row] = np.nan
+        if not self.durations:
+            return
+        try:
+            df = self.store.read_since(symbol, time.time() * 1000 - self.max_duration)
+            if df is None or df.empty or 'oi' not in df.columns or 'timestamp_ms' not in df.columns:
+                return
+            timestamps = df['timestamp_ms'].astype(float).to_numpy()
+            values = df['oi'].astype(float).to_numpy()
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+            keep = ~np.isnan(timestamps) & (timestamps > timestamps[-1] - self.max_duration)
+            for timestamp_ms, oi in zip(timestamps[keep], values[keep]):
+                self._push(row, timestamp_ms, oi)
+        except Exception as e:
+            logger.error(f"加载{symbol}多周期持仓量历史失败: {str(e)}")
+
+    def ensure_loaded(self, symbol):
+        """确保交易对的窗口已从历史存储加载，返回行号"""
+        with self.lock:
+            row = self._row(symbol)
+            if symbol not in self.loaded:
+                self._load(symbol, row)
+                self.loaded.add(symbol)
+            return row
+
+    def append(self, symbol, timestamp_ms, oi):
+        """记录一次新的持仓量"""
+        row = self.ensure_loaded(symbol)
+        try:
+            timestamp_ms = float(timestamp_ms)
+        except (TypeError, ValueError):
+            return
+        try:
+            value = float(oi)
+        except (TypeError, ValueError):
+            value = np.nan
+        with self.lock:
+            latest = self.times[row, -1]
+            # 时间戳倒退的记录（例如重复保存）不计入
+            if not np.isnan(latest) and timestamp_ms <= latest:
+                return
+            self._push(row, timestamp_ms, value)
+
+    def latest_timestamp(self, symbol):
+        """已加载的最新一条记录的时间戳，未加载或没有数据时返回None"""
+        with self.lock:
+            row = self.rows.get(symbol)
+            if symbol not in self.loaded or row is None or np.isnan(self.times[row, -1]):
+                return None
+            return float(self.times[row, -1])
+
+    def invalidate(self, symbol):
+        """丢弃窗口，下次访问时重新从历史存储加载（例如回填之后）"""
+        with self.lock:
+            self.loaded.discard(symbol)
+
+    def evaluate(self, symbols):
+        """一次计算这些交易对所有周期的比例，返回 {列名: 数组}，行顺序与symbols一致
+
+        各周期以每个交易对最新一条记录的时间为终点
+        """
+        rows = [self.ensure_loaded(symbol) for symbol in symbols]
+        with self.lock:
+            times = self.times[rows]
+            values = self.values[rows]
+
+        latest = np.where(np.isnan(times), -np.inf, times).max(axis=1)
+        oldest = np.where(np.isnan(times), np.inf, times).min(axis=1)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+
+        means = {}
+        for duration in self.durations:
+            with np.errstate(invalid='ignore'):
+                mask = valid & (times > (latest - duration)[:, None])
+            count = mask.sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means[duration] = np.where(count > 0, (filled * mask).sum(axis=1) / count, np.nan)
+
+        coverage = latest - oldest
+        result = {}
+        for short, long in self.timeframes:
+            ratio_column, history_column = timeframe_columns(short, long)
+            long_ms = parse_duration(long)
+            result[ratio_column] = _ratio(means[parse_duration(short)], means[long_ms])
+            with np.errstate(invalid='ignore'):
+                result[history_column] = np.isfinite(coverage) & (coverage >= long_ms * MIN_COVERAGE)
+        return result
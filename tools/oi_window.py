@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存中的滚动持仓量窗口
+所有交易对的最近若干次持仓量保存在一个NumPy矩阵中（每行一个交易对，最新数据在最后一列），
+首次访问时从历史存储加载一次，之后随新记录更新，
+OI分析和异常检测都直接从矩阵计算，不再读取文件
+"""
+
+import logging
+import threading
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认比较最近3次与最近10次的OI均值
+DEFAULT_RECENT_WINDOW = 3
+DEFAULT_PAST_WINDOW = 10
+
+# 矩阵初始行数，不够时翻倍
+INITIAL_CAPACITY = 512
+
+
+def nanmean_rows(values):
+    """按行求忽略NaN的均值，全为NaN的行返回NaN（与pandas的mean一致）"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return np.nanmean(values, axis=1)
+
+
+def oi_ratios(values, recent):
+    """对窗口矩阵计算 (最近均值, 过去均值, 比例)，过去均值不大于0时比例为1"""
+    recent_avg = nanmean_rows(values[:, -recent:])
+    past_avg = nanmean_rows(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(past_avg > 0, recent_avg / past_avg, 1.0)
+    return recent_avg, past_avg, ratio
+
+
+class RollingOIWindow:
+    """所有交易对共用一个固定列数的持仓量矩阵"""
+
+    def __init__(self, store, recent=DEFAULT_RECENT_WINDOW, past=DEFAULT_PAST_WINDOW):
+        self.store = store
+        self.recent = recent
+        self.past = past
+        self.values = np.full((INITIAL_CAPACITY, past), np.nan)
+        # 每行已有的数据点数（最多past）
+        self.counts = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.rows = {}
+        self.loaded = set()
+        self.lock = threading.Lock()
+
+    def _row(self, symbol):
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.counts):
+                self.values = np.vstack([self.values, np.full_like(self.values, np.nan)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+            self.rows[symbol] = row
+        return row
+
+    def _load(self, symbol, row):
+        """从历史存储加载最近past次的持仓量"""
+        values = []
+        try:
+            df = self.store.read_recent(symbol, self.past)
+            if df is not None:
+                if 'oi' in df.columns:
+                    values = [float(value) for value in df['oi']][-self.past:]
+                else:
+                    logger.warning(f"{symbol}数据中缺少'oi'列，跳过分析")
+        except Exception as e:
+            logger.error(f"加载{symbol}持仓量历史失败: {str(e)}")
+        self.values[row] = np.nan
+        if values:
+            self.values[row, -len(values):] = values
+        self.counts[row] = len(values)
+
+    def ensure_loaded(self, symbol):
+        """确保交易对的窗口已从历史存储加载，返回行号"""
+        with self.lock:
+            row = self._row(symbol)
+            if symbol not in self.loaded:
+                self._load(symbol, row)
+                self.loaded.add(symbol)
+            return row
+
+    def append(self, symbol, oi):
+        """记录一次新的持仓量"""
+        row = self.ensure_loaded(symbol)
+        try:
+            value = float(oi)
+        except (TypeError, ValueError):
+            value = np.nan
+        with self.lock:
+            window = self.values[row]
+            window[:-1] = window[1:]
+            window[-1] = value
+            self.counts[row] = min(self.counts[row] + 1, self.past)
+
+    def invalidate(self, symbol):
+        """丢弃窗口，下次访问时重新从历史存储加载（例如回填之后）"""
+        with self.lock:
+            self.loaded.discard(symbol)
+
+    def matrix(self, symbols):
+        """返回这些交易对的 (持仓量矩阵, 数据点数)，行顺序与symbols一致"""
+        rows = [self.ensure_loaded(symbol) for symbol in symbols]
+        with self.lock:
+            return self.values[rows].copy(), self.counts[rows].copy()
+
+    def oi_ratio(self, symbol):
+        """返回 (最近均值, 过去均值, 比例)，数据点不足时返回None"""
+        values, counts = self.matrix([symbol])
+        if counts[0] < self.past:
+            return None
+        recent_avg, past_avg, ratio = oi_ratios(values, self.recent)
+        return float(recent_avg[0]), float(past_avg[0]), float(ratio[0])
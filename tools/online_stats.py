@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+逐交易对的在线统计
+对持仓量、资金费率、基差和多空比维护指数加权均值（EWMA）和指数加权方差，
+每条新记录O(1)更新，并计算新样本相对更新前状态的z-score。
+状态保存在数据目录的npz文件中，重启后继续累积，不需要重新读取历史。
+"""
+
+import os
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 统计的指标：名称 -> 记录中的字段
+METRICS = {
+    'oi': 'oi',
+    'funding': 'last_funding_rate',
+    'basis': 'basis_percent',
+    'ls': 'long_short_ratio',
+}
+
+# 默认半衰期12个样本（5分钟一轮约1小时），样本数不足min_samples时z-score视为无效
+DEFAULT_HALFLIFE = 12
+DEFAULT_MIN_SAMPLES = 12
+
+INITIAL_CAPACITY = 512
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _timestamp_ms(record):
+    value = _to_float(record.get('timestamp_ms'))
+    return 0 if np.isnan(value) else int(value)
+
+
+def ewm_zscores(values, halflife=DEFAULT_HALFLIFE, min_samples=DEFAULT_MIN_SAMPLES):
+    """对一个交易对按时间排列的整段记录（每列一个指标）一次算出逐条z-score
+
+    结果与逐条调用OnlineStats.update相同，用于回放历史
+    """
+    alpha = 1 - 0.5 ** (1 / halflife)
+    result = np.full(values.shape, np.nan)
+    for column in range(values.shape[1]):
+        valid = pd.Series(values[:, column]).dropna()
+        if valid.empty:
+            continue
+        ewm = valid.ewm(alpha=alpha, adjust=False)
+        # 与update一致，用加入本条记录之前的均值和方差
+        mean = ewm.mean().shift(1).to_numpy()
+        var = ewm.var(bias=True).shift(1).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (valid.to_numpy() - mean) / np.sqrt(var)
+        ready = (np.arange(len(valid)) >= min_samples) & (var > 0)
+        result[valid.index, column] = np.where(ready, z, np.nan)
+    return result
+
+
+class OnlineStats:
+    """所有交易对共用的EWMA/方差/z-score矩阵，每行一个交易对，每列一个指标"""
+
+    def __init__(self, path=None, halflife=DEFAULT_HALFLIFE, min_samples=DEFAULT_MIN_SAMPLES):
+        self.path = path
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.min_samples = min_samples
+        self.metrics = list(METRICS)
+        self.lock = threading.Lock()
+        self._reset(INITIAL_CAPACITY)
+        self.dirty = False
+        if path:
+            self.load()
+
+    def _reset(self, capacity):
+        shape = (capacity, len(self.metrics))
+        self.mean = np.full(shape, np.nan)
+        self.var = np.zeros(shape)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.last_z = np.full(shape, np.nan)
+        self.last_ts = np.zeros(capacity, dtype=np.int64)
+        self.rows = {}
+
+    def _row(self, symbol):
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.last_ts):
+                self.mean = np.vstack([self.mean, np.full_like(self.mean, np.nan)])
+                self.var = np.vstack([self.var, np.zeros_like(self.var)])
+                self.count = np.vstack([self.count, np.zeros_like(self.count)])
+                self.last_z = np.vstack([self.last_z, np.full_like(self.last_z, np.nan)])
+                self.last_ts = np.concatenate([self.last_ts, np.zeros_like(self.last_ts)])
+            self.rows[symbol] = row
+        return row
+
+    def _zscore(self, values, mean, var, count):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (values - mean) / np.sqrt(var)
+        return np.where((count >= self.min_samples) & (var > 0), z, np.nan)
+
+    def update(self, record):
+        """用一条记录更新统计，返回 {指标: z-score}；时间戳不晚于上次更新的记录会被忽略"""
+        values = np.array([_to_float(record.get(field)) for field in METRICS.values()])
+        timestamp_ms = _timestamp_ms(record)
+        with self.lock:
+            row = self._row(record['symbol'])
+            if timestamp_ms and timestamp_ms <= self.last_ts[row]:
+                return dict(zip(self.metrics, self.last_z[row]))
+
+            mean, var, count = self.mean[row], self.var[row], self.count[row]
+            valid = ~np.isnan(values)
+            # z-score相对更新前的状态计算，避免新样本稀释自己的偏离
+            z = self._zscore(values, mean, var, count)
+            first = valid & (count == 0)
+            rest = valid & (count > 0)
+            diff = values - mean
+            increment = self.alpha * diff
+            mean[first] = values[first]
+            mean[rest] += increment[rest]
+            var[rest] = (1 - self.alpha) * (var[rest] + diff[rest] * increment[rest])
+            count[valid] += 1
+            self.last_z[row] = np.where(valid, z, np.nan)
+            if timestamp_ms:
+                self.last_ts[row] = timestamp_ms
+            self.dirty = True
+            return dict(zip(self.metrics, self.last_z[row]))
+
+    def zscores(self, data):
+        """返回每条记录各指标的z-score矩阵（行顺序与data一致）
+
+        记录已经计入统计时直接使用当时算出的z-score，否则用当前状态计算（例如实时流数据）
+        """
+        values = np.array([[_to_float(item.get(field)) for field in METRICS.values()] for item in data])
+        values = values.reshape(len(data), len(self.metrics))
+        result = np.full(values.shape, np.nan)
+        with self.lock:
+            for i, item in enumerate(data):
+                row = self.rows.get(item['symbol'])
+                if row is None:
+                    continue
+                timestamp_ms = _timestamp_ms(item)
+                if timestamp_ms and timestamp_ms == self.last_ts[row]:
+                    result[i] = self.last_z[row]
+                else:
+                    result[i] = self._zscore(values[i], self.mean[row], self.var[row], self.count[row])
+        return result
+
+    def snapshot(self, symbol):
+        """返回交易对当前的 {指标: (均值, 标准差, 样本数)}，没有数据时返回None"""
+        with self.lock:
+            row = self.rows.get(symbol)
+            if row is None:
+                return None
+            return {metric: (float(self.mean[row, i]), float(np.sqrt(self.var[row, i])), int(self.count[row, i]))
+                    for i, metric in enumerate(self.metrics)}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if list(saved['metrics']) != self.metrics:
+                    logger.warning("在线统计的指标已变化，重新开始累积")
+                    return
+                symbols = list(saved['symbols'])
+                self._reset(max(INITIAL_CAPACITY, len(symbols)))
+                n = len(symbols)
+                self.mean[:n] = saved['mean']
+                self.var[:n] = saved['var']
+                self.count[:n] = saved['count']
+                self.last_z[:n] = saved['last_z']
+                self.last_ts[:n] = saved['last_ts']
+                self.rows = {symbol: i for i, symbol in enumerate(symbols)}
+            logger.info(f"加载了 {len(self.rows)} 个交易对的在线统计")
+        except Exception as e:
+            logger.warning(f"读取在线统计失败，将重新开始累积: {str(e)}")
+            self._reset(INITIAL_CAPACITY)
+
+    def flush(self):
+        """有更新时把状态写入文件（原子替换）"""
+        if not self.path or not self.dirty:
+            return
+        with self.lock:
+            n = len(self.rows)
+            symbols = sorted(self.rows, key=self.rows.get)
+            state = {
+                'metrics': np.array(self.metrics),
+                'symbols': np.array(symbols, dtype=str),
+                'mean': self.mean[:n].copy(),
+                'var': self.var[:n].copy(),
+                'count': self.count[:n].copy(),
+                'last_z': self.last_z[:n].copy(),
+                'last_ts': self.last_ts[:n].copy(),
+            }
+            self.dirty = False
+        try:
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, **state)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"保存在线统计失败: {str(e)}")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+阈值参数扫描
+把全部历史数据读取一次放入共享内存，按OI窗口长度（最近/过去样本数）把参数网格分配到多个进程，
+对每组 (资金费率阈值, OI增长比例阈值, 窗口长度) 统计默认轧空规则
+（资金费率绝对值 > 阈值 且 OI比例 > 阈值）的触发次数、命中率和价格上涨所需时间。
+
+警报按连续触发合并：同一交易对与上一次触发间隔不足cooldown的视为同一次警报。
+命中指警报后horizon时间内标记价格上涨至少move。
+与回测相同，只读取CSV存储中的原始采样，不支持Parquet/SQLite存储，不包含archive目录中的压缩历史。
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 确保crypto_monitor可以被导入
+try:
+    from alert_rules import load_rules
+    from backtest import forward_returns, parse_horizons, raw_csv_paths, DEFAULT_COOLDOWN
+    from history_compactor import read_complete_rows
+    from oi_window import oi_ratios
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from alert_rules import load_rules
+    from backtest import forward_returns, parse_horizons, raw_csv_paths, DEFAULT_COOLDOWN
+    from history_compactor import read_complete_rows
+    from oi_window import oi_ratios
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUNDING_GRID = '0.0005,0.00075,0.001,0.0015,0.002'
+DEFAULT_OI_RATIO_GRID = '1.3,1.5,1.7,2.0,2.5'
+DEFAULT_RECENT_GRID = '2,3,5'
+DEFAULT_PAST_GRID = '10,20'
+# 命中标准：警报后24小时内标记价格上涨至少5%
+DEFAULT_MOVE = 0.05
+DEFAULT_HORIZON = '24h'
+
+# 放入共享内存的数组
+SHARED_FIELDS = ('timestamp_ms', 'symbol_id', 'oi', 'funding_rate', 'latency_ms', 'forward_return')
+
+# 工作进程中指向共享内存的数组
+_shared = {}
+_blocks = []
+
+
+def parse_grid(text, cast=float):
+    return [cast(item) for item in text.split(',') if item.strip()]
+
+
+def _load_symbol(path):
+    rows, _, _, _ = read_complete_rows(path)
+    rows.sort(key=lambda row: row['timestamp_ms'])
+    return (np.array([row['timestamp_ms'] for row in rows], dtype=np.int64),
+            np.array([row.get('oi', np.nan) for row in rows], dtype=float),
+            np.array([row['last_funding_rate'] for row in rows], dtype=float),
+            np.array([row['mark_price'] for row in rows], dtype=float))
+
+
+def time_to_move(timestamps, prices, move, horizon_ms):
+    """每条记录之后标记价格第一次上涨至少move所需的毫秒数，horizon_ms内没有达到时为NaN"""
+    latency = np.full(len(prices), np.nan)
+    pending = np.flatnonzero(~np.isnan(prices))
+    step = 1
+    while len(pending):
+        future = pending + step
+        alive = future < len(prices)
+        pending, future = pending[alive], future[alive]
+        elapsed = timestamps[future] - timestamps[pending]
+        alive = elapsed <= horizon_ms
+        pending, future, elapsed = pending[alive], future[alive], elapsed[alive]
+        with np.errstate(invalid='ignore'):
+            moved = prices[future] / prices[pending] - 1 >= move
+        latency[pending[moved]] = elapsed[moved]
+        pending = pending[~moved]
+        step += 1
+    return latency
+
+
+def load_history(data_dir, symbols=None, move=DEFAULT_MOVE, horizon_ms=24 * 3600 * 1000, workers=None):
+    """并行读取所有交易对的原始CSV历史，返回 (交易对列表, {字段: 拼接后的数组})
+
+    与参数无关的命中时间和前向收益率在这里一次算好
+    """
+    paths = raw_csv_paths(data_dir, symbols)
+
+    names, parts = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, (timestamps, oi, funding, prices) in zip(paths, executor.map(_load_symbol, paths)):
+            if not len(timestamps):
+                continue
+            symbol_id = len(names)
+            names.append(os.path.basename(path)[:-len('.csv')])
+            parts.append({
+                'timestamp_ms': timestamps,
+                'symbol_id': np.full(len(timestamps), symbol_id, dtype=np.int32),
+                'oi': oi,
+                'funding_rate': funding,
+                'latency_ms': time_to_move(timestamps, prices, move, horizon_ms),
+                'forward_return': forward_returns(timestamps, prices, {'h': horizon_ms})['ret_h'],
+            })
+    if not parts:
+        return names, {field: np.array([]) for field in SHARED_FIELDS}
+    return names, {field: np.concatenate([part[field] for part in parts]) for field in SHARED_FIELDS}
+
+
+def share_arrays(arrays):
+    """把数组复制到共享内存，返回 (共享内存块列表, 供工作进程使用的描述)"""
+    blocks, specs = [], {}
+    for field, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        specs[field] = (block.name, array.dtype.str, array.shape)
+    return blocks, specs
+
+
+def _attach(specs):
+    """工作进程初始化：映射共享内存中的数组，不复制数据"""
+    for field, (name, dtype, shape) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _blocks.append(block)
+        _shared[field] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def rolling_oi_ratio(oi, symbol_id, recent, past):
+    """按交易对分段计算每条记录的OI比例和历史是否足够，与RollingOIWindow逐条追加的结果相同"""
+    ratio = np.full(len(oi), np.nan)
+    has_history = np.zeros(len(oi), dtype=bool)
+    boundaries = np.flatnonzero(np.diff(symbol_id)) + 1
+    for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(oi)]):
+        segment = oi[start:end]
+        padded = np.concatenate([np.full(past - 1, np.nan), segment])
+        values = np.lib.stride_tricks.sliding_window_view(padded, past)
+        _, _, ratio[start:end] = oi_ratios(values, recent)
+        has_history[start:end] = np.arange(1, len(segment) + 1) >= past
+    return ratio, has_history
+
+
+def evaluate_windows(recent, past, funding_grid, oi_ratio_grid, cooldown_ms):
+    """工作进程：对一组窗口长度计算一次OI比例，再评估所有阈值组合"""
+    timestamps = _shared['timestamp_ms']
+    symbol_id = _shared['symbol_id']
+    latency = _shared['latency_ms']
+    forward = _shared['forward_return']
+    ratio, has_history = rolling_oi_ratio(_shared['oi'], symbol_id, recent, past)
+    abs_funding = np.abs(_shared['funding_rate'])
+
+    results = []
+    for funding_threshold in funding_grid:
+        with np.errstate(invalid='ignore'):
+            base = has_history & (abs_funding > funding_threshold)
+        for oi_ratio_threshold in oi_ratio_grid:
+            with np.errstate(invalid='ignore'):
+                triggered = np.flatnonzero(base & (ratio > oi_ratio_threshold))
+            # 与同一交易对上一次触发间隔不足cooldown的合并为同一次警报
+            new = np.ones(len(triggered), dtype=bool)
+            if len(triggered) > 1:
+                same_symbol = symbol_id[triggered[1:]] == symbol_id[triggered[:-1]]
+                close = timestamps[triggered[1:]] - timestamps[triggered[:-1]] < cooldown_ms
+                new[1:] = ~(same_symbol & close)
+            alerts = triggered[new]
+            hits = ~np.isnan(latency[alerts])
+            results.append({
+                'recent': recent,
+                'past': past,
+                'funding_threshold': funding_threshold,
+                'oi_ratio_threshold': oi_ratio_threshold,
+                'triggers': len(triggered),
+                'alerts': len(alerts),
+                'symbols': len(np.unique(symbol_id[alerts])),
+                'hit_rate': hits.mean() if len(alerts) else np.nan,
+                'median_latency_min': np.median(latency[alerts][hits]) / 60000 if hits.any() else np.nan,
+                'avg_return': np.nanmean(forward[alerts]) if np.isfinite(forward[alerts]).any() else np.nan,
+            })
+    return results
+
+
+def run_sweep(data_dir, funding_grid, oi_ratio_grid, recent_grid, past_grid, symbols=None,
+              move=DEFAULT_MOVE, horizon=DEFAULT_HORIZON, cooldown=DEFAULT_COOLDOWN, workers=None):
+    """扫描参数网格，返回每组参数一行的DataFrame"""
+    horizon_ms = parse_horizons(horizon)[horizon]
+    started = time.time()
+    names, arrays = load_history(data_dir, symbols, move, horizon_ms, workers)
+    logger.info(f"加载了 {len(names)} 个交易对共 {len(arrays['timestamp_ms'])} 条记录，"
+                f"耗时 {time.time() - started:.1f} 秒")
+
+    windows = [(recent, past) for recent, past in itertools.product(recent_grid, past_grid) if recent < past]
+    blocks, specs = share_arrays(arrays)
+    del arrays
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(specs,)) as executor:
+            futures = [executor.submit(evaluate_windows, recent, past, funding_grid, oi_ratio_grid,
+                                       int(cooldown * 1000))
+                       for recent, past in windows]
+            results = [row for future in futures for row in future.result()]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    logger.info(f"评估了 {len(results)} 组参数，总耗时 {time.time() - started:.1f} 秒")
+    return pd.DataFrame(results)
+
+
+def main():
+    """主函数"""
+    rules = load_rules()
+    parser = argparse.ArgumentParser(description='在历史数据上扫描资金费率/OI比例阈值和窗口长度')
+    parser.add_argument('--data-dir', default='data_new', help='历史数据目录')
+    parser.add_argument('--symbols', help='逗号分隔的交易对，默认全部')
+    parser.add_argument('--funding', default=DEFAULT_FUNDING_GRID, help='资金费率阈值列表')
+    parser.add_argument('--oi-ratio', default=DEFAULT_OI_RATIO_GRID, help='OI增长比例阈值列表')
+    parser.add_argument('--recent', default=DEFAULT_RECENT_GRID, help='最近窗口样本数列表')
+    parser.add_argument('--past', default=DEFAULT_PAST_GRID, help='过去窗口样本数列表')
+    parser.add_argument('--move', type=float, default=DEFAULT_MOVE, help='视为命中的价格涨幅')
+    parser.add_argument('--horizon', default=DEFAULT_HORIZON, help='命中的时间范围，如24h')
+    parser.add_argument('--cooldown', type=float, default=DEFAULT_COOLDOWN, help='合并连续触发的间隔（秒）')
+    parser.add_argument('--workers', type=int, help='进程数，默认CPU核数')
+    parser.add_argument('--output', default='sweep_results.csv', help='结果输出文件')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    symbols = [symbol.strip().upper() for symbol in args.symbols.split(',')] if args.symbols else None
+    try:
+        results = run_sweep(args.data_dir, parse_grid(args.funding), parse_grid(args.oi_ratio),
+                            parse_grid(args.recent, int), parse_grid(args.past, int), symbols,
+                            args.move, args.horizon, args.cooldown, args.workers)
+    except ValueError as e:
+        logger.error(f"参数扫描失败: {str(e)}")
+        sys.exit(1)
+    if results.empty:
+        logger.info("没有可用的历史数据")
+        return
+
+    results.to_csv(args.output, index=False)
+    current = results[(results['recent'] == 3) & (results['past'] == 10)
+                      & (results['funding_threshold'] == rules.threshold('funding_threshold'))
+                      & (results['oi_ratio_threshold'] == rules.threshold('oi_ratio_threshold'))]
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        logger.info("命中率最高的参数组合（至少10次警报）:\n"
+                    + results[results['alerts'] >= 10].sort_values('hit_rate', ascending=False).head(15)
+                    .to_string(index=False))
+        if not current.empty:
+            logger.info("当前规则配置的结果:\n" + current.to_string(index=False))
+    logger.info(f"完整结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
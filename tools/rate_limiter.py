@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Binance请求权重限流器
+按各接口的请求权重做令牌桶限流，根据响应头X-MBX-USED-WEIGHT-1M校准剩余额度，
+并在收到429/418时按Retry-After全局暂停所有请求
+"""
+
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Binance U本位合约默认限额：每分钟2400权重
+DEFAULT_WEIGHT_LIMIT_1M = 2400
+# /futures/data/* 统计类接口单独限流：每5分钟1000次请求
+DEFAULT_FUTURES_DATA_LIMIT_5M = 1000
+# 只使用限额的一部分，给其他程序和时钟误差留余量
+DEFAULT_SAFETY_RATIO = 0.9
+
+# 各接口的请求权重 {路径: [(令牌桶名称, 消耗), ...]}
+# premiumIndex不带symbol时返回全市场数据，权重更高，见endpoint_cost
+ENDPOINT_WEIGHTS = {
+    '/fapi/v1/exchangeInfo': [('weight', 1)],
+    '/fapi/v1/premiumIndex': [('weight', 1)],
+    '/fapi/v1/openInterest': [('weight', 1)],
+    '/fapi/v1/fundingRate': [('weight', 1)],
+    '/fapi/v1/klines': [('weight', 5)],
+}
+FUTURES_DATA_PREFIX = '/futures/data/'
+
+
+def endpoint_cost(url, params=None):
+    """返回一次请求在各令牌桶上的消耗"""
+    path = urlparse(url).path
+    if path.startswith(FUTURES_DATA_PREFIX):
+        return [('futures_data', 1)]
+    if path == '/fapi/v1/premiumIndex' and not (params and params.get('symbol')):
+        return [('weight', 10)]
+    return ENDPOINT_WEIGHTS.get(path, [('weight', 1)])
+
+
+class TokenBucket:
+    """令牌桶：容量capacity，每period秒补满"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """还需等待多少秒才有足够的令牌"""
+        if self.tokens >= cost:
+            return 0.0
+        return (min(cost, self.capacity) - self.tokens) / self.rate
+
+
+class WeightRateLimiter:
+    """线程安全的Binance权重限流器"""
+
+    def __init__(self, weight_limit_1m=DEFAULT_WEIGHT_LIMIT_1M,
+                 futures_data_limit_5m=DEFAULT_FUTURES_DATA_LIMIT_5M,
+                 safety_ratio=DEFAULT_SAFETY_RATIO):
+        self.safety_ratio = safety_ratio
+        self.buckets = {
+            'weight': TokenBucket(weight_limit_1m * safety_ratio, 60),
+            'futures_data': TokenBucket(futures_data_limit_5m * safety_ratio, 300),
+        }
+        # 收到429/418后，在此时间点之前暂停所有请求
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, rate_limits):
+        """根据exchangeInfo中的rateLimits更新权重上限"""
+        for item in rate_limits or []:
+            if item.get('rateLimitType') != 'REQUEST_WEIGHT' or item.get('interval') != 'MINUTE':
+                continue
+            limit = float(item.get('limit', 0)) / max(int(item.get('intervalNum', 1)), 1)
+            if limit <= 0:
+                continue
+            with self.lock:
+                bucket = self.buckets['weight']
+                capacity = limit * self.safety_ratio
+                if capacity != bucket.capacity:
+                    bucket.capacity = capacity
+                    bucket.rate = capacity / 60
+                    bucket.tokens = min(bucket.tokens, capacity)
+                    logger.info(f"请求权重上限更新为 {limit:.0f}/分钟")
+
+    def acquire(self, costs):
+        """阻塞直到所有令牌桶都有足够额度，然后扣除"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    for name, cost in costs:
+                        bucket = self.buckets[name]
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_time(cost))
+                    if wait <= 0:
+                        for name, cost in costs:
+                            self.buckets[name].tokens -= cost
+                        return
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """根据X-MBX-USED-WEIGHT-1M校准本分钟剩余权重"""
+        used = headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is None:
+            return
+        try:
+            used = float(used)
+        except ValueError:
+            return
+        with self.lock:
+            bucket = self.buckets['weight']
+            bucket.refill(time.monotonic())
+            bucket.tokens = max(0.0, min(bucket.capacity, bucket.capacity - used))
+
+    def block_for(self, seconds):
+        """全局暂停所有请求seconds秒"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            for bucket in self.buckets.values():
+                bucket.tokens = 0.0
+                bucket.updated = self.blocked_until
+
+
+# 所有RateLimitedSession默认共享同一个限流器
+shared_limiter = WeightRateLimiter()
+
+
+class RateLimitedSession(requests.Session):
+    """发送前按接口权重限流的requests会话
+
+    breakers不为None时（CircuitBreakerRegistry），处于熔断状态的接口直接抛出CircuitOpenError，
+    不消耗权重；连接错误、超时和5xx响应计为失败
+    """
+
+    def __init__(self, limiter=None, max_rate_limit_retries=1, breakers=None):
+        super().__init__()
+        self.limiter = limiter or shared_limiter
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.breakers = breakers
+
+    def request(self, method, url, params=None, **kwargs):
+        if self.breakers is None:
+            return self._limited_request(method, url, params, **kwargs)
+        breaker = self.breakers.get(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"接口 {breaker.name} 熔断中，请求未发出")
+        try:
+            response = self._limited_request(method, url, params, **kwargs)
+        except requests.exceptions.RequestException:
+            breaker.record(False)
+            raise
+        breaker.record(response.status_code < 500)
+        return response
+
+    def _limited_request(self, method, url, params=None, **kwargs):
+        costs = endpoint_cost(url, params)
+        attempt = 0
+        while True:
+            self.limiter.acquire(costs)
+            response = super().request(method, url, params=params, **kwargs)
+            self.limiter.update_from_headers(response.headers)
+
+            if response.status_code not in (429, 418):
+                return response
+
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            self.limiter.block_for(retry_after)
+            logger.warning(f"触发Binance限流(状态码 {response.status_code})，全局暂停 {retry_after:.0f} 秒")
+
+            # 418表示IP已被封禁，不再重试
+            attempt += 1
+            if response.status_code == 418 or attempt > self.max_rate_limit_retries:
+                response.raise_for_status()
+                return response
+
+
+def _parse_retry_after(value, default=60.0):
+    """解析Retry-After头（秒数）"""
+    try:
+        return max(float(value), 1.0)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按周期缓存/futures/data/*统计接口的结果
+这些接口按固定周期（如5m）生成数据，同一周期内重复请求得到的结果相同，
+因此以(接口, 交易对, 周期, 周期序号)为键缓存，只有新周期开始后才重新请求；
+周期序号按数据自身的时间戳计算，而不是按请求时间
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PERIOD_MS = {
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '2h': 2 * 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '6h': 6 * 60 * 60 * 1000,
+    '12h': 12 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+# 缓存写盘的最短间隔（秒）
+DEFAULT_FLUSH_INTERVAL = 30
+
+
+def period_bucket(period, now_ms=None):
+    """返回当前时间所在的周期序号"""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    return now_ms // PERIOD_MS[period]
+
+
+class PeriodCache:
+    """周期缓存，内存中查询，定期写入磁盘以便重启后继续使用"""
+
+    def __init__(self, path=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        # {"接口|交易对|周期": [周期序号, 数据]}，每个键只保留最新周期
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(endpoint, symbol, period):
+        return f"{endpoint}|{symbol}|{period}"
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取周期缓存失败: {str(e)}")
+            self.entries = {}
+
+    def get(self, endpoint, symbol, period, now_ms=None):
+        """返回当前周期内的缓存数据，没有则返回None"""
+        key = self._key(endpoint, symbol, period)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == period_bucket(period, now_ms):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, endpoint, symbol, period, value, now_ms=None):
+        """缓存一条数据，返回是否已缓存
+
+        只缓存时间戳落在当前周期起点之后的数据，即最近一个已结束周期的数据。
+        请求跨过周期边界、交易所还没有生成新周期的数据时，返回的是上一周期的数据，
+        这时不缓存，下次调用重新请求。
+        """
+        try:
+            row_bucket = int(value['timestamp']) // PERIOD_MS[period]
+        except (KeyError, TypeError, ValueError):
+            return False
+        if row_bucket != period_bucket(period, now_ms):
+            return False
+        key = self._key(endpoint, symbol, period)
+        with self.lock:
+            self.entries[key] = [row_bucket, value]
+            self.dirty = True
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        """把缓存写入磁盘"""
+        if not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            self.last_flush = time.time()
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"保存周期缓存失败: {str(e)}")
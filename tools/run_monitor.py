@@ -8,6 +8,7 @@
 
 import time
 import logging
+import argparse
 from datetime import datetime
 import sys
 import os
@@ -23,13 +24,21 @@ except ImportError:
 
 # 确保crypto_monitor可以被导入
 try:
-    from crypto_monitor import CryptoMonitor
+    from crypto_monitor import CryptoMonitor, log_degraded_endpoints
+    from oi_backfill import warm_up
+    from multi_cadence import MultiCadenceMonitor
+    from history_compactor import compact_store
+    from cadence import CadenceScheduler
 except ImportError:
     # 如果在当前目录下找不到，尝试添加目录到系统路径
     current_dir = os.path.dirname(os.path.abspath(__file__))
     if current_dir not in sys.path:
         sys.path.append(current_dir)
-    from crypto_monitor import CryptoMonitor
+    from crypto_monitor import CryptoMonitor, log_degraded_endpoints
+    from oi_backfill import warm_up
+    from multi_cadence import MultiCadenceMonitor
+    from history_compactor import compact_store
+    from cadence import CadenceScheduler
 
 # 配置日志
 logging.basicConfig(
@@ -42,121 +51,179 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 历史数据压缩的周期和相对UTC零点的偏移（秒），两种运行方式都在每天UTC 00:10压缩
+COMPACTION_INTERVAL = 24 * 3600
+COMPACTION_OFFSET = 600
+
+# 在线统计z-score触发阈值，None表示只使用OI比例条件
+zscore_threshold = None
+
+# 监控器在多次任务之间复用，保留分层采集的采样状态
+monitor = None
+
+def get_monitor(storage='csv'):
+    """获取（必要时创建）监控器"""
+    global monitor
+    if monitor is None:
+        # 使用新的数据目录
+        monitor = CryptoMonitor(data_dir="data_new", storage=storage)
+    return monitor
+
+def report_cycle(monitor, data, anomalies=None):
+    """分析一轮收集到的数据，记录日志并发送汇总报告
+    
+    anomalies为None时在这里检测异常并发送警报，否则使用采集时已经检测并发送过的结果
+    """
+    # 记录监控开始
+    monitor_logger = logging.getLogger('monitor')
+    monitor_logger.info(f"========== 监控会话开始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========")
+    funding_threshold = monitor.rules.threshold('funding_threshold')
+    oi_near_threshold = monitor.rules.threshold('oi_near_threshold')
+    monitor_logger.info(f"监控参数: 资金费率阈值 = {funding_threshold} ({funding_threshold:.1%}), "
+                        f"OI增长比例阈值 = {monitor.rules.threshold('oi_ratio_threshold')}")
+    
+    # 记录处于熔断状态的接口
+    log_degraded_endpoints(monitor)
+    
+    # 记录收集到的交易对数量
+    if data:
+        monitor_logger.info(f"成功收集了 {len(data)} 个交易对的数据")
+    
+        # 记录极端资金费率的交易对
+        extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
+        if extreme_funding:
+            monitor_logger.info(f"发现 {len(extreme_funding)} 个极端资金费率的交易对:")
+            for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:  # 只显示前10个
+                monitor_logger.info(f"  {item['symbol']}: 资金费率 = {item['last_funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}, 基差 = {item['basis_percent']:.2f}%")
+    else:
+        monitor_logger.info("没有收集到数据，请检查网络连接和API状态")
+    
+    # 分析OI变化
+    oi_analysis_results, significant_oi_changes = monitor.analyze_oi_changes(data)
+    
+    # 记录显著的OI变化
+    if significant_oi_changes:
+        monitor_logger.info(f"\n发现 {len(significant_oi_changes)} 个显著的OI变化:")
+        for item in significant_oi_changes[:10]:  # 只显示前10个
+            monitor_logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
+    
+    # 检测异常信号
+    if anomalies is None:
+        logger.info("检测异常信号...")
+        anomalies = monitor.detect_anomalies(data, zscore_threshold=zscore_threshold)
+    
+    if anomalies:
+        monitor_logger.info(f"❗ 检测到 {len(anomalies)} 个潜在轧空信号 ❗")
+        for anomaly in anomalies:
+            monitor_logger.info(f"潜在轧空信号: {anomaly['symbol']}, 资金费率: {anomaly['funding_rate']:.4%}, OI增长: {anomaly['oi_ratio']:.2f}x, 标记价格: {anomaly['mark_price']:.4f}")
+            logger.info(f"潜在轧空信号: {anomaly['symbol']}, 资金费率: {anomaly['funding_rate']:.4%}, OI增长: {anomaly['oi_ratio']:.2f}x")
+    else:
+        monitor_logger.info("本次监控未检测到异常信号")
+        logger.info("未检测到异常信号")
+    
+    # 发送汇总信息到Telegram
+    # 检查是否有异常费率的交易对
+    extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
+    
+    # 当有异常费率、OI显著变化或异常信号时发送通知
+    if extreme_funding or significant_oi_changes or anomalies:
+        try:
+            # 构建消息
+            message = f"📊 监控汇总报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    
+            # 添加异常费率信息
+            extreme_funding = [item for item in data if abs(item['last_funding_rate']) > funding_threshold]
+            if extreme_funding:
+                message += f"\n\n🔴 异常费率交易对 ({len(extreme_funding)})个):\n"
+                for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:
+                    message += f"  • {item['symbol']}: {item['last_funding_rate']:.4%}\n"
+                message += "\n"
+    
+            # 添加OI增长信息
+            if significant_oi_changes:
+                message += f"📈 OI显著增长交易对 ({len(significant_oi_changes)})个):\n"
+                for item in sorted(significant_oi_changes, key=lambda x: x['oi_ratio'], reverse=True)[:10]:
+                    message += f"  • {item['symbol']}: {item['oi_ratio']:.2f}x\n"
+                message += "\n"
+    
+            # 添加异常信号信息
+            if anomalies:
+                message += f"⚠️ 潜在轧空信号 ({len(anomalies)})个):\n"
+                for anomaly in anomalies:
+                    message += f"  • {anomaly['symbol']}: 费率={anomaly['funding_rate']:.4%}, OI={anomaly['oi_ratio']:.2f}x\n"
+    
+            # 发送消息
+            from crypto_monitor import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+            if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
+                url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+                payload = {
+                    'chat_id': TELEGRAM_CHAT_ID,
+                    'text': message
+                }
+                import requests
+                requests.post(url, data=payload)
+                logger.info("已发送监控汇总报告到Telegram")
+            else:
+                logger.warning("未配置Telegram Bot，跳过发送汇总报告")
+        except Exception as e:
+            logger.error(f"发送汇总报告时出错: {str(e)}")
+    
+    close_to_threshold = [item for item in oi_analysis_results if item['oi_ratio'] > oi_near_threshold]
+    if close_to_threshold:
+        logger.info(f"\nOI增长比例接近阈值(>{oi_near_threshold})的交易对:")
+        for item in close_to_threshold:
+            logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
+    
+    # 记录监控结束
+    monitor_logger.info(f"========== 监控会话结束: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========\n")
+
 def run_monitor_job():
     """运行监控任务"""
     logger.info(f"开始监控任务 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     try:
-        # 使用新的数据目录
-        monitor = CryptoMonitor(data_dir="data_new")
+        monitor = get_monitor()
         
-        # 记录监控开始
-        monitor_logger = logging.getLogger('monitor')
-        monitor_logger.info(f"========== 监控会话开始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========")
-        monitor_logger.info(f"监控参数: 资金费率阈值 = 0.001 (0.1%), OI增长比例阈值 = 2.0")
+        # 为历史数据不足的交易对（新安装或新上线）回填持仓量历史
+        try:
+            warm_up(monitor)
+        except Exception as e:
+            logger.error(f"回填持仓量历史失败: {str(e)}")
         
-        # 收集数据
+        # 收集数据，每个交易对到达后立即检测并发送警报
         logger.info("开始收集数据...")
-        data = monitor.collect_data()
-        
-        # 记录收集到的交易对数量
-        if data:
-            monitor_logger.info(f"成功收集了 {len(data)} 个交易对的数据")
-            
-            # 记录极端资金费率的交易对
-            extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
-            if extreme_funding:
-                monitor_logger.info(f"发现 {len(extreme_funding)} 个极端资金费率的交易对:")
-                for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:  # 只显示前10个
-                    monitor_logger.info(f"  {item['symbol']}: 资金费率 = {item['last_funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}, 基差 = {item['basis_percent']:.2f}%")
-        else:
-            monitor_logger.info("没有收集到数据，请检查网络连接和API状态")
+        data, anomalies = monitor.collect_data_pipelined(tiered=True, zscore_threshold=zscore_threshold)
         
-        # 分析OI变化
-        _, significant_oi_changes = monitor.analyze_oi_changes(data)
-        
-        # 记录显著的OI变化
-        if significant_oi_changes:
-            monitor_logger.info(f"\n发现 {len(significant_oi_changes)} 个显著的OI变化:")
-            for item in significant_oi_changes[:10]:  # 只显示前10个
-                monitor_logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
-        
-        # 检测异常信号
-        logger.info("检测异常信号...")
-        anomalies = monitor.detect_anomalies(data)
-        
-        if anomalies:
-            monitor_logger.info(f"❗ 检测到 {len(anomalies)} 个潜在轧空信号 ❗")
-            for anomaly in anomalies:
-                monitor_logger.info(f"潜在轧空信号: {anomaly['symbol']}, 资金费率: {anomaly['funding_rate']:.4%}, OI增长: {anomaly['oi_ratio']:.2f}x, 标记价格: {anomaly['mark_price']:.4f}")
-                logger.info(f"潜在轧空信号: {anomaly['symbol']}, 资金费率: {anomaly['funding_rate']:.4%}, OI增长: {anomaly['oi_ratio']:.2f}x")
-        else:
-            monitor_logger.info("本次监控未检测到异常信号")
-            logger.info("未检测到异常信号")
-        
-        # 发送汇总信息到Telegram
-        # 检查是否有异常费率的交易对
-        extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
-        
-        # 当有异常费率、OI显著变化或异常信号时发送通知
-        if extreme_funding or significant_oi_changes or anomalies:
-            try:
-                # 构建消息
-                message = f"📊 监控汇总报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                
-                # 添加异常费率信息
-                extreme_funding = [item for item in data if abs(item['last_funding_rate']) > 0.001]
-                if extreme_funding:
-                    message += f"\n\n🔴 异常费率交易对 ({len(extreme_funding)})个):\n"
-                    for item in sorted(extreme_funding, key=lambda x: abs(x['last_funding_rate']), reverse=True)[:10]:
-                        message += f"  • {item['symbol']}: {item['last_funding_rate']:.4%}\n"
-                    message += "\n"
-                
-                # 添加OI增长信息
-                if significant_oi_changes:
-                    message += f"📈 OI显著增长交易对 ({len(significant_oi_changes)})个):\n"
-                    for item in sorted(significant_oi_changes, key=lambda x: x['oi_ratio'], reverse=True)[:10]:
-                        message += f"  • {item['symbol']}: {item['oi_ratio']:.2f}x\n"
-                    message += "\n"
-                
-                # 添加异常信号信息
-                if anomalies:
-                    message += f"⚠️ 潜在轧空信号 ({len(anomalies)})个):\n"
-                    for anomaly in anomalies:
-                        message += f"  • {anomaly['symbol']}: 费率={anomaly['funding_rate']:.4%}, OI={anomaly['oi_ratio']:.2f}x\n"
-                
-                # 发送消息
-                from crypto_monitor import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
-                if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-                    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                    payload = {
-                        'chat_id': TELEGRAM_CHAT_ID,
-                        'text': message
-                    }
-                    import requests
-                    requests.post(url, data=payload)
-                    logger.info("已发送监控汇总报告到Telegram")
-                else:
-                    logger.warning("未配置Telegram Bot，跳过发送汇总报告")
-            except Exception as e:
-                logger.error(f"发送汇总报告时出错: {str(e)}")
-        
-        close_to_threshold = [item for item in data if item['oi_ratio'] > 1.7]
-        if close_to_threshold:
-            logger.info("\nOI增长比例接近阈值(>1.7)的交易对:")
-            for item in close_to_threshold:
-                logger.info(f"  {item['symbol']}: OI增长比例 = {item['oi_ratio']:.2f}x, 资金费率 = {item['funding_rate']:.4%}, 标记价格 = {item['mark_price']:.4f}")
-        
-        # 记录监控结束
-        monitor_logger.info(f"========== 监控会话结束: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========\n")
+        report_cycle(monitor, data, anomalies)
     except Exception as e:
         logger.error(f"监控任务执行失败: {str(e)}")
     
     logger.info(f"监控任务完成 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("-" * 50)
 
-def main():
-    """主函数"""
-    logger.info("启动加密货币轧空监控定时任务")
+def run_multi_cadence():
+    """多频率运行：各数据源按自己的周期轮询，每5分钟合并最新状态进行检测"""
+    logger.info("资金费率每15秒、持仓量每分钟、多空比每5分钟周期更新一次，每5分钟检测一次")
+    monitor = get_monitor()
+    
+    def on_cycle(records):
+        # 为新上线的交易对回填持仓量历史
+        try:
+            warm_up(monitor, symbols=scheduler.symbols)
+        except Exception as e:
+            logger.error(f"回填持仓量历史失败: {str(e)}")
+        report_cycle(monitor, records)
+    
+    scheduler = MultiCadenceMonitor(monitor, on_cycle=on_cycle)
+    # 每天UTC 00:10把过期的原始数据压缩为小时聚合
+    scheduler.scheduler.add('compaction', COMPACTION_INTERVAL, lambda: compact_store(monitor),
+                            offset=COMPACTION_OFFSET)
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        logger.info("监控程序被用户中断")
+
+def run_legacy_schedule():
+    """旧的运行方式：每5分钟完整运行一次监控任务"""
     logger.info("将每5分钟运行一次监控")
     
     # 立即运行一次
@@ -164,11 +231,16 @@ def main():
     
     # 设置定时任务，每5分钟运行一次
     schedule.every(5).minutes.do(run_monitor_job)
+    # 每天UTC 00:10压缩一次历史数据（schedule按本地时间计时，压缩与多频率模式一样按UTC对齐）
+    compaction = CadenceScheduler()
+    compaction.add('compaction', COMPACTION_INTERVAL, lambda: compact_store(get_monitor()),
+                   offset=COMPACTION_OFFSET)
     
     # 持续运行定时任务
     while True:
         try:
             schedule.run_pending()
+            compaction.run_pending()
             time.sleep(1)
         except KeyboardInterrupt:
             logger.info("监控程序被用户中断")
@@ -178,5 +250,23 @@ def main():
             # 短暂暂停后继续
             time.sleep(10)
 
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='加密货币轧空监控定时任务')
+    parser.add_argument('--legacy', action='store_true', help='每5分钟完整运行一次监控，不按数据源分别轮询')
+    parser.add_argument('--storage', default='csv', choices=['csv', 'parquet', 'sqlite'], help='历史数据存储方式')
+    parser.add_argument('--zscore-threshold', type=float,
+                        help='同时以OI和资金费率的z-score超过该值作为额外触发条件（例如3）')
+    args = parser.parse_args()
+    
+    global zscore_threshold
+    zscore_threshold = args.zscore_threshold
+    get_monitor(args.storage)
+    logger.info("启动加密货币轧空监控定时任务")
+    if args.legacy:
+        run_legacy_schedule()
+    else:
+        run_multi_cadence()
+
 if __name__ == "__main__":
     main()
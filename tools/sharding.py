@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分片采集
+多个采集进程按一致性哈希各自负责交易对集合的一部分，把记录写入共用的SQLite历史存储
+（WAL模式，多个进程可以同时写入）；单独的聚合进程按写入顺序读取新记录，更新内存中的OI窗口和在线统计，
+运行检测并发送警报。每个采集进程有自己的HTTP会话和限流器，可以通过不同的代理出口分摊请求权重；
+增减采集进程时只有约1/N的交易对改变归属。
+
+Binance按出口IP计算请求权重。多个采集进程共用一个出口时，各自的WeightRateLimiter只拿到
+1/egress_shards的额度（默认没有代理时为全部分片数），否则每个进程都以为自己独占整份额度，合计会超限。
+
+用法:
+    python tools/sharding.py local --shards 4 --fake-exchange     # 本地多进程 + 模拟交易所
+    python tools/sharding.py collector --shard-id 0 --shards 4    # 单个采集进程
+    python tools/sharding.py aggregator                           # 聚合进程
+"""
+
+import os
+import sys
+import time
+import bisect
+import signal
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+
+import pandas as pd
+
+# 确保crypto_monitor可以被导入
+try:
+    from crypto_monitor import CryptoMonitor
+    from cadence import CadenceScheduler
+    from history_store import SqliteHistoryStore
+    from fake_exchange import start_server
+    from rate_limiter import WeightRateLimiter, DEFAULT_SAFETY_RATIO
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if current_dir not in sys.path:
+        sys.path.append(current_dir)
+    from crypto_monitor import CryptoMonitor
+    from cadence import CadenceScheduler
+    from history_store import SqliteHistoryStore
+    from fake_exchange import start_server
+    from rate_limiter import WeightRateLimiter, DEFAULT_SAFETY_RATIO
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('data_new', 'history.db')
+# 每个分片在哈希环上的虚拟节点数
+DEFAULT_REPLICAS = 100
+# 采集周期和聚合进程读取新记录的间隔（秒）
+DEFAULT_COLLECT_INTERVAL = 300
+DEFAULT_POLL_INTERVAL = 5
+# 聚合进程每次最多读取的记录数
+DEFAULT_BATCH_LIMIT = 50000
+
+
+def shard_names(count):
+    """分片名称，名称不随分片数变化，增加分片时已有分片在环上的位置不变"""
+    return [f"shard-{i}" for i in range(count)]
+
+
+class HashRing:
+    """一致性哈希环"""
+
+    def __init__(self, nodes, replicas=DEFAULT_REPLICAS):
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("哈希环至少需要一个节点")
+        self.ring = sorted((self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def owner(self, key):
+        """负责该键的节点：环上顺时针方向的第一个虚拟节点"""
+        position = bisect.bisect(self.keys, self._hash(key)) % len(self.keys)
+        return self.ring[position][1]
+
+    def partition(self, keys):
+        """按节点划分键，返回 {节点: [键]}"""
+        result = {node: [] for node in self.nodes}
+        for key in keys:
+            result[self.owner(key)].append(key)
+        return result
+
+
+def _install_stop_handlers(stop_event):
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+
+def run_collector(db_path, shard_id, shards, interval=DEFAULT_COLLECT_INTERVAL, proxy=None, stop_event=None,
+                  egress_shards=None):
+    """采集进程：每interval秒采集本分片负责的交易对并写入共用存储，不做检测
+
+    egress_shards: 与本进程共用同一出口IP的采集进程数（含本进程），请求权重额度按该数均分；
+        默认有代理时为1，没有代理时为shards
+    """
+    if not 0 <= shard_id < shards:
+        raise ValueError(f"分片编号应在0到{shards - 1}之间: {shard_id}")
+    if egress_shards is None:
+        egress_shards = 1 if proxy else shards
+    name = shard_names(shards)[shard_id]
+    ring = HashRing(shard_names(shards))
+    # 缓存和在线统计按分片分开保存，避免多个进程写同一个文件
+    state_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'shards', name)
+    monitor = CryptoMonitor(data_dir=db_path, storage='sqlite', state_dir=state_dir)
+    if proxy:
+        monitor.session.proxies.update({'http': proxy, 'https': proxy})
+    # 每个进程使用独立的限流器，额度按共用出口的进程数均分
+    monitor.session.limiter = WeightRateLimiter(safety_ratio=DEFAULT_SAFETY_RATIO / max(int(egress_shards), 1))
+
+    def collect():
+        symbols = monitor.get_usdt_perpetual_symbols()
+        owned = [symbol for symbol in symbols if ring.owner(symbol) == name]
+        started = time.time()
+        data = monitor.collect_data_concurrent(symbols=owned)
+        logger.info(f"{name}: 采集了 {len(data)}/{len(owned)} 个交易对，耗时 {time.time() - started:.1f} 秒")
+
+    stop_event = stop_event or threading.Event()
+    _install_stop_handlers(stop_event)
+    scheduler = CadenceScheduler()
+    scheduler.add(f"collect-{name}", interval, collect)
+    logger.info(f"采集进程 {name} 启动（共 {shards} 个分片），每 {interval} 秒采集一次")
+    try:
+        scheduler.run_forever(stop_event)
+    finally:
+        monitor.store.close()
+        monitor.ratio_cache.flush()
+
+
+class ShardAggregator:
+    """聚合进程：按写入顺序读取各采集进程写入的新记录，更新内存状态并检测异常"""
+
+    def __init__(self, monitor, zscore_threshold=None, batch_limit=DEFAULT_BATCH_LIMIT):
+        if not isinstance(monitor.store, SqliteHistoryStore):
+            raise ValueError("分片采集需要共用的SQLite历史存储")
+        self.monitor = monitor
+        self.store = monitor.store
+        self.zscore_threshold = zscore_threshold
+        self.batch_limit = batch_limit
+        # 从启动时的最后一条记录之后开始读取，之前的记录由窗口按需从存储加载
+        self.cursor = self.store.max_rowid()
+        self.store.visible_rowid = self.cursor
+        self.last_ts = {}
+
+    def poll(self):
+        """处理一批新记录，返回检测到的异常信号"""
+        df = self.store.read_new(self.cursor, self.batch_limit)
+        if df.empty:
+            return []
+        latest = {}
+        for record in df.drop(columns=['rowid']).to_dict('records'):
+            symbol = record['symbol']
+            timestamp_ms = record.get('timestamp_ms')
+            timestamp_ms = None if pd.isna(timestamp_ms) else int(timestamp_ms)
+            record['timestamp_ms'] = timestamp_ms
+            # 回填写入的更早记录不计入滚动窗口
+            last = self.last_ts.get(symbol)
+            if last is not None and timestamp_ms is not None and timestamp_ms <= last:
+                continue
+            # 首次出现的交易对从存储加载本批次之前的记录，再逐条追加本批次的记录
+            self.monitor.ingest_record(record)
+            if timestamp_ms is not None:
+                self.last_ts[symbol] = timestamp_ms
+            latest[symbol] = record
+        self.cursor = int(df['rowid'].iloc[-1])
+        self.store.visible_rowid = self.cursor
+        self.monitor.online_stats.flush()
+
+        anomalies = self.monitor.detect_anomalies(list(latest.values()), zscore_threshold=self.zscore_threshold)
+        logger.info(f"聚合了 {len(df)} 条新记录（{len(latest)} 个交易对），检测到 {len(anomalies)} 个异常信号")
+        return anomalies
+
+    def run_forever(self, interval=DEFAULT_POLL_INTERVAL, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        scheduler = CadenceScheduler()
+        scheduler.add('aggregate', interval, self.poll)
+        try:
+            scheduler.run_forever(stop_event)
+        finally:
+            self.monitor.online_stats.flush()
+
+
+def run_aggregator(db_path, interval=DEFAULT_POLL_INTERVAL, alert_cooldown=0, zscore_threshold=None,
+                   stop_event=None):
+    """聚合进程入口"""
+    monitor = CryptoMonitor(data_dir=db_path, storage='sqlite', alert_cooldown=alert_cooldown)
+    aggregator = ShardAggregator(monitor, zscore_threshold)
+    stop_event = stop_event or threading.Event()
+    _install_stop_handlers(stop_event)
+    logger.info(f"聚合进程启动，每 {interval} 秒读取一次新记录")
+    aggregator.run_forever(interval, stop_event)
+    return aggregator
+
+
+def run_local(shards, db_path=DEFAULT_DB_PATH, fake_exchange=False, symbol_count=None, latency=0.0,
+              interval=DEFAULT_COLLECT_INTERVAL, poll_interval=DEFAULT_POLL_INTERVAL, proxies=None,
+              alert_cooldown=0, zscore_threshold=None, duration=None):
+    """在本机启动shards个采集进程，当前进程作为聚合进程；fake_exchange=True时先启动模拟交易所"""
+    server = None
+    if fake_exchange:
+        server, base_url = start_server(port=0, symbol_count=symbol_count or 200, latency=latency)
+        # 采集进程以spawn方式启动，导入crypto_monitor时读取该环境变量
+        os.environ['BINANCE_API_BASE'] = base_url
+
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    assigned = [proxies[shard_id % len(proxies)] if proxies else None for shard_id in range(shards)]
+    for shard_id, proxy in enumerate(assigned):
+        process = context.Process(target=run_collector, name=f"collector-{shard_id}",
+                                  args=(db_path, shard_id, shards, interval, proxy, None, assigned.count(proxy)))
+        process.start()
+        workers.append(process)
+
+    stop_event = threading.Event()
+    if duration:
+        threading.Timer(duration, stop_event.set).start()
+    try:
+        run_aggregator(db_path, poll_interval, alert_cooldown, zscore_threshold, stop_event)
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+        if server is not None:
+            server.shutdown()
+        logger.info("所有采集进程已退出")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='分片采集：多个采集进程 + 单个聚合进程')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    local = subparsers.add_parser('local', help='在本机启动所有采集进程，当前进程作为聚合进程')
+    local.add_argument('--shards', type=int, default=2, help='采集进程数')
+    local.add_argument('--fake-exchange', action='store_true', help='使用本地模拟交易所')
+    local.add_argument('--symbols', type=int, help='模拟交易所的交易对数量')
+    local.add_argument('--latency', type=float, default=0.0, help='模拟交易所每个请求的延迟（秒）')
+    local.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='聚合进程读取间隔（秒）')
+    local.add_argument('--proxies', help='逗号分隔的代理地址，依次分配给各采集进程')
+    local.add_argument('--duration', type=float, help='运行多少秒后退出，默认一直运行')
+
+    collector = subparsers.add_parser('collector', help='运行一个采集进程')
+    collector.add_argument('--shard-id', type=int, required=True, help='本进程的分片编号（从0开始）')
+    collector.add_argument('--shards', type=int, required=True, help='分片总数')
+    collector.add_argument('--proxy', help='本进程使用的代理地址')
+    collector.add_argument('--egress-shards', type=int,
+                           help='与本进程共用同一出口IP的采集进程数，请求权重额度按该数均分（默认有代理时为1，否则为分片总数）')
+
+    aggregator = subparsers.add_parser('aggregator', help='运行聚合进程')
+    aggregator.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='读取间隔（秒）')
+
+    for sub in (local, collector, aggregator):
+        sub.add_argument('--db', default=DEFAULT_DB_PATH, help='共用的SQLite历史数据库')
+    for sub in (local, collector):
+        sub.add_argument('--interval', type=float, default=DEFAULT_COLLECT_INTERVAL, help='采集间隔（秒）')
+    for sub in (local, aggregator):
+        sub.add_argument('--alert-cooldown', type=float, default=0, help='同一交易对两次警报之间的最短间隔（秒）')
+        sub.add_argument('--zscore-threshold', type=float, help='同时以OI和资金费率的z-score超过该值作为额外触发条件')
+    args = parser.parse_args()
+
+    if args.command == 'local':
+        proxies = [item.strip() for item in args.proxies.split(',') if item.strip()] if args.proxies else None
+        run_local(args.shards, args.db, args.fake_exchange, args.symbols, args.latency, args.interval,
+                  args.poll_interval, proxies, args.alert_cooldown, args.zscore_threshold, args.duration)
+    elif args.command == 'collector':
+        run_collector(args.db, args.shard_id, args.shards, args.interval, args.proxy,
+                      egress_shards=args.egress_shards)
+    else:
+        run_aggregator(args.db, args.poll_interval, args.alert_cooldown, args.zscore_threshold)
+
+
+if __name__ == "__main__":
+    main()
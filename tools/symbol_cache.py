@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+交易对列表磁盘缓存
+exchangeInfo体积较大且很少变化，这里只保留筛选所需的字段，按TTL过期后再重新下载
+"""
+
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存6小时
+DEFAULT_SYMBOL_CACHE_TTL = 6 * 3600
+
+# 缓存中保留的交易对字段
+CACHED_FIELDS = ('symbol', 'quoteAsset', 'contractType', 'status', 'onboardDate', 'deliveryDate')
+
+
+class SymbolUniverseCache:
+    """exchangeInfo交易对元数据的磁盘缓存"""
+
+    def __init__(self, path, ttl=DEFAULT_SYMBOL_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = 0.0
+        self.symbols = []
+        self.rate_limits = []
+        self.load()
+
+    def load(self):
+        """从磁盘读取缓存，文件不存在或损坏时视为空缓存"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            self.fetched_at = float(cached.get('fetched_at', 0))
+            self.symbols = cached.get('symbols', [])
+            self.rate_limits = cached.get('rate_limits', [])
+        except Exception as e:
+            logger.warning(f"读取交易对缓存失败，将重新下载: {str(e)}")
+            self.fetched_at = 0.0
+
+    def is_fresh(self):
+        return bool(self.symbols) and time.time() - self.fetched_at < self.ttl
+
+    def invalidate(self):
+        """使缓存失效，下次获取交易对时强制重新下载"""
+        self.fetched_at = 0.0
+
+    def update(self, exchange_info):
+        """用新下载的exchangeInfo更新缓存并写入磁盘
+
+        响应中没有非空的symbols列表时（错误响应、维护期间的空列表）不覆盖缓存，
+        继续使用旧的交易对列表，返回False
+        """
+        symbols = exchange_info.get('symbols') if isinstance(exchange_info, dict) else None
+        if not isinstance(symbols, list) or not symbols:
+            logger.warning(f"exchangeInfo响应中没有交易对列表，继续使用缓存: {str(exchange_info)[:200]}")
+            return False
+
+        self.symbols = [{field: item.get(field) for field in CACHED_FIELDS}
+                        for item in symbols if isinstance(item, dict)]
+        self.rate_limits = exchange_info.get('rateLimits', [])
+        self.fetched_at = time.time()
+
+        # 先写临时文件再替换，避免中途崩溃留下损坏的缓存
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'fetched_at': self.fetched_at,
+                    'symbols': self.symbols,
+                    'rate_limits': self.rate_limits
+                }, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"保存交易对缓存失败: {str(e)}")
+        return True
+
+    def usdt_perpetual_symbols(self, now_ms=None):
+        """筛选正在交易的USDT永续合约
+
+        状态不是TRADING、尚未上线或已到交割/下架时间的合约都会被剔除
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        symbols = []
+        for item in self.symbols:
+            if item.get('quoteAsset') != 'USDT' or item.get('contractType') != 'PERPETUAL':
+                continue
+            if item.get('status') != 'TRADING':
+                continue
+            if (item.get('onboardDate') or 0) > now_ms:
+                continue
+            delivery_date = item.get('deliveryDate')
+            if delivery_date and delivery_date <= now_ms:
+                continue
+            symbols.append(item['symbol'])
+        return symbols